@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .versioning import ConditionalGetMixin, DataVersion, EarlyResponse
+
+MISSING = object()
+
+class LocalLRUCache:
+    """Bounded, thread-safe in-process cache with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class TieredCache:
+    """An in-process LRU in front of the shared cache (Redis, or locmem when
+    no Redis is configured).
+
+    Keys are namespaced per user and carry the user's DataVersion counters
+    for the domains a value is derived from, so a write invalidates entries
+    in every process without deleting anything: the next read builds a
+    different key. Only the version lookup reaches the shared cache when
+    the value is held locally."""
+
+    def __init__(self, max_entries=None):
+        self.local = LocalLRUCache(max_entries or settings.TIERED_CACHE_LOCAL_ENTRIES)
+
+    @staticmethod
+    def user_key(user_id, name, domains, *parts):
+        versions = DataVersion.get_many(user_id, domains)
+        digest = hashlib.sha1(
+            ':'.join(map(str, (timezone.now().date(), *versions, *parts))).encode()
+        ).hexdigest()
+        return f'tiered:{user_id}:{name}:{digest}'
+
+    def get(self, key, default=None):
+        value = self.local.get(key, MISSING)
+        if value is MISSING:
+            value = cache.get(key, MISSING)
+            if value is MISSING:
+                return default
+            self.local.set(key, value, settings.TIERED_CACHE_TIMEOUT)
+        return value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout or settings.TIERED_CACHE_TIMEOUT
+        cache.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    def get_or_set(self, key, compute, timeout=None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = compute()
+            self.set(key, value, timeout)
+        return value
+
+tiered_cache = TieredCache()
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """Serves GET responses of a view from `tiered_cache`.
+
+    Entries are keyed on the view's ETag, which already covers the user,
+    the full path, the date and the versions of `version_domains`, so any
+    write to those domains moves the view to a new entry. Only 200
+    responses are stored."""
+
+    cache_timeout = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.cache_key = None
+        if self.etag is not None:
+            key = f'response:{request.user.id}:{self.etag}'
+            data = tiered_cache.get(key, MISSING)
+            if data is not MISSING:
+                raise EarlyResponse(Response(data))
+            self.cache_key = key
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'cache_key', None)
+        if key is not None and response.status_code == status.HTTP_200_OK:
+            tiered_cache.set(key, response.data, self.cache_timeout)
+        return response
@@ -0,0 +1,90 @@
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+def _param_set(request, name):
+    if request is None or request.method != 'GET' or name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+def requested_fields(request):
+    """Field names listed in `?fields=`, or None when every field is wanted"""
+    return _param_set(request, FIELDS_PARAM)
+
+def field_wanted(request, name):
+    fields = requested_fields(request)
+    return fields is None or name in fields
+
+def expanded(request, name):
+    """Whether `name` is listed in `?expand=` and not trimmed by `?fields=`"""
+    return name in (_param_set(request, EXPAND_PARAM) or ()) and field_wanted(request, name)
+
+class SparseFieldsetSerializerMixin:
+    """Trims a serializer's output to `?fields=` and swaps in the nested
+    representations named in `?expand=`, for GET requests.
+
+    `expandable_fields` maps a field name to a (serializer class, kwargs)
+    pair. Only the top-level serializer of a response is affected, so
+    nested serializers keep their full shape."""
+
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self._is_response_root():
+            return fields
+
+        for name, (serializer_class, kwargs) in self.expandable_fields.items():
+            if expanded(request, name):
+                fields[name] = serializer_class(**kwargs)
+        wanted = requested_fields(request)
+        if wanted is not None:
+            for name in list(fields):
+                if name not in wanted:
+                    del fields[name]
+        return fields
+
+    def _is_response_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+class SparseFieldsetViewMixin:
+    """Only joins and prefetches the relations read by the requested fields.
+
+    `select_related_fields` maps a serializer field to the relations it
+    reads, `expand_select_related` and `expand_prefetch_related` map an
+    expansion to the relations it needs, and `always_select_related` lists
+    relations needed whatever the fieldset, e.g. for pagination cursors."""
+
+    always_select_related = ()
+    select_related_fields = {}
+    expand_select_related = {}
+    expand_prefetch_related = {}
+
+    def field_wanted(self, name):
+        return field_wanted(self.request, name)
+
+    def expanded(self, name):
+        return expanded(self.request, name)
+
+    def apply_fieldsets(self, queryset):
+        select = list(self.always_select_related)
+        prefetch = []
+        for name, relations in self.select_related_fields.items():
+            if self.field_wanted(name):
+                select.extend(relations)
+        for name, relations in self.expand_select_related.items():
+            if self.expanded(name):
+                select.extend(relations)
+        for name, relations in self.expand_prefetch_related.items():
+            if self.expanded(name):
+                prefetch.extend(relations)
+        if select:
+            queryset = queryset.select_related(*dict.fromkeys(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*dict.fromkeys(prefetch))
+        return queryset
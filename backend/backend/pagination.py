@@ -0,0 +1,115 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+class KeysetPagination(BasePagination):
+    """Opt-in keyset pagination over the queryset's own ordering.
+
+    Requests carrying a `cursor` query param (empty for the first page) get
+    the rows after the cursor's position, so deep pages cost the same as the
+    first one: no COUNT and no OFFSET. Other requests are handled by
+    `fallback_class`, or left unpaginated when it is None.
+
+    The queryset must be ordered by plain fields ending with a unique one,
+    e.g. order_by('-created_at', '-id')."""
+
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    fallback_class = PageNumberPagination
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        if self.cursor_query_param not in request.query_params:
+            if self.fallback_class is None:
+                return None
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(queryset.model, cursor)))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last)
+        )
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = queryset.query.order_by
+        if not ordering or not all(isinstance(field, str) for field in ordering):
+            raise ImproperlyConfigured('KeysetPagination requires a queryset ordered by plain fields.')
+        return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def after(self, values):
+        """Rows strictly after `values` in the ordering, compared field by field"""
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, obj):
+        values = []
+        for field, _ in self.ordering:
+            value = obj
+            for attribute in field.split('__'):
+                value = getattr(value, attribute)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.resolve_field(model, field).to_python(value)
+                for (field, _), value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def resolve_field(model, path):
+        try:
+            *relations, name = path.split('__')
+            for relation in relations:
+                model = model._meta.get_field(relation).related_model
+            return model._meta.get_field(name)
+        except (AttributeError, FieldDoesNotExist):
+            raise ValueError(path)
+
+class OptionalKeysetPagination(KeysetPagination):
+    """Keyset pagination when a cursor is requested, the full list otherwise"""
+    fallback_class = None
@@ -21,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third party apps
     'rest_framework',
     'corsheaders',
@@ -175,6 +176,41 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Cache: Redis when configured, otherwise a per-process locmem cache (tests,
+# local development). Data versions and cached responses must be shared by
+# every worker, so multi-process deployments need Redis.
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URL', os.getenv('REDIS_URL'))
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+            'KEY_PREFIX': 'goalsapp',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+TIERED_CACHE_LOCAL_ENTRIES = int(os.getenv('TIERED_CACHE_LOCAL_ENTRIES', 1000))  # in-process LRU size
+TIERED_CACHE_TIMEOUT = 10 * 60  # seconds
+GAMIFICATION_STATS_TIMEOUT = 7 * 24 * 60 * 60  # precomputed dashboard payloads, seconds
+
+# Where leaderboards are ranked: a Redis sorted set when Redis is
+# configured, otherwise indexed queries on the ranked rows. The 'database'
+# fallback is not logarithmic: the board size counts every ranked row and a
+# rank counts every row scored above it, so each request is O(n) in the board.
+# Configure Redis once boards outgrow that. 'memory' keeps an in-process
+# skiplist, for single-process development only
+LEADERBOARD_REDIS_URL = os.getenv('LEADERBOARD_REDIS_URL', os.getenv('REDIS_URL'))
+LEADERBOARD_STORE = os.getenv('LEADERBOARD_STORE', 'redis' if LEADERBOARD_REDIS_URL else 'database')
+
+# Goal chain health
+GOAL_HEALTH_STALE_DAYS = int(os.getenv('GOAL_HEALTH_STALE_DAYS', 7))  # DPs without a completed day in this window are stale
+GOAL_HEALTH_CACHE_TIMEOUT = 60 * 60  # seconds
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL')
@@ -182,3 +218,54 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+from celery.schedules import crontab
+CELERY_BEAT_SCHEDULE = {
+    # Pre-create tomorrow's progress rows so the by-date views only read
+    'materialize-daily-progress': {
+        'task': 'goals.tasks.materialize_daily_progress',
+        'schedule': crontab(hour=22, minute=0),
+    },
+    # Fix any drift between UserCounters and the tables they count
+    'reconcile-user-counters': {
+        'task': 'gamification.tasks.reconcile_user_counters',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    # Freeze the weekly and monthly leaderboards of periods that just closed
+    'snapshot-leaderboards': {
+        'task': 'gamification.tasks.snapshot_leaderboards',
+        'schedule': crontab(hour=0, minute=15),
+    },
+    # Pick up gamification events whose on-commit task never ran
+    'drain-gamification-outbox': {
+        'task': 'gamification.tasks.drain_gamification_outbox',
+        'schedule': crontab(minute='*/5'),
+    },
+    # Drop processed gamification events older than the retention window
+    'prune-gamification-outbox': {
+        'task': 'gamification.tasks.prune_gamification_outbox',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
+
+# Serve by-date progress entries that don't exist yet as virtual entries
+# (deterministic ids, nothing written) and persist them on first update;
+# materialize-daily-progress then does nothing
+VIRTUAL_DAILY_PROGRESS = os.getenv('VIRTUAL_DAILY_PROGRESS', 'False') == 'True'
+
+# Users per materialize_daily_progress_batch task
+DAILY_PROGRESS_MATERIALIZE_BATCH_SIZE = 500
+
+# Goal deletes that would remove at least this many progress rows, and all
+# account deletions, are marked pending and carried out by a Celery task
+ASYNC_DELETE_THRESHOLD = 2000
+
+# Rows per DELETE statement (and transaction) in background deletions
+DELETE_CHUNK_SIZE = 5000
+
+# GamificationEvents applied per transaction by process_gamification_events
+GAMIFICATION_OUTBOX_BATCH_SIZE = 200
+
+# Days processed GamificationEvents are kept to deduplicate completions;
+# completions dated further back are not awarded
+GAMIFICATION_OUTBOX_RETENTION_DAYS = 90
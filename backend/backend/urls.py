@@ -4,6 +4,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from goals.views import BulkProgressUpdateView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -17,4 +18,5 @@ urlpatterns = [
     path('api/goals/', include('goals.urls')),
     path('api/standards/', include('standards.urls')),
     path('api/gamification/', include('gamification.urls')),
+    path('api/progress/bulk/', BulkProgressUpdateView.as_view(), name='progress-bulk'),
 ]
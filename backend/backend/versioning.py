@@ -0,0 +1,123 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+class DataVersion:
+    """Per-user, per-domain counters bumped after every committed write, so
+    a response can be validated with one cache lookup instead of its queries.
+
+    Counters start from the clock rather than 0: a counter evicted from the
+    cache comes back with a value no client has seen. They live in the
+    default cache, which must be shared by every web and Celery process
+    (see check_shared_cache)."""
+
+    DOMAINS = ('goals', 'standards', 'progress', 'gamification')
+    KEY = 'data_version:{user_id}:{domain}'
+
+    @classmethod
+    def key(cls, user_id, domain):
+        assert domain in cls.DOMAINS, f'Unknown data domain: {domain}'
+        return cls.KEY.format(user_id=user_id, domain=domain)
+
+    @classmethod
+    def get_many(cls, user_id, domains):
+        keys = [cls.key(user_id, domain) for domain in domains]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                cache.add(key, time.time_ns(), None)
+                versions[key] = cache.get(key)
+        return [versions[key] for key in keys]
+
+    @classmethod
+    def bump(cls, user_id, *domains):
+        """Advance the user's counters once the current transaction commits"""
+        keys = {cls.key(user_id, domain) for domain in domains}
+        transaction.on_commit(lambda: cls._incr(keys))
+
+    @classmethod
+    def bump_all(cls, user_id):
+        cls.bump(user_id, *cls.DOMAINS)
+
+    @staticmethod
+    def _incr(keys):
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Not cached: the next read starts a fresh counter
+                pass
+
+# Caches that live inside one process: counters bumped by one worker (or a
+# Celery task) would never reach the others, which then answer 304 for data
+# that has changed
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """DataVersion needs a default cache shared by every process"""
+    if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+        return [checks.Warning(
+            'The default cache is local to each process, so data versions and '
+            'ETags differ between workers and can validate stale responses.',
+            hint='Set REDIS_CACHE_URL (or REDIS_URL) to use a shared Redis cache.',
+            id='backend.W001',
+        )]
+    return []
+
+class EarlyResponse(Exception):
+    """Raised from initial() to answer a request without running its handler"""
+
+    def __init__(self, response):
+        self.response = response
+
+class ConditionalGetMixin:
+    """Strong ETags for GET responses, derived from the user's versions of
+    `version_domains`. A matching If-None-Match is answered with 304 right
+    after authentication, before the handler runs any query.
+
+    The ETag also covers the full path and today's date, so query params
+    and date-relative data (streaks, default windows) are part of it."""
+
+    version_domains = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method in ('GET', 'HEAD'):
+            self.etag = self.get_etag(request)
+            matches = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if self.etag in matches or '*' in matches:
+                raise EarlyResponse(Response(status=status.HTTP_304_NOT_MODIFIED))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, EarlyResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def get_etag(self, request):
+        versions = DataVersion.get_many(request.user.id, self.version_domains)
+        source = ':'.join(map(str, (
+            request.user.id, request.get_full_path(), timezone.now().date(),
+            request.accepted_media_type, *versions
+        )))
+        return '"%s"' % hashlib.sha1(source.encode()).hexdigest()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, 'etag', None)
+        if etag is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Achievement, UserAchievement, PointTransaction
+from .models import UserProfile, Achievement, UserAchievement, PointTransaction, GamificationEvent
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -28,3 +28,11 @@ class PointTransactionAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'description')
     readonly_fields = ('points', 'streak_multiplier', 'created_at')
     raw_id_fields = ('user',)
+
+@admin.register(GamificationEvent)
+class GamificationEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'transaction_type', 'points', 'date', 'created_at', 'processed_at')
+    list_filter = ('transaction_type', 'processed_at')
+    search_fields = ('user__username', 'description')
+    readonly_fields = ('points', 'created_at', 'processed_at')
+    raw_id_fields = ('user',)
@@ -0,0 +1,482 @@
+import random
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from .models import LeaderboardSnapshot, PointBucket, UserProfile
+
+class SkipList:
+    """Indexed skiplist of unique, comparable keys in ascending order.
+
+    Every forward link also stores its span (how many nodes it skips), as
+    in Redis' own sorted sets, so inserts, deletes, rank counts and access
+    by position are all O(log n)."""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    class Node:
+        __slots__ = ('key', 'forward', 'span')
+
+        def __init__(self, key, level):
+            self.key = key
+            self.forward = [None] * level
+            self.span = [0] * level
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.head = self.Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                self.head.span[i] = self.size
+            self.level = level
+
+        new = self.Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        node = node.forward[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(self.level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return True
+
+    def count_while(self, predicate):
+        """Length of the leading run of keys matching a monotone predicate"""
+        count = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and predicate(node.forward[i].key):
+                count += node.span[i]
+                node = node.forward[i]
+        return count
+
+    def slice(self, start, stop):
+        """Keys at positions start..stop-1"""
+        start, stop = max(start, 0), min(stop, self.size)
+        if start >= stop:
+            return []
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= start + 1:
+                traversed += node.span[i]
+                node = node.forward[i]
+        keys = []
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+class SkipListSortedSet:
+    """In-process stand-in for a Redis sorted set (LEADERBOARD_STORE =
+    'memory'), for single-process development. Only the commands the
+    leaderboard needs are provided, with Redis' ordering of equal scores."""
+
+    def __init__(self):
+        self._scores = {}
+        self._list = SkipList()
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return bool(self._scores)
+
+    def size(self):
+        return len(self._scores)
+
+    def score(self, member):
+        return self._scores.get(member)
+
+    def set(self, member, score):
+        with self._lock:
+            self._set(member, score)
+
+    def _set(self, member, score):
+        old = self._scores.get(member)
+        if old is not None:
+            self._list.remove((old, member))
+        self._scores[member] = score
+        self._list.insert((score, member))
+
+    def incr_existing(self, member, delta):
+        with self._lock:
+            old = self._scores.get(member)
+            if old is None:
+                return None
+            self._set(member, old + delta)
+            return old + delta
+
+    def add_missing(self, member, score):
+        with self._lock:
+            if member not in self._scores:
+                self._set(member, score)
+
+    def remove(self, member):
+        with self._lock:
+            score = self._scores.pop(member, None)
+            if score is not None:
+                self._list.remove((score, member))
+
+    def count_above(self, score):
+        return self.size() - self._list.count_while(lambda key: key[0] <= score)
+
+    def rev_index(self, member):
+        score = self._scores.get(member)
+        if score is None:
+            return None
+        return self.size() - 1 - self._list.count_while(lambda key: key < (score, member))
+
+    def rev_range(self, start, count):
+        size = self.size()
+        keys = self._list.slice(size - start - count, size - start)
+        return [(member, score) for score, member in reversed(keys)]
+
+    def replace(self, pairs):
+        with self._lock:
+            self._scores.clear()
+            self._list.clear()
+            for member, score in pairs:
+                self._set(member, score)
+
+class RedisSortedSet:
+    """The same commands against a Redis sorted set"""
+
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+
+    def exists(self):
+        return bool(self.client.exists(self.key))
+
+    def size(self):
+        return self.client.zcard(self.key)
+
+    def score(self, member):
+        return self.client.zscore(self.key, member)
+
+    def set(self, member, score):
+        self.client.zadd(self.key, {member: score})
+
+    def incr_existing(self, member, delta):
+        return self.client.zadd(self.key, {member: delta}, xx=True, incr=True)
+
+    def add_missing(self, member, score):
+        self.client.zadd(self.key, {member: score}, nx=True)
+
+    def remove(self, member):
+        self.client.zrem(self.key, member)
+
+    def count_above(self, score):
+        return self.client.zcount(self.key, f'({score}', '+inf')
+
+    def rev_index(self, member):
+        return self.client.zrevrank(self.key, member)
+
+    def rev_range(self, start, count):
+        if count <= 0:
+            return []
+        return [
+            (member.decode(), score)
+            for member, score in self.client.zrevrange(self.key, start, start + count - 1, withscores=True)
+        ]
+
+    def replace(self, pairs, chunk_size=5000):
+        # Built under a scratch key and renamed over the live one, so
+        # readers never see a partial leaderboard; each rebuild gets its own
+        # scratch key so concurrent ones can't interleave
+        scratch = f'{self.key}:rebuild:{uuid.uuid4().hex}'
+        self.client.delete(scratch)
+        chunk = {}
+        for member, score in pairs:
+            chunk[member] = score
+            if len(chunk) == chunk_size:
+                self.client.zadd(scratch, chunk)
+                chunk = {}
+        if chunk:
+            self.client.zadd(scratch, chunk)
+        if self.client.exists(scratch):
+            self.client.rename(scratch, self.key)
+        else:
+            self.client.delete(self.key)
+
+class DatabaseSortedSet:
+    """The same commands answered from the ranked rows themselves with
+    indexed queries (LEADERBOARD_STORE = 'database'). The rows are the only
+    copy, so writes and rebuilds have nothing to do. Ranks and sizes are
+    COUNTs, linear in the rows counted, unlike the logarithmic stores."""
+
+    def __init__(self, rows, score_field):
+        self.rows = rows
+        self.score_field = score_field
+
+    def exists(self):
+        return True
+
+    def size(self):
+        return self.rows().count()
+
+    def score(self, member):
+        return self.rows().filter(user_id=member).values_list(self.score_field, flat=True).first()
+
+    def set(self, member, score):
+        pass
+
+    def incr_existing(self, member, delta):
+        return None
+
+    def add_missing(self, member, score):
+        pass
+
+    def remove(self, member):
+        pass
+
+    def count_above(self, score):
+        return self.rows().filter(**{f'{self.score_field}__gt': score}).count()
+
+    def rev_index(self, member):
+        score = self.score(member)
+        if score is None:
+            return None
+        # Equal scores in descending member order, as ZREVRANK
+        return self.count_above(score) + self.rows().filter(
+            **{self.score_field: score}, user_id__gt=member
+        ).count()
+
+    def rev_range(self, start, count):
+        if count <= 0:
+            return []
+        return [
+            (str(user_id), score)
+            for user_id, score in self.rows().order_by(f'-{self.score_field}', '-user_id').values_list(
+                'user_id', self.score_field
+            )[start:start + count]
+        ]
+
+    def replace(self, pairs):
+        pass
+
+_redis = None
+_local_stores = {}
+_local_lock = threading.Lock()
+
+def sorted_set(key, rows, score_field):
+    """The sorted set of `rows` ranked by `score_field`, held where
+    LEADERBOARD_STORE says: Redis under `key`, the database rows
+    themselves, or a skiplist in this process"""
+    global _redis
+    if settings.LEADERBOARD_STORE == 'redis':
+        if _redis is None:
+            import redis
+            _redis = redis.Redis.from_url(settings.LEADERBOARD_REDIS_URL)
+        return RedisSortedSet(_redis, key)
+    if settings.LEADERBOARD_STORE == 'database':
+        return DatabaseSortedSet(rows, score_field)
+    with _local_lock:
+        return _local_stores.setdefault(key, SkipListSortedSet())
+
+class Leaderboard:
+    """Users ranked by points, kept in a sorted set next to the rows it is
+    built from: the award path moves a user's score after each commit, and
+    `rows` (a callable returning the ranked queryset, scored by
+    `score_field`) repopulates it on demand.
+
+    Ranks follow the old COUNT query: users with equal points share a rank,
+    one more than the number of users with more points."""
+
+    def __init__(self, key, rows, score_field):
+        self.key = key
+        self.rows = rows
+        self.score_field = score_field
+
+    @property
+    def store(self):
+        return sorted_set(self.key, self.rows, self.score_field)
+
+    def _loaded_store(self):
+        # An empty (or flushed) sorted set is filled from its source first
+        if not self.store.exists():
+            self.rebuild()
+        return self.store
+
+    # Writes skip a missing set, which the next read rebuilds in full
+
+    def record(self, user_id, delta, total=None):
+        """Move a user's score by `delta` after an award; `total` is their
+        new score, used when the user isn't ranked yet"""
+        if self.store.incr_existing(str(user_id), delta) is None and total is not None and self.store.exists():
+            self.store.add_missing(str(user_id), total)
+
+    def set_points(self, user_id, total):
+        if self.store.exists():
+            self.store.set(str(user_id), total)
+
+    def add(self, user_id, total):
+        if self.store.exists():
+            self.store.add_missing(str(user_id), total)
+
+    def remove(self, user_id):
+        self.store.remove(str(user_id))
+
+    def size(self):
+        return self._loaded_store().size()
+
+    def points(self, user_id):
+        score = self._loaded_store().score(str(user_id))
+        return None if score is None else int(score)
+
+    def rank(self, user_id):
+        store = self._loaded_store()
+        score = store.score(str(user_id))
+        if score is None:
+            return None
+        return store.count_above(score) + 1
+
+    def page(self, offset, limit):
+        """[(user_id, points, rank)] for ranks offset+1..offset+limit"""
+        store = self._loaded_store()
+        return self._ranked(store, offset, store.rev_range(offset, limit))
+
+    def around(self, user_id, distance):
+        """The user's entry with up to `distance` entries either side"""
+        store = self._loaded_store()
+        index = store.rev_index(str(user_id))
+        if index is None:
+            return []
+        start = max(index - distance, 0)
+        return self._ranked(store, start, store.rev_range(start, index + distance + 1 - start))
+
+    def _ranked(self, store, start, members):
+        entries = []
+        rank = previous = None
+        for position, (member, score) in enumerate(members, start=start + 1):
+            if rank is None:
+                rank = store.count_above(score) + 1
+            elif score != previous:
+                rank = position
+            previous = score
+            entries.append((member, int(score), rank))
+        return entries
+
+    def rebuild(self):
+        """Repopulate from the rows and return the number of users ranked"""
+        self.store.replace(
+            (str(user_id), points)
+            for user_id, points in self.rows().order_by().values_list(
+                'user_id', self.score_field
+            ).iterator(chunk_size=5000)
+        )
+        return self.store.size()
+
+    def clear(self):
+        self.store.replace([])
+
+leaderboard = Leaderboard('leaderboard:points', UserProfile.objects.all, 'total_points')
+
+PERIODS = tuple(period for period, _ in PointBucket.PERIODS)
+
+def period_start(period, date):
+    if period == 'week':
+        return date - timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+def period_end(period, start):
+    """First day after the period starting on `start`"""
+    if period == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+def window_leaderboard(period, start):
+    """Live ranking of one week or month, built from its PointBuckets"""
+    def buckets():
+        return PointBucket.objects.filter(period=period, period_start=start)
+
+    return Leaderboard(f'leaderboard:{period}:{start.isoformat()}', buckets, 'points')
+
+class SnapshotLeaderboard:
+    """Final ranking of a closed week or month, read from its
+    LeaderboardSnapshot rows by index; nothing is recomputed"""
+
+    def __init__(self, period, start):
+        self.rows = LeaderboardSnapshot.objects.filter(period=period, period_start=start)
+
+    def size(self):
+        return self.rows.order_by('-position').values_list('position', flat=True).first() or 0
+
+    def exists(self):
+        return self.size() > 0
+
+    def _user_row(self, user_id):
+        return self.rows.filter(user_id=user_id).values('points', 'rank', 'position').first()
+
+    def points(self, user_id):
+        row = self._user_row(user_id)
+        return row and row['points']
+
+    def rank(self, user_id):
+        row = self._user_row(user_id)
+        return row and row['rank']
+
+    def _positions(self, first, last):
+        return [
+            (str(user_id), points, rank)
+            for user_id, points, rank in self.rows.filter(
+                position__gte=first, position__lte=last
+            ).order_by('position').values_list('user_id', 'points', 'rank')
+        ]
+
+    def page(self, offset, limit):
+        return self._positions(offset + 1, offset + limit)
+
+    def around(self, user_id, distance):
+        row = self._user_row(user_id)
+        if row is None:
+            return []
+        return self._positions(row['position'] - distance, row['position'] + distance)
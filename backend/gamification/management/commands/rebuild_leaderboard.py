@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from gamification.leaderboard import PERIODS, leaderboard, period_start, window_leaderboard
+
+class Command(BaseCommand):
+    help = 'Repopulate the all-time and current weekly and monthly leaderboards'
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        counts = [f'{leaderboard.rebuild()} all time']
+        for period in PERIODS:
+            count = window_leaderboard(period, period_start(period, today)).rebuild()
+            counts.append(f'{count} this {period}')
+        self.stdout.write(self.style.SUCCESS(f'Ranked {", ".join(counts)}'))
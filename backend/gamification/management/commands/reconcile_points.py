@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from gamification.models import UserProfile
+from gamification.services import PointLedgerReconciler
+
+class Command(BaseCommand):
+    help = 'Check profile point totals and levels against the transaction ledger and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only check the profile of this username')
+        parser.add_argument('--batch-size', type=int, default=500, help='Profiles checked per query')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.all()
+        if options['user']:
+            profiles = profiles.filter(user__username=options['user'])
+
+        checked, drifted = PointLedgerReconciler(options['batch_size']).reconcile(
+            profiles, dry_run=options['dry_run']
+        )
+
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} profiles. {verb} {drifted} drifted totals'
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gamification", "0002_initial_achievements"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pointtransaction",
+            index=models.Index(
+                fields=["user", "-created_at"], name="point_tx_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pointtransaction",
+            index=models.Index(
+                fields=["user", "transaction_type"], name="point_tx_user_type_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userprofile",
+            index=models.Index(
+                fields=["-total_points"], name="game_profile_points_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gamification", "0003_profile_and_transaction_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="pointtransaction",
+            name="point_tx_user_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="pointtransaction",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="point_tx_user_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q
+
+
+COMPLETION_TYPES = ("standard", "process", "mtg", "big")
+
+
+def populate_user_counters(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    UserCounters = apps.get_model("gamification", "UserCounters")
+    counts = User.objects.annotate(
+        **{
+            f"{type_}_completions": Count(
+                "point_transactions",
+                filter=Q(point_transactions__transaction_type=type_),
+            )
+            for type_ in COMPLETION_TYPES
+        }
+    ).values("id", *(f"{type_}_completions" for type_ in COMPLETION_TYPES))
+    UserCounters.objects.bulk_create(
+        [
+            UserCounters(user_id=row.pop("id"), **row)
+            for row in counts.iterator(chunk_size=2000)
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_user_pending_deletion"),
+        ("gamification", "0004_point_transaction_keyset_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserCounters",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="counters",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("standard_completions", models.IntegerField(default=0)),
+                ("process_completions", models.IntegerField(default=0)),
+                ("mtg_completions", models.IntegerField(default=0)),
+                ("big_completions", models.IntegerField(default=0)),
+            ],
+            options={
+                "db_table": "user_counters",
+            },
+        ),
+        migrations.RunPython(populate_user_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:03
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset):
+    return Coalesce(
+        Subquery(
+            queryset.filter(user_id=OuterRef("user_id"))
+            .values("user_id")
+            .annotate(count=Count("*"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    UserCounters = apps.get_model("gamification", "UserCounters")
+    Goal = apps.get_model("goals", "Goal")
+    DailySummary = apps.get_model("goals", "DailySummary")
+    StandardProgress = apps.get_model("standards", "StandardProgress")
+
+    goals = Goal.objects.filter(pending_deletion=False)
+    values = {}
+    for goal_type in ("BIG", "MTG", "DP"):
+        typed = goals.filter(goal_type=goal_type)
+        values[f"{goal_type.lower()}_goals"] = count_of(typed)
+        values[f"{goal_type.lower()}_goals_completed"] = count_of(
+            typed.filter(is_completed=True)
+        )
+    UserCounters.objects.update(
+        **values,
+        standards_completed=Coalesce(
+            Subquery(
+                StandardProgress.objects.filter(
+                    daily_progress__user_id=OuterRef("user_id"), is_completed=True
+                )
+                .values("daily_progress__user_id")
+                .annotate(count=Count("*"))
+                .values("count"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ),
+        active_days=count_of(
+            DailySummary.objects.annotate(
+                completed=F("processes_completed") + F("standards_completed")
+            ).filter(completed__gt=0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gamification", "0005_user_counters"),
+        ("goals", "0008_goal_pending_deletion"),
+        ("standards", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usercounters",
+            name="active_days",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="big_goals",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="big_goals_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="dp_goals",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="dp_goals_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="mtg_goals",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="mtg_goals_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="usercounters",
+            name="standards_completed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
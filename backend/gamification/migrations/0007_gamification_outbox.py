@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("gamification", "0006_user_counters_goals_and_days"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GamificationEvent",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[
+                            ("standard", "Standard Completion"),
+                            ("process", "Daily Process"),
+                            ("mtg", "Medium Term Goal"),
+                            ("big", "Big Goal"),
+                            ("streak", "Streak Bonus"),
+                            ("achievement", "Achievement"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("points", models.IntegerField()),
+                ("reference_id", models.UUIDField()),
+                ("reference_type", models.CharField(max_length=50)),
+                ("date", models.DateField()),
+                ("description", models.CharField(max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="gamification_events",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "gamification_outbox",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("processed_at__isnull", True)),
+                        fields=["user", "created_at"],
+                        name="game_outbox_pending_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="gamificationevent",
+            constraint=models.UniqueConstraint(
+                fields=("reference_type", "reference_id", "date"),
+                name="gamification_outbox_reference_uniq",
+            ),
+        ),
+    ]
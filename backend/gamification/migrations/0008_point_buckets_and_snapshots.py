@@ -0,0 +1,138 @@
+# Generated by Django 4.2.7 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DateField, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+import django.db.models.deletion
+import uuid
+
+
+def populate_buckets(apps, schema_editor):
+    PointTransaction = apps.get_model("gamification", "PointTransaction")
+    PointBucket = apps.get_model("gamification", "PointBucket")
+
+    for period, trunc in (("week", TruncWeek), ("month", TruncMonth)):
+        rows = (
+            PointTransaction.objects.annotate(
+                period_start=trunc("created_at", output_field=DateField())
+            )
+            .values("user_id", "period_start")
+            .annotate(points=Sum("points"))
+            .order_by()
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=5000):
+            batch.append(PointBucket(period=period, **row))
+            if len(batch) == 5000:
+                PointBucket.objects.bulk_create(batch)
+                batch = []
+        PointBucket.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("gamification", "0007_gamification_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("week", "ISO Week"), ("month", "Month")],
+                        max_length=10,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("points", models.IntegerField()),
+                ("rank", models.IntegerField()),
+                ("position", models.IntegerField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="leaderboard_snapshots",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "leaderboard_snapshots",
+            },
+        ),
+        migrations.CreateModel(
+            name="PointBucket",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("week", "ISO Week"), ("month", "Month")],
+                        max_length=10,
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("points", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="point_buckets",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "point_buckets",
+                "indexes": [
+                    models.Index(
+                        fields=["period", "period_start", "-points"],
+                        name="point_bucket_ranking_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="pointbucket",
+            constraint=models.UniqueConstraint(
+                fields=("user", "period", "period_start"),
+                name="point_bucket_user_period_uniq",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="leaderboardsnapshot",
+            index=models.Index(
+                fields=["period", "period_start", "position"],
+                name="leaderboard_snap_position_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="leaderboardsnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("period", "period_start", "user"),
+                name="leaderboard_snapshot_user_uniq",
+            ),
+        ),
+        migrations.RunPython(populate_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gamification", "0008_point_buckets_and_snapshots"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pointtransaction",
+            name="activity_date",
+            field=models.DateField(null=True),
+        ),
+        # Earlier rows only have their transaction date, which is also how
+        # 0008 bucketed them
+        migrations.RunSQL(
+            "UPDATE point_transactions SET activity_date = created_at::date",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="pointtransaction",
+            name="activity_date",
+            field=models.DateField(),
+        ),
+    ]
@@ -1,5 +1,4 @@
 from django.db import models
-from django.db.models import Sum
 from django.utils import timezone
 from users.models import User
 import uuid
@@ -14,8 +13,8 @@ class UserProfile(models.Model):
     longest_streak = models.IntegerField(default=0)
     last_activity_date = models.DateField(null=True, blank=True)
 
-    def calculate_level(self):
-        """Calculate level based on total points"""
+    @staticmethod
+    def level_for(total_points):
         # Level formula: level = 1 + floor(sqrt(total_points / 100))
         # This means:
         # Level 1: 0-99 points
@@ -23,10 +22,15 @@ class UserProfile(models.Model):
         # Level 3: 400-899 points
         # etc.
         import math
-        self.level = 1 + math.floor(math.sqrt(self.total_points / 100))
-        self.save()
+        return 1 + math.floor(math.sqrt(max(total_points, 0) / 100))
 
-    def update_streak(self, activity_date):
+    def calculate_level(self, save=True):
+        """Calculate level based on total points"""
+        self.level = self.level_for(self.total_points)
+        if save:
+            self.save()
+
+    def update_streak(self, activity_date, save=True):
         """Update streak based on activity date"""
         today = timezone.now().date()
         
@@ -39,7 +43,8 @@ class UserProfile(models.Model):
             self.current_streak = 1
             self.longest_streak = 1
             self.last_activity_date = activity_date
-            self.save()
+            if save:
+                self.save()
             return
         
         # Calculate days between last activity and this one
@@ -50,18 +55,22 @@ class UserProfile(models.Model):
             self.current_streak += 1
             if self.current_streak > self.longest_streak:
                 self.longest_streak = self.current_streak
-        # If activity is on the same day, no change
-        elif days_diff == 0:
-            pass
+        # If activity is on the same day, or an earlier one applied late, no change
+        elif days_diff <= 0:
+            return
         # If there's a gap, reset streak
         else:
             self.current_streak = 1
         
         self.last_activity_date = activity_date
-        self.save()
+        if save:
+            self.save()
 
     class Meta:
         db_table = 'user_game_profiles'
+        indexes = [
+            models.Index(fields=['-total_points'], name='game_profile_points_idx'),
+        ]
 
 class Achievement(models.Model):
     """Unlockable achievements"""
@@ -100,7 +109,9 @@ class UserAchievement(models.Model):
         unique_together = [['user', 'achievement']]
 
 class PointTransaction(models.Model):
-    """Records point transactions"""
+    """Records point transactions. Rows are written by
+    GamificationService.award_batch, which applies the streak multiplier and
+    moves the profile total in the same transaction."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='point_transactions')
     points = models.IntegerField()
@@ -122,21 +133,144 @@ class PointTransaction(models.Model):
     
     streak_multiplier = models.FloatField(default=1.0)
     description = models.CharField(max_length=255)
+    # The day the points count for, which buckets them; earlier than
+    # created_at for backdated and late-drained completions
+    activity_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'point_transactions'
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='point_tx_user_created_idx'),
+            models.Index(fields=['user', 'transaction_type'], name='point_tx_user_type_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
-        # Apply streak multiplier
-        self.points = int(self.points * self.streak_multiplier)
-        
-        # Save the transaction
-        super().save(*args, **kwargs)
-        
-        # Update user's total points
-        profile = self.user.game_profile
-        profile.total_points = PointTransaction.objects.filter(
-            user=self.user
-        ).aggregate(total=Sum('points'))['total'] or 0
-        profile.calculate_level()
+class UserCounters(models.Model):
+    """Per-user running counters, incremented by the write paths in the same
+    transaction as the rows they count, so achievement checks and
+    completion rates read one row instead of counting."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    # Point transactions by completion type
+    standard_completions = models.IntegerField(default=0)
+    process_completions = models.IntegerField(default=0)
+    mtg_completions = models.IntegerField(default=0)
+    big_completions = models.IntegerField(default=0)
+    # Goals by type and state, not counting goals pending deletion
+    big_goals = models.IntegerField(default=0)
+    big_goals_completed = models.IntegerField(default=0)
+    mtg_goals = models.IntegerField(default=0)
+    mtg_goals_completed = models.IntegerField(default=0)
+    dp_goals = models.IntegerField(default=0)
+    dp_goals_completed = models.IntegerField(default=0)
+    # Completed StandardProgress rows
+    standards_completed = models.IntegerField(default=0)
+    # Days with at least one completed process or standard
+    active_days = models.IntegerField(default=0)
+
+    # Transaction types counted as completions
+    COMPLETION_TYPES = ('standard', 'process', 'mtg', 'big')
+    GOAL_TYPES = ('BIG', 'MTG', 'DP')
+
+    class Meta:
+        db_table = 'user_counters'
+
+    @staticmethod
+    def completion_field(transaction_type):
+        return f'{transaction_type}_completions'
+
+    @staticmethod
+    def goal_fields(goal_type):
+        """(total, completed) counter fields for a goal type"""
+        prefix = goal_type.lower()
+        return f'{prefix}_goals', f'{prefix}_goals_completed'
+
+    @property
+    def total_goals(self):
+        return sum(getattr(self, self.goal_fields(type_)[0]) for type_ in self.GOAL_TYPES)
+
+    @property
+    def completed_goals(self):
+        return sum(getattr(self, self.goal_fields(type_)[1]) for type_ in self.GOAL_TYPES)
+
+    @property
+    def total_completions(self):
+        return sum(getattr(self, self.completion_field(type_)) for type_ in self.COMPLETION_TYPES)
+
+class GamificationEvent(models.Model):
+    """Outbox of completions awaiting points, written in the same transaction
+    as the progress update and drained by a Celery worker.
+
+    An event is keyed on what was completed and the day it counts for, so
+    completing the same item twice on a day is recorded once. Processed
+    events are kept to hold that key for GAMIFICATION_OUTBOX_RETENTION_DAYS,
+    and completions dated before that are not awarded."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='gamification_events')
+    transaction_type = models.CharField(max_length=20, choices=PointTransaction.TRANSACTION_TYPES)
+    points = models.IntegerField()  # Before the streak multiplier
+    reference_id = models.UUIDField()
+    reference_type = models.CharField(max_length=50)
+    date = models.DateField()
+    description = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'gamification_outbox'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['reference_type', 'reference_id', 'date'],
+                name='gamification_outbox_reference_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'created_at'],
+                condition=models.Q(processed_at__isnull=True),
+                name='game_outbox_pending_idx'
+            ),
+        ]
+
+class PointBucket(models.Model):
+    """Points earned by a user in one ISO week or calendar month, moved by
+    GamificationService.award_batch with the profile total, so windowed
+    leaderboards never sum the ledger."""
+    PERIODS = [
+        ('week', 'ISO Week'),
+        ('month', 'Month'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='point_buckets')
+    period = models.CharField(max_length=10, choices=PERIODS)
+    period_start = models.DateField()  # Monday of the week, first of the month
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'point_buckets'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='point_bucket_user_period_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-points'], name='point_bucket_ranking_idx'),
+        ]
+
+class LeaderboardSnapshot(models.Model):
+    """Final standings of a closed week or month, written once by the
+    snapshot_leaderboards task and read as-is for historical leaderboards.
+    `rank` is shared by equal points, `position` orders every row."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_snapshots')
+    period = models.CharField(max_length=10, choices=PointBucket.PERIODS)
+    period_start = models.DateField()
+    points = models.IntegerField()
+    rank = models.IntegerField()
+    position = models.IntegerField()
+
+    class Meta:
+        db_table = 'leaderboard_snapshots'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'user'], name='leaderboard_snapshot_user_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', 'position'], name='leaderboard_snap_position_idx'),
+        ]
@@ -1,5 +1,25 @@
+import time
+from datetime import timedelta
+from collections import Counter, defaultdict
+from itertools import groupby
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, F, Q, Sum, Window
+from django.db.models.functions import Rank, RowNumber, TruncMonth, TruncWeek
 from django.utils import timezone
-from .models import UserProfile, Achievement, UserAchievement, PointTransaction
+from backend.versioning import DataVersion
+from goals.models import DailySummary, Goal
+from standards.models import StandardProgress
+from users.models import User
+from .leaderboard import (
+    PERIODS, SnapshotLeaderboard, leaderboard, period_end, period_start, window_leaderboard
+)
+from .models import (
+    UserProfile, Achievement, UserAchievement, PointTransaction, UserCounters, GamificationEvent,
+    PointBucket, LeaderboardSnapshot
+)
+from .serializers import GamificationStatsSerializer
 
 class PointCalculator:
     """Base point values and multipliers"""
@@ -38,109 +58,662 @@ class GamificationService:
 
     def award_points(self, points, transaction_type, reference_id=None, reference_type=None, description=None):
         """Award points and create transaction record"""
-        multiplier = self.get_streak_multiplier()
-        
-        transaction = PointTransaction.objects.create(
-            user=self.user,
-            points=points,
-            transaction_type=transaction_type,
-            reference_id=reference_id,
-            reference_type=reference_type,
-            streak_multiplier=multiplier,
-            description=description or f'Completed {transaction_type}'
-        )
-        
-        # Update streak
-        self.profile.update_streak(timezone.now().date())
-        
-        # Check for achievements
-        self.check_achievements()
-        
-        return transaction
+        return self.award_batch([{
+            'points': points,
+            'transaction_type': transaction_type,
+            'reference_id': reference_id,
+            'reference_type': reference_type,
+            'description': description,
+        }])[0]
+
+    def award_batch(self, awards, check_achievements=True, activity_date=None):
+        """Award one or more completions.
+
+        `awards` is a list of dicts with award_points() keyword arguments.
+        The profile row is locked, the transactions are inserted in one
+        query and points, level and streak are written with a single UPDATE
+        before one achievement check; the ledger is never re-summed.
+        `activity_date` (default: today) is the day counted for the streak
+        and the weekly and monthly buckets."""
+        if not awards:
+            return []
+        activity_date = activity_date or timezone.now().date()
+
+        with transaction.atomic():
+            self.profile = UserProfile.objects.select_for_update().get(pk=self.profile.pk)
+            multiplier = self.get_streak_multiplier()
+
+            transactions = PointTransaction.objects.bulk_create([
+                PointTransaction(
+                    user=self.user,
+                    points=int(award['points'] * multiplier),
+                    transaction_type=award['transaction_type'],
+                    reference_id=award.get('reference_id'),
+                    reference_type=award.get('reference_type'),
+                    streak_multiplier=multiplier,
+                    description=award.get('description') or f"Completed {award['transaction_type']}",
+                    activity_date=activity_date
+                )
+                for award in awards
+            ])
+
+            delta = sum(transaction.points for transaction in transactions)
+            self.profile.total_points += delta
+            self.profile.update_streak(activity_date, save=False)
+            self.profile.calculate_level(save=False)
+            UserProfile.objects.filter(pk=self.profile.pk).update(
+                total_points=F('total_points') + delta,
+                level=self.profile.level,
+                current_streak=self.profile.current_streak,
+                longest_streak=self.profile.longest_streak,
+                last_activity_date=self.profile.last_activity_date
+            )
+            completions = Counter(
+                transaction.transaction_type for transaction in transactions
+                if transaction.transaction_type in UserCounters.COMPLETION_TYPES
+            )
+            UserCounterService.increment(self.user.id, **{
+                UserCounters.completion_field(type_): count for type_, count in completions.items()
+            })
+            DataVersion.bump(self.user.id, 'gamification')
+            total = self.profile.total_points
+            transaction.on_commit(lambda: leaderboard.record(self.user.id, delta, total))
+            if delta:
+                PointBucketService.add(self.user.id, delta, activity_date)
+
+        if check_achievements:
+            self.check_achievements()
+
+        return transactions
+
+    @staticmethod
+    def standard_award(standard):
+        return {
+            'points': PointCalculator.STANDARD_POINTS,
+            'transaction_type': 'standard',
+            'reference_id': standard.id,
+            'reference_type': 'standard',
+            'description': f'Completed standard: {standard.title}',
+        }
+
+    @staticmethod
+    def process_award(process):
+        return {
+            'points': PointCalculator.PROCESS_POINTS,
+            'transaction_type': 'process',
+            'reference_id': process.id,
+            'reference_type': 'process',
+            'description': f'Completed process: {process.title}',
+        }
+
+    @staticmethod
+    def mtg_award(mtg):
+        return {
+            'points': PointCalculator.MTG_POINTS,
+            'transaction_type': 'mtg',
+            'reference_id': mtg.id,
+            'reference_type': 'mtg',
+            'description': f'Completed MTG: {mtg.title}',
+        }
+
+    @staticmethod
+    def big_award(big):
+        return {
+            'points': PointCalculator.BIG_POINTS,
+            'transaction_type': 'big',
+            'reference_id': big.id,
+            'reference_type': 'big',
+            'description': f'Completed BIG goal: {big.title}',
+        }
+
+    @staticmethod
+    def achievement_award(achievement):
+        return {
+            'points': achievement.points,
+            'transaction_type': 'achievement',
+            'reference_id': achievement.id,
+            'reference_type': 'achievement',
+            'description': f'Unlocked achievement: {achievement.name}',
+        }
 
     def complete_standard(self, standard):
         """Award points for completing a standard"""
-        return self.award_points(
-            PointCalculator.STANDARD_POINTS,
-            'standard',
-            reference_id=standard.id,
-            reference_type='standard',
-            description=f'Completed standard: {standard.title}'
-        )
+        return self.award_points(**self.standard_award(standard))
 
     def complete_process(self, process_progress):
         """Award points for completing a daily process"""
-        return self.award_points(
-            PointCalculator.PROCESS_POINTS,
-            'process',
-            reference_id=process_progress.process.id,
-            reference_type='process',
-            description=f'Completed process: {process_progress.process.title}'
-        )
+        return self.award_points(**self.process_award(process_progress.process))
 
     def complete_mtg(self, mtg):
         """Award points for completing a medium-term goal"""
-        return self.award_points(
-            PointCalculator.MTG_POINTS,
-            'mtg',
-            reference_id=mtg.id,
-            reference_type='mtg',
-            description=f'Completed MTG: {mtg.title}'
-        )
+        return self.award_points(**self.mtg_award(mtg))
 
     def complete_big(self, big):
         """Award points for completing a big goal"""
-        return self.award_points(
-            PointCalculator.BIG_POINTS,
-            'big',
-            reference_id=big.id,
-            reference_type='big',
-            description=f'Completed BIG goal: {big.title}'
-        )
+        return self.award_points(**self.big_award(big))
 
     def check_achievements(self):
         """Check and award any newly unlocked achievements"""
-        # Get all unearned achievements
-        earned_ids = UserAchievement.objects.filter(
+        counters = UserCounterService.get(self.user.id)
+        earned = set(UserAchievement.objects.filter(
             user=self.user
-        ).values_list('achievement_id', flat=True)
-        
-        potential_achievements = Achievement.objects.exclude(
-            id__in=earned_ids
+        ).values_list('achievement_id', flat=True))
+
+        unlocked = AchievementRules.unlocked(self.profile, counters, earned)
+        while unlocked:
+            # A concurrent check may have unlocked some of them already
+            awards = [
+                self.achievement_award(achievement) for achievement in unlocked
+                if UserAchievement.objects.get_or_create(user=self.user, achievement=achievement)[1]
+            ]
+            earned.update(achievement.id for achievement in unlocked)
+            self.award_batch(awards, check_achievements=False)
+            # Achievement points can raise the level
+            unlocked = AchievementRules.unlocked(self.profile, counters, earned)
+
+        # Every award ends with this check, so the dashboard payload is
+        # rebuilt once per award rather than once per batch
+        transaction.on_commit(lambda: GamificationStatsService.refresh(self.user))
+
+class GamificationStatsService:
+    """The dashboard payload of GamificationStatsView, precomputed after
+    every award and stored in the shared cache with the user's
+    gamification DataVersion. A payload older than the current version
+    (writes outside the award path, evictions) is rebuilt on read."""
+
+    KEY = 'gamification_stats:{user_id}'
+
+    @classmethod
+    def key(cls, user_id):
+        return cls.KEY.format(user_id=user_id)
+
+    @classmethod
+    def compute(cls, user):
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+
+        # Calculate points needed for next level
+        current_level = profile.level
+        points_for_next_level = ((current_level) ** 2) * 100
+        progress = (profile.total_points - ((current_level - 1) ** 2) * 100) / (points_for_next_level - ((current_level - 1) ** 2) * 100) * 100
+
+        return GamificationStatsSerializer({
+            'profile': profile,
+            'recent_achievements': UserAchievement.objects.filter(
+                user=user
+            ).select_related('achievement').order_by('-unlocked_at')[:5],
+            'recent_transactions': PointTransaction.objects.filter(
+                user=user
+            ).order_by('-created_at', '-id')[:10],
+            'next_level_points': points_for_next_level,
+            'progress_to_next_level': progress
+        }).data
+
+    @classmethod
+    def refresh(cls, user, version=None):
+        # The version is read before the queries, so a write committed
+        # meanwhile leaves the stored payload stale rather than mislabelled
+        if version is None:
+            version = DataVersion.get_many(user.id, ('gamification',))[0]
+        payload = cls.compute(user)
+        cache.set(cls.key(user.id), {'version': version, 'payload': payload}, settings.GAMIFICATION_STATS_TIMEOUT)
+        return payload
+
+    @classmethod
+    def get(cls, user):
+        version = DataVersion.get_many(user.id, ('gamification',))[0]
+        stored = cache.get(cls.key(user.id))
+        if stored is not None and stored['version'] == version:
+            return stored['payload']
+        return cls.refresh(user, version)
+
+class GamificationOutbox:
+    """Defers awards out of the request: views record completions as
+    GamificationEvent rows in their own transaction, and a Celery task
+    applies them per user, in batches, through GamificationService."""
+
+    @staticmethod
+    def retention_start(today=None):
+        """Oldest event date still kept; earlier keys may have been pruned"""
+        today = today or timezone.now().date()
+        return today - timedelta(days=settings.GAMIFICATION_OUTBOX_RETENTION_DAYS)
+
+    @classmethod
+    def record(cls, user_id, award, date):
+        """Queue an award built by GamificationService.*_award for `date`.
+        Completing the same item again on that day is ignored."""
+        return cls.record_many(user_id, [(award, date)])
+
+    @classmethod
+    def record_many(cls, user_id, awards):
+        """Queue (award, date) pairs and return the events that are new.
+        Awards dated before the retention window are dropped, since their
+        earlier events may already be pruned."""
+        from .tasks import process_gamification_events
+
+        start = cls.retention_start()
+        events = {
+            (award['reference_type'], award['reference_id'], date):
+                GamificationEvent(user_id=user_id, date=date, **award)
+            for award, date in awards if date >= start
+        }
+        if not events:
+            return []
+        match = Q()
+        for reference_type, reference_id, date in events:
+            match |= Q(reference_type=reference_type, reference_id=reference_id, date=date)
+        for key in GamificationEvent.objects.filter(match).values_list('reference_type', 'reference_id', 'date'):
+            events.pop(key, None)
+        # The unique key still settles a race with a concurrent request
+        GamificationEvent.objects.bulk_create(events.values(), ignore_conflicts=True)
+        if events:
+            transaction.on_commit(lambda: process_gamification_events.delay(str(user_id)))
+        return list(events.values())
+
+    @classmethod
+    def pending_user_ids(cls):
+        return GamificationEvent.objects.filter(
+            processed_at__isnull=True
+        ).values_list('user_id', flat=True).distinct()
+
+    @classmethod
+    def drain(cls, user_id, batch_size=None):
+        """Apply one batch of the user's pending events and return its size.
+
+        Events are locked with SKIP LOCKED and marked processed in the same
+        transaction as their point transactions, so concurrent drains never
+        award an event twice. Each event counts for the day it was recorded
+        for, oldest first, in the streak and the weekly/monthly buckets."""
+        batch_size = batch_size or settings.GAMIFICATION_OUTBOX_BATCH_SIZE
+        with transaction.atomic():
+            events = list(GamificationEvent.objects.select_for_update(skip_locked=True).filter(
+                user_id=user_id, processed_at__isnull=True
+            ).order_by('date', 'created_at')[:batch_size])
+            if not events:
+                return 0
+
+            gamification = GamificationService(User.objects.get(pk=user_id))
+            for day, group in groupby(events, key=lambda event: event.date):
+                gamification.award_batch([
+                    {
+                        'points': event.points,
+                        'transaction_type': event.transaction_type,
+                        'reference_id': event.reference_id,
+                        'reference_type': event.reference_type,
+                        'description': event.description,
+                    }
+                    for event in group
+                ], check_achievements=False, activity_date=day)
+            GamificationEvent.objects.filter(
+                id__in=[event.id for event in events]
+            ).update(processed_at=timezone.now())
+            gamification.check_achievements()
+        return len(events)
+
+    @classmethod
+    def prune(cls, chunk_size=None):
+        """Delete processed events dated before the retention window and
+        return how many were removed"""
+        from goals.services import delete_in_chunks
+
+        return delete_in_chunks(
+            GamificationEvent._meta.db_table, 'processed_at IS NOT NULL AND date < %s',
+            [cls.retention_start()], chunk_size=chunk_size
         )
-        
-        for achievement in potential_achievements:
-            if self.check_achievement_requirements(achievement):
-                self.award_achievement(achievement)
-
-    def check_achievement_requirements(self, achievement):
-        """Check if user meets requirements for an achievement"""
-        if achievement.achievement_type == 'streak':
-            return self.profile.current_streak >= achievement.required_count
-            
-        elif achievement.achievement_type == 'completion':
-            count = PointTransaction.objects.filter(
-                user=self.user,
-                transaction_type__in=['standard', 'process', 'mtg', 'big']
-            ).count()
-            return count >= achievement.required_count
-            
-        elif achievement.achievement_type == 'level':
-            return self.profile.level >= achievement.required_count
-            
-        return False
-
-    def award_achievement(self, achievement):
-        """Award an achievement and its points"""
-        UserAchievement.objects.create(
-            user=self.user,
-            achievement=achievement
+
+class PointBucketService:
+    """Maintains the weekly and monthly PointBuckets behind the windowed
+    leaderboards and snapshots them once their period has closed."""
+
+    TRUNCATE = {'week': TruncWeek, 'month': TruncMonth}
+
+    @staticmethod
+    def matching(periods):
+        """Q for rows of any of the (period, period_start) pairs"""
+        match = Q()
+        for period, start in periods:
+            match |= Q(period=period, period_start=start)
+        return match
+
+    @classmethod
+    def add(cls, user_id, points, date):
+        """Add points earned on `date` to the user's buckets and to the live
+        window leaderboards. Callers hold the user's profile lock, so the
+        update-or-create can't race."""
+        starts = {period: period_start(period, date) for period in PERIODS}
+        buckets = PointBucket.objects.filter(cls.matching(starts.items()), user_id=user_id)
+
+        missing = ()
+        if buckets.update(points=F('points') + points) < len(starts):
+            existing = set(buckets.values_list('period', flat=True))
+            missing = [period for period in starts if period not in existing]
+            PointBucket.objects.bulk_create([
+                PointBucket(user_id=user_id, period=period, period_start=starts[period], points=points)
+                for period in missing
+            ])
+
+        def record():
+            for period, start in starts.items():
+                window_leaderboard(period, start).record(
+                    user_id, points, points if period in missing else None
+                )
+        transaction.on_commit(record)
+
+    @classmethod
+    def rebuild(cls, user_id, dates):
+        """Recount the user's buckets for every period containing one of
+        `dates` from the ledger, by activity date, for writes that bypass
+        award_batch (history imports). Snapshots of those periods that have
+        already closed are dropped, so snapshot_leaderboards writes them
+        again with the new totals."""
+        today = timezone.now().date()
+        ledger = PointTransaction.objects.filter(user_id=user_id)
+        totals = {}
+        for period in PERIODS:
+            starts = {period_start(period, date) for date in dates}
+            if not starts:
+                continue
+            rows = ledger.filter(
+                activity_date__gte=min(starts), activity_date__lt=period_end(period, max(starts))
+            ).annotate(
+                start=cls.TRUNCATE[period]('activity_date', output_field=DateField())
+            ).values('start').annotate(points=Sum('points')).values_list('start', 'points')
+            points = dict(rows)
+            totals.update({(period, start): points.get(start, 0) for start in starts})
+
+        PointBucket.objects.bulk_create([
+            PointBucket(user_id=user_id, period=period, period_start=start, points=points)
+            for (period, start), points in totals.items() if points
+        ], update_conflicts=True, unique_fields=['user', 'period', 'period_start'], update_fields=['points'])
+        empty = [key for key, points in totals.items() if not points]
+        if empty:
+            PointBucket.objects.filter(cls.matching(empty), user_id=user_id).delete()
+        closed = [(period, start) for period, start in totals if period_end(period, start) <= today]
+        if closed:
+            LeaderboardSnapshot.objects.filter(cls.matching(closed)).delete()
+
+        def record():
+            for (period, start), points in totals.items():
+                if period_end(period, start) > today:
+                    board = window_leaderboard(period, start)
+                    if points:
+                        board.set_points(user_id, points)
+                    else:
+                        board.remove(user_id)
+        transaction.on_commit(record)
+
+    @classmethod
+    def unsnapshotted(cls, today):
+        """(period, start) of every closed period with buckets but no snapshot"""
+        closed = []
+        for period in PERIODS:
+            current = period_start(period, today)
+            starts = set(PointBucket.objects.filter(
+                period=period, period_start__lt=current
+            ).order_by().values_list('period_start', flat=True).distinct())
+            starts -= set(LeaderboardSnapshot.objects.filter(
+                period=period, period_start__in=starts
+            ).order_by().values_list('period_start', flat=True).distinct())
+            closed.extend((period, start) for start in sorted(starts))
+        return closed
+
+    @classmethod
+    def snapshot(cls, period, start, batch_size=5000):
+        """Write the final standings of a closed period and drop its live
+        sorted set. Returns the number of users ranked."""
+        assert period_end(period, start) <= timezone.now().date(), 'Only closed periods are snapshotted'
+        order = [F('points').desc(), F('user_id').desc()]
+        rows = PointBucket.objects.filter(period=period, period_start=start).annotate(
+            rank=Window(Rank(), order_by=F('points').desc()),
+            position=Window(RowNumber(), order_by=order),
+        ).order_by('position').values_list('user_id', 'points', 'rank', 'position')
+
+        count = 0
+        with transaction.atomic():
+            if SnapshotLeaderboard(period, start).exists():
+                return 0
+            batch = []
+            for user_id, points, rank, position in rows.iterator(chunk_size=batch_size):
+                batch.append(LeaderboardSnapshot(
+                    user_id=user_id, period=period, period_start=start,
+                    points=points, rank=rank, position=position
+                ))
+                if len(batch) == batch_size:
+                    LeaderboardSnapshot.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            LeaderboardSnapshot.objects.bulk_create(batch)
+            count += len(batch)
+            transaction.on_commit(window_leaderboard(period, start).clear)
+        return count
+
+class UserCounterService:
+    """Keeps UserCounters rows in step with their source tables through F()
+    increments, and recounts them from the sources when a row is missing or
+    during the nightly reconciliation."""
+
+    FIELDS = tuple(
+        field.attname for field in UserCounters._meta.concrete_fields if not field.primary_key
+    )
+
+    @classmethod
+    def source_counts(cls, user_ids):
+        """{user_id: {field: value}} counted from the source tables"""
+        counts = {user_id: dict.fromkeys(cls.FIELDS, 0) for user_id in user_ids}
+        for row in PointTransaction.objects.filter(
+            user_id__in=user_ids,
+            transaction_type__in=UserCounters.COMPLETION_TYPES
+        ).values('user_id', 'transaction_type').annotate(count=Count('id')):
+            counts[row['user_id']][UserCounters.completion_field(row['transaction_type'])] = row['count']
+
+        for row in Goal.objects.filter(user_id__in=user_ids).values('user_id', 'goal_type').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(is_completed=True))
+        ):
+            total_field, completed_field = UserCounters.goal_fields(row['goal_type'])
+            counts[row['user_id']][total_field] = row['total']
+            counts[row['user_id']][completed_field] = row['completed']
+
+        for user_id, count in StandardProgress.objects.filter(
+            daily_progress__user_id__in=user_ids,
+            is_completed=True
+        ).values('daily_progress__user_id').annotate(count=Count('id')).values_list(
+            'daily_progress__user_id', 'count'
+        ):
+            counts[user_id]['standards_completed'] = count
+
+        for user_id, count in DailySummary.objects.filter(user_id__in=user_ids).annotate(
+            completed=F('processes_completed') + F('standards_completed')
+        ).filter(completed__gt=0).values('user_id').annotate(count=Count('id')).values_list(
+            'user_id', 'count'
+        ):
+            counts[user_id]['active_days'] = count
+        return counts
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recount the user's row from the source tables"""
+        values = cls.source_counts([user_id])[user_id]
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=user_id, **values)],
+            update_conflicts=True, unique_fields=['user'], update_fields=list(values)
         )
-        
-        self.award_points(
-            achievement.points,
-            'achievement',
-            reference_id=achievement.id,
-            reference_type='achievement',
-            description=f'Unlocked achievement: {achievement.name}'
+        return UserCounters(user_id=user_id, **values)
+
+    @classmethod
+    def increment(cls, user_id, **deltas):
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        # A user without a row yet is counted from the sources on first read
+        UserCounters.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
         )
+
+    @classmethod
+    def goal_changed(cls, user_id, old=None, new=None):
+        """Move a goal between counters; `old` and `new` are (goal_type,
+        is_completed) pairs, None when the goal didn't or doesn't exist"""
+        deltas = Counter()
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None:
+                total_field, completed_field = UserCounters.goal_fields(state[0])
+                deltas[total_field] += sign
+                deltas[completed_field] += sign * int(bool(state[1]))
+        cls.increment(user_id, **deltas)
+
+    @classmethod
+    def get(cls, user_id):
+        """The user's counters, counted from the sources when there's no row yet"""
+        return UserCounters.objects.filter(user_id=user_id).first() or cls.rebuild(user_id)
+
+    @classmethod
+    def reconcile(cls, batch_size=500):
+        """Recount every user's row in batches, fixing drifted and missing
+        rows. Returns (checked, fixed)."""
+        users = User.objects.order_by('pk').values_list('pk', flat=True)
+        checked = fixed = 0
+        last_pk = None
+        while True:
+            batch = list((users if last_pk is None else users.filter(pk__gt=last_pk))[:batch_size])
+            if not batch:
+                return checked, fixed
+            last_pk = batch[-1]
+            checked += len(batch)
+            # Locked while recounting so concurrent increments land on top
+            # of the recount instead of being overwritten by it
+            with transaction.atomic():
+                existing = {
+                    counters.user_id: counters
+                    for counters in UserCounters.objects.select_for_update().filter(user_id__in=batch)
+                }
+                drifted = [
+                    UserCounters(user_id=user_id, **values)
+                    for user_id, values in cls.source_counts(batch).items()
+                    if user_id not in existing or any(
+                        getattr(existing[user_id], field) != value for field, value in values.items()
+                    )
+                ]
+                UserCounters.objects.bulk_create(
+                    drifted, update_conflicts=True, unique_fields=['user'], update_fields=list(cls.FIELDS)
+                )
+            fixed += len(drifted)
+
+class AchievementRules:
+    """Achievements held in memory as ladders sorted by required_count, one
+    per metric, so a check reads the user's profile and counters and walks
+    each ladder only up to its next unmet threshold.
+
+    `special` achievements have no metric of their own; SPECIAL_RULES names
+    the completion type each one counts, keyed by achievement name."""
+
+    SPECIAL_RULES = {
+        'Goal Setter': 'big',
+        'Milestone Maker': 'mtg',
+    }
+    RELOAD_SECONDS = 300  # picks up achievements edited in another process
+
+    _ladders = None
+    _loaded_at = 0
+
+    @classmethod
+    def invalidate(cls):
+        cls._ladders = None
+
+    @classmethod
+    def ladders(cls):
+        if cls._ladders is None or time.monotonic() - cls._loaded_at > cls.RELOAD_SECONDS:
+            ladders = defaultdict(list)
+            for achievement in Achievement.objects.all():
+                metric = cls.metric(achievement)
+                if metric is not None:
+                    ladders[metric].append(achievement)
+            for ladder in ladders.values():
+                ladder.sort(key=lambda achievement: achievement.required_count)
+            cls._ladders, cls._loaded_at = dict(ladders), time.monotonic()
+        return cls._ladders
+
+    @classmethod
+    def metric(cls, achievement):
+        if achievement.achievement_type == 'special':
+            type_ = cls.SPECIAL_RULES.get(achievement.name)
+            return UserCounters.completion_field(type_) if type_ else None
+        return achievement.achievement_type
+
+    @staticmethod
+    def value(metric, profile, counters):
+        if metric == 'streak':
+            return profile.current_streak
+        if metric == 'level':
+            return profile.level
+        if metric == 'completion':
+            return counters.total_completions
+        return getattr(counters, metric)
+
+    @classmethod
+    def unlocked(cls, profile, counters, earned_ids):
+        """Achievements whose threshold is met, excluding `earned_ids`"""
+        unlocked = []
+        for metric, ladder in cls.ladders().items():
+            value = cls.value(metric, profile, counters)
+            for achievement in ladder:
+                if achievement.required_count > value:
+                    break
+                if achievement.id not in earned_ids:
+                    unlocked.append(achievement)
+        return unlocked
+
+class PointLedgerReconciler:
+    """Checks profile totals and levels against the PointTransaction ledger
+    in batches of profiles, with one grouped query per batch."""
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+
+    def ledger_totals(self, user_ids):
+        return dict(PointTransaction.objects.filter(
+            user_id__in=user_ids
+        ).values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total'))
+
+    def drifted(self, profiles):
+        """Profiles whose total or level doesn't match the ledger, with the expected total"""
+        totals = self.ledger_totals([profile.user_id for profile in profiles])
+        drifted = []
+        for profile in profiles:
+            total = totals.get(profile.user_id) or 0
+            if profile.total_points != total or profile.level != UserProfile.level_for(total):
+                drifted.append(profile)
+        return drifted
+
+    def fix(self, profiles):
+        # Totals are re-read under the lock so concurrent awards aren't lost
+        with transaction.atomic():
+            locked = list(UserProfile.objects.select_for_update().filter(
+                pk__in=[profile.pk for profile in profiles]
+            ))
+            totals = self.ledger_totals([profile.user_id for profile in locked])
+            for profile in locked:
+                total = totals.get(profile.user_id) or 0
+                UserProfile.objects.filter(pk=profile.pk).update(
+                    total_points=total, level=UserProfile.level_for(total)
+                )
+                DataVersion.bump(profile.user_id, 'gamification')
+                transaction.on_commit(
+                    lambda user_id=profile.user_id, total=total: leaderboard.set_points(user_id, total)
+                )
+
+    def reconcile(self, profiles=None, dry_run=False):
+        """Returns (checked, drifted); drifted profiles are fixed unless dry_run"""
+        profiles = (profiles if profiles is not None else UserProfile.objects.all()).order_by('pk')
+        checked = drifted = 0
+        last_pk = None
+        while True:
+            batch = profiles if last_pk is None else profiles.filter(pk__gt=last_pk)
+            batch = list(batch.only('pk', 'user_id', 'total_points', 'level')[:self.batch_size])
+            if not batch:
+                return checked, drifted
+            last_pk = batch[-1].pk
+            checked += len(batch)
+            found = self.drifted(batch)
+            drifted += len(found)
+            if found and not dry_run:
+                self.fix(found)
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from backend.versioning import DataVersion
+from .leaderboard import leaderboard
+from .models import Achievement, PointTransaction, UserAchievement, UserProfile
+from .services import AchievementRules
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=UserAchievement)
+@receiver(post_delete, sender=UserAchievement)
+@receiver(post_save, sender=PointTransaction)
+@receiver(post_delete, sender=PointTransaction)
+def bump_gamification_version(sender, instance, **kwargs):
+    DataVersion.bump(instance.user_id, 'gamification')
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def reload_achievement_rules(sender, instance, **kwargs):
+    AchievementRules.invalidate()
+
+@receiver(post_save, sender=UserProfile)
+def rank_new_profile(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: leaderboard.add(instance.user_id, instance.total_points))
+
+@receiver(post_delete, sender=UserProfile)
+def unrank_profile(sender, instance, **kwargs):
+    transaction.on_commit(lambda: leaderboard.remove(instance.user_id))
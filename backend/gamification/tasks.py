@@ -0,0 +1,43 @@
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from .services import GamificationOutbox, PointBucketService, UserCounterService
+
+@shared_task
+def reconcile_user_counters():
+    """Recount every UserCounters row from the source tables and fix drift"""
+    checked, fixed = UserCounterService.reconcile()
+    return {'checked': checked, 'fixed': fixed}
+
+@shared_task
+def process_gamification_events(user_id):
+    """Apply a user's pending GamificationEvents, one batch per transaction"""
+    batch_size = settings.GAMIFICATION_OUTBOX_BATCH_SIZE
+    processed = 0
+    while True:
+        count = GamificationOutbox.drain(user_id, batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
+
+@shared_task
+def drain_gamification_outbox():
+    """Fan out processing for every user with pending events, in case the
+    task queued on commit was lost"""
+    user_ids = list(GamificationOutbox.pending_user_ids())
+    for user_id in user_ids:
+        process_gamification_events.delay(str(user_id))
+    return len(user_ids)
+
+@shared_task
+def prune_gamification_outbox():
+    """Delete processed events older than the retention window"""
+    return GamificationOutbox.prune()
+
+@shared_task
+def snapshot_leaderboards():
+    """Snapshot the standings of every week and month that has closed"""
+    periods = PointBucketService.unsnapshotted(timezone.now().date())
+    for period, start in periods:
+        PointBucketService.snapshot(period, start)
+    return len(periods)
@@ -1,3 +1,469 @@
-from django.test import TestCase
+import uuid
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.pagination import KeysetPagination
+from goals.models import DailyProgress, Goal, ProcessProgress
+from goals.services import GoalDeletionService
+from standards.models import Standard, StandardCategory, StandardProgress
+from users.models import User
+from .leaderboard import RedisSortedSet, SnapshotLeaderboard, leaderboard, period_start, window_leaderboard
+from .models import (
+    Achievement, GamificationEvent, PointBucket, PointTransaction, UserAchievement, UserCounters, UserProfile
+)
+from .services import (
+    AchievementRules, GamificationOutbox, GamificationService, GamificationStatsService, PointBucketService,
+    PointCalculator, PointLedgerReconciler, UserCounterService
+)
 
-# Create your tests here.
+class PointHistoryPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('ledger', 'ledger@example.com', 'pw')
+        created_at = timezone.now()
+        PointTransaction.objects.bulk_create([
+            PointTransaction(user=self.user, points=index, description='', activity_date=created_at.date(),
+                             transaction_type='process' if index % 2 else 'standard')
+            for index in range(7)
+        ])
+        PointTransaction.objects.filter(user=self.user, points__lt=4).update(created_at=created_at)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch.object(KeysetPagination, 'page_size', 2)
+    def test_filtered_pages_follow_the_ledger_order(self):
+        url, ids = '/api/gamification/points/history/?type=process&cursor=', []
+        while url:
+            response = self.client.get(url)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [
+            str(transaction_id) for transaction_id in PointTransaction.objects.filter(
+                user=self.user, transaction_type='process'
+            ).order_by('-created_at', '-id').values_list('id', flat=True)
+        ])
+
+def create_process(user, title='Run'):
+    today = timezone.now().date()
+    fields = {'user': user, 'description': '', 'category': 'c', 'start_date': today, 'target_date': today}
+    big = Goal.objects.create(goal_type='BIG', title='Big', **fields)
+    mtg = Goal.objects.create(goal_type='MTG', title='Mid', parent=big, **fields)
+    return Goal.objects.create(goal_type='DP', title=title, parent=mtg, **fields)
+
+class AwardPipelineTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('awards', 'awards@example.com', 'pw')
+        self.process = create_process(self.user)
+        self.service = GamificationService(self.user)
+
+    def ledger_total(self):
+        return PointTransaction.objects.filter(user=self.user).aggregate(total=Sum('points'))['total']
+
+    def test_batch_is_one_insert_and_one_profile_update(self):
+        awards = [self.service.process_award(self.process)] * 3
+        with CaptureQueriesContext(connection) as queries:
+            transactions = self.service.award_batch(awards, check_achievements=False)
+        self.assertEqual(len(transactions), 3)
+        statements = [query['sql'] for query in queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith('INSERT INTO "point_transactions"')]), 1)
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE "user_game_profiles"')]), 1)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, self.ledger_total())
+        self.assertEqual(profile.level, UserProfile.level_for(profile.total_points))
+        self.assertEqual((profile.current_streak, profile.last_activity_date), (1, timezone.now().date()))
+
+    def test_streak_multiplier_applies_to_every_award(self):
+        UserProfile.objects.filter(user=self.user).update(
+            current_streak=7, last_activity_date=timezone.now().date()
+        )
+        [transaction] = GamificationService(self.user).award_batch(
+            [self.service.process_award(self.process)], check_achievements=False
+        )
+        self.assertEqual(transaction.streak_multiplier, 1.5)
+        self.assertEqual(transaction.points, int(PointCalculator.PROCESS_POINTS * 1.5))
+
+class ReconcilePointsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('drift', 'drift@example.com', 'pw')
+        service = GamificationService(self.user)
+        service.award_batch([service.process_award(create_process(self.user))] * 2, check_achievements=False)
+        UserProfile.objects.filter(user=self.user).update(total_points=999, level=4)
+
+    def test_dry_run_reports_without_writing(self):
+        out = StringIO()
+        call_command('reconcile_points', '--dry-run', stdout=out)
+        self.assertIn('Would fix 1', out.getvalue())
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, 999)
+
+    def test_drift_is_fixed_from_the_ledger(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_points', '--user', 'drift', stdout=StringIO())
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, 2 * PointCalculator.PROCESS_POINTS)
+        self.assertEqual(profile.level, 1)
+        self.assertEqual(PointLedgerReconciler().reconcile(dry_run=True), (1, 0))
+
+class AchievementRulesTests(TestCase):
+
+    def setUp(self):
+        AchievementRules.invalidate()
+        self.user = User.objects.create_user('rules', 'rules@example.com', 'pw')
+
+    def expected(self, profile, counters):
+        # Every achievement checked against its metric, as the old loop did
+        return {
+            achievement.name for achievement in Achievement.objects.all()
+            if (metric := AchievementRules.metric(achievement)) is not None
+            and AchievementRules.value(metric, profile, counters) >= achievement.required_count
+        }
+
+    def test_unlocked_matches_checking_every_achievement(self):
+        profile = UserProfile(user=self.user, current_streak=7, level=5)
+        counters = UserCounters(user=self.user, process_completions=9, standard_completions=1, big_completions=1)
+        unlocked = AchievementRules.unlocked(profile, counters, set())
+        self.assertEqual({achievement.name for achievement in unlocked}, self.expected(profile, counters))
+        self.assertIn('Goal Setter', self.expected(profile, counters))
+        self.assertNotIn('Milestone Maker', self.expected(profile, counters))
+
+        earned = {achievement.id for achievement in unlocked if achievement.name == 'First Steps'}
+        self.assertNotIn('First Steps', {
+            achievement.name for achievement in AchievementRules.unlocked(profile, counters, earned)
+        })
+
+    def test_check_cost_does_not_grow_with_achievements(self):
+        service = GamificationService(self.user)
+        service.check_achievements()
+        with CaptureQueriesContext(connection) as before:
+            GamificationService(self.user).check_achievements()
+        Achievement.objects.bulk_create([
+            Achievement(name=f'Marathon {count}', description='', icon='trophy',
+                        achievement_type='completion', required_count=count)
+            for count in range(1000, 1050)
+        ])
+        AchievementRules.invalidate()
+        AchievementRules.ladders()
+        with self.assertNumQueries(len(before)):
+            GamificationService(self.user).check_achievements()
+
+    def test_first_completion_unlocks_once(self):
+        service = GamificationService(self.user)
+        process = create_process(self.user)
+        service.award_batch([service.process_award(process)])
+        service.award_batch([service.process_award(process)])
+        self.assertEqual(UserAchievement.objects.filter(
+            user=self.user, achievement__name='First Steps'
+        ).count(), 1)
+        self.assertEqual(UserCounterService.get(self.user.id).process_completions, 2)
+        self.assertEqual(UserProfile.objects.get(user=self.user).total_points, PointTransaction.objects.filter(
+            user=self.user
+        ).aggregate(total=Sum('points'))['total'])
+
+class UserCountersTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('counted', 'counted@example.com', 'pw')
+        UserCounterService.rebuild(self.user.id)
+        self.process = create_process(self.user)
+        category = StandardCategory.objects.create(user=self.user, name='Health')
+        self.standard = Standard.objects.create(user=self.user, category=category, title='Sleep', description='',
+                                                minimum_requirement='7h', frequency='daily')
+        self.day = DailyProgress.objects.create(user=self.user, date=timezone.now().date())
+
+    def assertCountersMatchSources(self):
+        counters = UserCounters.objects.get(user=self.user)
+        self.assertEqual(
+            {field: getattr(counters, field) for field in UserCounterService.FIELDS},
+            UserCounterService.source_counts([self.user.id])[self.user.id]
+        )
+
+    def test_write_paths_keep_counters_equal_to_a_recount(self):
+        self.assertCountersMatchSources()
+        progress = StandardProgress.objects.create(daily_progress=self.day, standard=self.standard, is_completed=True)
+        self.assertCountersMatchSources()
+        ProcessProgress.objects.create(daily_progress=self.day, process=self.process, is_completed=True)
+        self.assertCountersMatchSources()
+        progress.is_completed = False
+        progress.save()
+        self.assertCountersMatchSources()
+
+        mtg = self.process.parent
+        mtg.is_completed = True
+        mtg.save()
+        service = GamificationService(self.user)
+        service.award_batch([service.mtg_award(mtg), service.process_award(self.process)])
+        self.assertCountersMatchSources()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GoalDeletionService.delete(mtg)
+        self.assertCountersMatchSources()
+        progress.delete()
+        self.assertCountersMatchSources()
+
+    @override_settings(ASYNC_DELETE_THRESHOLD=1)
+    def test_background_deletion_moves_the_counters_up_front(self):
+        ProcessProgress.objects.create(daily_progress=self.day, process=self.process, is_completed=True)
+        with mock.patch('goals.tasks.purge_goals.delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(GoalDeletionService.delete(self.process.parent))
+        delay.assert_called_once()
+        self.assertCountersMatchSources()
+
+    def test_reconcile_fixes_drifted_and_missing_rows(self):
+        other = User.objects.create_user('uncounted', 'uncounted@example.com', 'pw')
+        UserCounters.objects.filter(user=self.user).update(big_goals=40, active_days=-1)
+        UserCounters.objects.filter(user=other).delete()
+        checked, fixed = UserCounterService.reconcile(batch_size=1)
+        self.assertEqual((checked, fixed), (User.objects.count(), 2))
+        self.assertCountersMatchSources()
+        self.assertTrue(UserCounters.objects.filter(user=other).exists())
+        self.assertEqual(UserCounterService.reconcile(), (checked, 0))
+
+    def test_goal_completion_rate_reads_the_counters(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.process.is_completed = True
+        self.process.save()
+        with self.assertNumQueries(1):
+            UserCounterService.get(self.user.id)
+        response = client.get('/api/goals/analytics/goal-completion/')
+        self.assertEqual(response.data['total_goals'], 3)
+        self.assertEqual(response.data['completed_goals'], 1)
+
+class GamificationOutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('queued', 'queued@example.com', 'pw')
+        self.process = create_process(self.user)
+        self.today = timezone.now().date()
+        self.award = GamificationService.process_award(self.process)
+
+    def test_recording_a_completion_twice_queues_it_once(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(len(GamificationOutbox.record(self.user.id, self.award, self.today)), 1)
+            self.assertEqual(GamificationOutbox.record(self.user.id, self.award, self.today), [])
+        self.assertEqual(len(callbacks), 1)
+        GamificationOutbox.drain(self.user.id)
+        GamificationOutbox.record(self.user.id, self.award, self.today)
+        self.assertEqual(GamificationOutbox.drain(self.user.id), 0)
+        self.assertEqual(PointTransaction.objects.filter(user=self.user, transaction_type='process').count(), 1)
+
+    def test_events_count_for_their_own_day(self):
+        days = [self.today - timedelta(days=offset) for offset in (0, 8, 9)]
+        for day in days:
+            other = create_process(self.user, title=f'Run {day}')
+            GamificationOutbox.record(self.user.id, GamificationService.process_award(other), day)
+        GamificationOutbox.drain(self.user.id)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.current_streak, profile.longest_streak), (1, 2))
+        self.assertEqual(profile.last_activity_date, self.today)
+        buckets = dict(PointBucket.objects.filter(user=self.user, period='week').values_list('period_start', 'points'))
+        expected = Counter()
+        for day in days:
+            expected[period_start('week', day)] += PointCalculator.PROCESS_POINTS
+        # Achievements unlocked by the drain count for today
+        expected[period_start('week', self.today)] += PointTransaction.objects.filter(
+            user=self.user, transaction_type='achievement'
+        ).aggregate(total=Sum('points'))['total'] or 0
+        self.assertEqual(buckets, dict(expected))
+
+    def test_rebuild_keeps_backdated_events_in_their_buckets(self):
+        day = self.today - timedelta(days=8)
+        GamificationOutbox.record(self.user.id, self.award, day)
+        GamificationOutbox.drain(self.user.id)
+        buckets = set(PointBucket.objects.filter(user=self.user).values_list('period', 'period_start', 'points'))
+
+        PointBucketService.rebuild(self.user.id, [day, self.today])
+        self.assertEqual(
+            set(PointBucket.objects.filter(user=self.user).values_list('period', 'period_start', 'points')), buckets
+        )
+
+    def test_late_events_do_not_reset_the_streak(self):
+        UserProfile.objects.update_or_create(user=self.user, defaults={
+            'current_streak': 5, 'longest_streak': 5, 'last_activity_date': self.today
+        })
+        GamificationOutbox.record(self.user.id, self.award, self.today - timedelta(days=3))
+        GamificationOutbox.drain(self.user.id)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.current_streak, profile.last_activity_date), (5, self.today))
+
+    @override_settings(GAMIFICATION_OUTBOX_RETENTION_DAYS=30)
+    def test_prune_keeps_pending_and_recent_events(self):
+        old = self.today - timedelta(days=31)
+        self.assertEqual(GamificationOutbox.record(self.user.id, self.award, old), [])
+        GamificationOutbox.record(self.user.id, self.award, self.today)
+        GamificationOutbox.drain(self.user.id)
+        GamificationEvent.objects.bulk_create([
+            GamificationEvent(user=self.user, date=old, processed_at=timezone.now(), **self.award),
+            GamificationEvent(user=self.user, date=old - timedelta(days=1), **self.award),
+        ])
+
+        self.assertEqual(GamificationOutbox.prune(chunk_size=1), 1)
+        self.assertEqual(set(GamificationEvent.objects.values_list('date', flat=True)), {
+            old - timedelta(days=1), self.today
+        })
+
+    def test_goal_completion_counts_for_its_completion_date(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        mtg = self.process.parent
+        yesterday = self.today - timedelta(days=1)
+        client.patch(f'/api/goals/{mtg.id}/', {
+            'is_completed': True, 'completion_date': yesterday.isoformat()
+        }, format='json')
+        self.assertEqual(GamificationEvent.objects.get(reference_id=mtg.id).date, yesterday)
+
+class LeaderboardTests(TestCase):
+    POINTS = (50, 40, 40, 40, 30, 10, 10, 0)
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(f'ranked{index}', f'ranked{index}@example.com', 'pw')
+            for index in range(len(self.POINTS))
+        ]
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, total_points=points) for user, points in zip(self.users, self.POINTS)
+        ])
+
+    def expected(self):
+        # Equal points share a rank and are listed by descending member, as ZREVRANGE
+        rows = sorted(
+            ((str(profile.user_id), profile.total_points) for profile in UserProfile.objects.all()),
+            key=lambda row: (row[1], row[0]), reverse=True
+        )
+        return [(user_id, points, 1 + sum(other > points for _, other in rows)) for user_id, points in rows]
+
+    def assertMatchesRows(self, board):
+        expected = self.expected()
+        self.assertEqual(board.size(), len(expected))
+        self.assertEqual(board.page(0, 100), expected)
+        self.assertEqual(board.page(2, 3), expected[2:5])
+        for index, (user_id, points, rank) in enumerate(expected):
+            self.assertEqual((board.points(user_id), board.rank(user_id)), (points, rank))
+            self.assertEqual(board.around(user_id, 2), expected[max(index - 2, 0):index + 3])
+
+    def test_every_store_ranks_like_the_rows(self):
+        for store in ('memory', 'database'):
+            with self.subTest(store=store), override_settings(LEADERBOARD_STORE=store):
+                leaderboard.rebuild()
+                self.assertMatchesRows(leaderboard)
+                service = GamificationService(self.users[-1])
+                with self.captureOnCommitCallbacks(execute=True):
+                    service.award_batch([service.process_award(create_process(self.users[-1]))] * 3)
+                self.assertMatchesRows(leaderboard)
+
+    def test_redis_rebuilds_use_their_own_scratch_key(self):
+        client = mock.Mock()
+        client.exists.return_value = True
+        store = RedisSortedSet(client, 'leaderboard:points')
+        store.replace([('a', 1)])
+        store.replace([('b', 2)])
+        (first, _), (second, _) = [call.args for call in client.rename.call_args_list]
+        self.assertNotEqual(first, second)
+        self.assertEqual(client.rename.call_args.args[1], 'leaderboard:points')
+
+    def test_user_without_a_profile_is_ranked(self):
+        newcomer = User.objects.create_user('newcomer', 'newcomer@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(newcomer)
+        response = client.get('/api/gamification/leaderboard/?around=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user_rank'], len(self.POINTS))
+        self.assertEqual(response.data['total_users'], len(self.POINTS) + 1)
+
+class WindowLeaderboardTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.last_week = period_start('week', self.today) - timedelta(days=7)
+        self.users = [
+            User.objects.create_user(f'weekly{index}', f'weekly{index}@example.com', 'pw') for index in range(6)
+        ]
+        PointBucket.objects.bulk_create([
+            PointBucket(user=user, period='week', period_start=self.last_week, points=points)
+            for user, points in zip(self.users, (30, 20, 20, 20, 10, 5))
+        ])
+
+    def test_snapshot_matches_the_live_ranking(self):
+        live = window_leaderboard('week', self.last_week)
+        expected = live.page(0, 100)
+        around = {user.id: live.around(user.id, 1) for user in self.users}
+        self.assertEqual(PointBucketService.snapshot('week', self.last_week), len(self.users))
+
+        snapshot = SnapshotLeaderboard('week', self.last_week)
+        self.assertEqual(snapshot.page(0, 100), expected)
+        self.assertEqual(snapshot.page(1, 3), expected[1:4])
+        for user_id, points, rank in expected:
+            self.assertEqual((snapshot.points(user_id), snapshot.rank(user_id)), (points, rank))
+            self.assertEqual(snapshot.around(user_id, 1), around[uuid.UUID(user_id)])
+
+    def test_rebuild_recounts_buckets_from_the_ledger(self):
+        user = self.users[-1]
+        PointBucketService.snapshot('week', self.last_week)
+        days = [self.last_week + timedelta(days=1), self.last_week + timedelta(days=3), self.today]
+        PointTransaction.objects.bulk_create([
+            PointTransaction(user=user, points=points, transaction_type='process', description='', activity_date=day)
+            for points, day in zip((7, 8, 9), days)
+        ])
+        PointBucket.objects.filter(user=user).update(points=999)
+
+        with override_settings(LEADERBOARD_STORE='memory'):
+            board = window_leaderboard('week', period_start('week', self.today))
+            board.rebuild()
+            with self.captureOnCommitCallbacks(execute=True):
+                PointBucketService.rebuild(user.id, days)
+            self.assertEqual(board.points(user.id), 9)
+
+        expected = Counter()
+        for transaction_ in PointTransaction.objects.filter(user=user):
+            for period in ('week', 'month'):
+                expected[period, period_start(period, transaction_.activity_date)] += transaction_.points
+        self.assertEqual({
+            (bucket.period, bucket.period_start): bucket.points for bucket in PointBucket.objects.filter(user=user)
+        }, dict(expected))
+        # The closed week is ranked again by the next snapshot run
+        self.assertFalse(SnapshotLeaderboard('week', self.last_week).exists())
+        self.assertIn(('week', self.last_week), PointBucketService.unsnapshotted(self.today))
+
+class GamificationStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dashboard', 'dashboard@example.com', 'pw')
+        self.service = GamificationService(self.user)
+        self.process = create_process(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_award_precomputes_the_payload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.award_batch([self.service.process_award(self.process)])
+        with self.assertNumQueries(0):
+            payload = GamificationStatsService.get(self.user)
+        self.assertEqual(payload, GamificationStatsService.compute(self.user))
+        self.assertEqual(self.client.get('/api/gamification/stats/').data, payload)
+
+    def test_stale_or_evicted_payload_is_rebuilt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.award_batch([self.service.process_award(self.process)])
+        # Written outside the award path: only the version moves
+        with self.captureOnCommitCallbacks(execute=True):
+            PointTransaction.objects.create(user=self.user, points=5, transaction_type='streak', description='Bonus',
+                                            activity_date=timezone.now().date())
+        payload = GamificationStatsService.get(self.user)
+        self.assertIn('Bonus', [row['description'] for row in payload['recent_transactions']])
+
+        cache.delete(GamificationStatsService.key(self.user.id))
+        self.assertEqual(GamificationStatsService.get(self.user), payload)
+        with self.assertNumQueries(0):
+            GamificationStatsService.get(self.user)
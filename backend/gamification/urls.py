@@ -9,4 +9,6 @@ urlpatterns = [
     path('achievements/available/', views.AvailableAchievementsView.as_view(), name='available-achievements'),
     path('points/history/', views.PointTransactionHistoryView.as_view(), name='point-history'),
     path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
+    path('leaderboard/week/', views.WindowedLeaderboardView.as_view(period='week'), name='weekly-leaderboard'),
+    path('leaderboard/month/', views.WindowedLeaderboardView.as_view(period='month'), name='monthly-leaderboard'),
 ]
@@ -1,55 +1,38 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
-from datetime import timedelta
-import math
+from datetime import datetime, timedelta
+import uuid
 
+from backend.pagination import KeysetPagination
+from backend.versioning import ConditionalGetMixin
+from .leaderboard import (
+    SnapshotLeaderboard, leaderboard, period_end, period_start, window_leaderboard
+)
 from .models import UserProfile, Achievement, UserAchievement, PointTransaction
+from .services import GamificationStatsService
 from .serializers import (
     UserProfileSerializer,
     AchievementSerializer,
     UserAchievementSerializer,
-    PointTransactionSerializer,
-    GamificationStatsSerializer
+    PointTransactionSerializer
 )
 
-class GamificationStatsView(APIView):
-    """Combined gamification stats for the dashboard"""
+class GamificationStatsView(ConditionalGetMixin, APIView):
+    """Combined gamification stats for the dashboard, served from the
+    payload precomputed by the award path"""
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('gamification',)
 
     def get(self, request):
-        profile = UserProfile.objects.get(user=request.user)
-        
-        # Calculate points needed for next level
-        current_level = profile.level
-        points_for_next_level = ((current_level) ** 2) * 100
-        progress = (profile.total_points - ((current_level - 1) ** 2) * 100) / (points_for_next_level - ((current_level - 1) ** 2) * 100) * 100
-        
-        # Get recent achievements and transactions
-        recent_achievements = UserAchievement.objects.filter(
-            user=request.user
-        ).order_by('-unlocked_at')[:5]
-        
-        recent_transactions = PointTransaction.objects.filter(
-            user=request.user
-        ).order_by('-created_at')[:10]
-        
-        data = {
-            'profile': profile,
-            'recent_achievements': recent_achievements,
-            'recent_transactions': recent_transactions,
-            'next_level_points': points_for_next_level,
-            'progress_to_next_level': progress
-        }
-        
-        serializer = GamificationStatsSerializer(data)
-        return Response(serializer.data)
+        return Response(GamificationStatsService.get(request.user))
 
-class UserAchievementsView(generics.ListAPIView):
+class UserAchievementsView(ConditionalGetMixin, generics.ListAPIView):
     """List all achievements for the current user"""
     serializer_class = UserAchievementSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('gamification',)
 
     def get_queryset(self):
         return UserAchievement.objects.filter(
@@ -70,10 +53,12 @@ class AvailableAchievementsView(generics.ListAPIView):
             id__in=earned_ids
         )
 
-class PointTransactionHistoryView(generics.ListAPIView):
+class PointTransactionHistoryView(ConditionalGetMixin, generics.ListAPIView):
     """List point transactions with optional filtering"""
     serializer_class = PointTransactionSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('gamification',)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         queryset = PointTransaction.objects.filter(
@@ -95,24 +80,105 @@ class PointTransactionHistoryView(generics.ListAPIView):
             except ValueError:
                 pass
         
-        return queryset.order_by('-created_at')
+        return queryset.order_by('-created_at', '-id')
 
 class LeaderboardView(APIView):
-    """Global leaderboard based on total points"""
+    """Global leaderboard based on total points.
+
+    `?offset=` and `?limit=` page through the ranking, and `?around=N` adds
+    the N users either side of the requesting user."""
     permission_classes = (permissions.IsAuthenticated,)
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 100
+    MAX_AROUND = 50
+
+    def int_param(self, name, default, maximum=None):
+        try:
+            value = max(int(self.request.query_params.get(name, default)), 0)
+        except ValueError:
+            value = default
+        return min(value, maximum) if maximum is not None else value
 
     def get(self, request):
-        # Get top 10 users by points
-        top_users = UserProfile.objects.order_by('-total_points')[:10]
-        
-        # Get requesting user's rank
-        user_profile = UserProfile.objects.get(user=request.user)
-        user_rank = UserProfile.objects.filter(
-            total_points__gt=user_profile.total_points
-        ).count() + 1
-        
+        offset = self.int_param('offset', 0)
+        limit = self.int_param('limit', self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        user_profile, _ = UserProfile.objects.get_or_create(user=request.user)
+
+        user_rank = leaderboard.rank(request.user.id)
+        if user_rank is None:
+            # Profile missed by the award path: rank it now
+            leaderboard.set_points(request.user.id, user_profile.total_points)
+            user_rank = leaderboard.rank(request.user.id)
+
         return Response({
-            'leaderboard': UserProfileSerializer(top_users, many=True).data,
+            **self.ranking(leaderboard, offset, limit),
             'user_rank': user_rank,
-            'user_profile': UserProfileSerializer(user_profile).data
+            'user_profile': UserProfileSerializer(user_profile).data,
+        })
+
+    def ranking(self, board, offset, limit, points_field='total_points'):
+        """The page, total and optional around-me window of a leaderboard"""
+        page = board.page(offset, limit)
+        around = None
+        if 'around' in self.request.query_params:
+            around = board.around(self.request.user.id, self.int_param('around', 0, self.MAX_AROUND))
+
+        profiles = UserProfile.objects.in_bulk(
+            [user_id for user_id, _, _ in page + (around or [])], field_name='user_id'
+        )
+        data = {
+            'leaderboard': self.serialize(page, profiles, points_field),
+            'total_users': board.size(),
+            'offset': offset,
+            'limit': limit,
+        }
+        if around is not None:
+            data['around_me'] = self.serialize(around, profiles, points_field)
+        return data
+
+    def serialize(self, entries, profiles, points_field):
+        data = []
+        for user_id, points, rank in entries:
+            profile = profiles.get(uuid.UUID(user_id))
+            # Skip users deleted since the sorted set was written
+            if profile is not None:
+                data.append({**UserProfileSerializer(profile).data, points_field: points, 'rank': rank})
+        return data
+
+class WindowedLeaderboardView(LeaderboardView):
+    """Weekly or monthly leaderboard, ranked by the points earned in the
+    period containing `?date=` (default: today).
+
+    The current period is ranked live from PointBuckets; closed periods are
+    served from their snapshot once snapshot_leaderboards has run."""
+    period = None
+
+    def get(self, request):
+        date = timezone.now().date()
+        if 'date' in request.query_params:
+            try:
+                date = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid date format. Use YYYY-MM-DD.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        start = period_start(self.period, date)
+        end = period_end(self.period, start)
+        closed = end <= timezone.now().date()
+        board = SnapshotLeaderboard(self.period, start) if closed else None
+        if board is None or not board.exists():
+            board = window_leaderboard(self.period, start)
+
+        offset = self.int_param('offset', 0)
+        limit = self.int_param('limit', self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        return Response({
+            'period': self.period,
+            'period_start': start,
+            'period_end': end - timedelta(days=1),
+            'closed': closed,
+            **self.ranking(board, offset, limit, points_field='points'),
+            'user_rank': board.rank(request.user.id),
+            'user_points': board.points(request.user.id) or 0,
         })
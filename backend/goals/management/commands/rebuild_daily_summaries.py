@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from goals.services import DailySummaryService
+from users.models import User
+
+class Command(BaseCommand):
+    help = 'Recompute DailySummary rows from the progress tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild summaries for this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        written = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            written += DailySummaryService.refresh([user_id])
+
+        self.stdout.write(self.style.SUCCESS(f'Rewrote {written} daily summaries'))
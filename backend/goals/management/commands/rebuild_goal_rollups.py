@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from goals.services import GoalRollupMaintainer
+from users.models import User
+
+class Command(BaseCommand):
+    help = 'Recompute GoalRollup rows from source tables and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+
+        created = updated = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            c, u = GoalRollupMaintainer.rebuild(user_id, options['dry_run'])
+            created += c
+            updated += u
+
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {updated} drifted rollups and created {created} missing rollups'
+        ))
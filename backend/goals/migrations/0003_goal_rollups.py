@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("goals", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoalRollup",
+            fields=[
+                (
+                    "goal",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rollup",
+                        serialize=False,
+                        to="goals.goal",
+                    ),
+                ),
+                ("completed_days", models.IntegerField(default=0)),
+                ("total_days", models.IntegerField(default=0)),
+                ("children_count", models.IntegerField(default=0)),
+                ("completed_children_count", models.IntegerField(default=0)),
+                ("children_percentage_sum", models.FloatField(default=0)),
+                ("completion_percentage", models.FloatField(default=0)),
+            ],
+            options={
+                "db_table": "goal_rollups",
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("goals", "0004_daily_summaries"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="goal",
+            index=models.Index(
+                fields=["user", "goal_type"], name="goals_user_type_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="goal",
+            index=models.Index(
+                condition=models.Q(("is_completed", False)),
+                fields=["user", "goal_type", "start_date", "target_date"],
+                name="goals_active_idx",
+            ),
+        ),
+    ]
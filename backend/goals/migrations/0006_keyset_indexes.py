@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("goals", "0005_goal_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="goal",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="goals_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reflection",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="reflections_user_created_idx",
+            ),
+        ),
+    ]
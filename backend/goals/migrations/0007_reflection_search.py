@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, Func, TextField, Value
+
+
+def array_text(field):
+    return Func(
+        F(field), Value(" "), function="array_to_string", output_field=TextField()
+    )
+
+
+def populate_search_vectors(apps, schema_editor):
+    Reflection = apps.get_model("goals", "Reflection")
+    Reflection.objects.update(
+        search_vector=(
+            SearchVector("content", weight="A", config="english")
+            + SearchVector(array_text("highlights"), weight="B", config="english")
+            + SearchVector(array_text("challenges"), weight="B", config="english")
+            + SearchVector(array_text("action_items"), weight="C", config="english")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("goals", "0006_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reflection",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reflection",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="reflections_search_idx"
+            ),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("goals", "0007_reflection_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="goal",
+            name="pending_deletion",
+            field=models.BooleanField(default=False),
+        ),
+    ]
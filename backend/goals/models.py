@@ -2,9 +2,17 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 from users.models import User
 
+class GoalManager(models.Manager):
+    """Hides goals whose subtree is being deleted in the background"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(pending_deletion=False)
+
 class Goal(models.Model):
     """Goals in the BIG-MTG-DP hierarchy"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -28,10 +36,16 @@ class Goal(models.Model):
     metrics = models.JSONField(default=list)  # Array of measurement criteria
     is_completed = models.BooleanField(default=False)
     completion_date = models.DateField(null=True, blank=True)
+
+    # Set while a background task deletes the goal's subtree
+    pending_deletion = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GoalManager()
+    all_objects = models.Manager()
+
     def clean(self):
         if self.goal_type == 'BIG' and self.parent is not None:
             raise ValidationError(_('BIG goals cannot have a parent goal.'))
@@ -42,6 +56,29 @@ class Goal(models.Model):
 
     class Meta:
         db_table = 'goals'
+        indexes = [
+            models.Index(fields=['user', 'goal_type'], name='goals_user_type_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='goals_user_created_idx'),
+            # Active processes, used by progress materialization and health checks
+            models.Index(
+                fields=['user', 'goal_type', 'start_date', 'target_date'],
+                condition=models.Q(is_completed=False),
+                name='goals_active_idx'
+            ),
+        ]
+
+class GoalRollup(models.Model):
+    """Denormalized completion rollup for a goal, maintained incrementally"""
+    goal = models.OneToOneField(Goal, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    completed_days = models.IntegerField(default=0)  # DP: completed process progress entries
+    total_days = models.IntegerField(default=0)  # DP: days between start and target date
+    children_count = models.IntegerField(default=0)
+    completed_children_count = models.IntegerField(default=0)
+    children_percentage_sum = models.FloatField(default=0)  # BIG: sum of MTG percentages
+    completion_percentage = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'goal_rollups'
 
 class DailyProgress(models.Model):
     """Daily tracking of standards and processes"""
@@ -53,6 +90,12 @@ class DailyProgress(models.Model):
         db_table = 'daily_progress'
         unique_together = [['user', 'date']]
 
+class ProcessProgressQuerySet(models.QuerySet):
+
+    def visible(self):
+        """Without the progress of processes being deleted in the background"""
+        return self.filter(process__pending_deletion=False)
+
 class ProcessProgress(models.Model):
     """Individual daily process completion tracking"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -63,6 +106,8 @@ class ProcessProgress(models.Model):
     completion_time = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
 
+    objects = ProcessProgressQuerySet.as_manager()
+
     def clean(self):
         if self.process.goal_type != 'DP':
             raise ValidationError(_('Process progress can only be tracked for Daily Process goals.'))
@@ -71,6 +116,21 @@ class ProcessProgress(models.Model):
         db_table = 'process_progress'
         unique_together = [['daily_progress', 'process']]
 
+class DailySummary(models.Model):
+    """Per-day progress totals, maintained incrementally by progress writes"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField()
+    standards_completed = models.IntegerField(default=0)
+    standards_total = models.IntegerField(default=0)
+    processes_completed = models.IntegerField(default=0)
+    processes_total = models.IntegerField(default=0)
+    minutes = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'daily_summaries'
+        unique_together = [['user', 'date']]
+
 class Reflection(models.Model):
     """Weekly/Monthly reflections on progress"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -90,6 +150,9 @@ class Reflection(models.Model):
     highlights = ArrayField(models.TextField(), default=list)
     challenges = ArrayField(models.TextField(), default=list)
     action_items = ArrayField(models.TextField(), default=list)
+
+    # Weighted tsvector over content and the list fields, kept current on save
+    search_vector = SearchVectorField(null=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -97,3 +160,7 @@ class Reflection(models.Model):
     class Meta:
         db_table = 'reflections'
         unique_together = [['user', 'reflection_type', 'start_date']]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='reflections_user_created_idx'),
+            GinIndex(fields=['search_vector'], name='reflections_search_idx'),
+        ]
@@ -1,8 +1,18 @@
 from rest_framework import serializers
 from django.utils import timezone
+from backend.fieldsets import SparseFieldsetSerializerMixin
 from .models import Goal, DailyProgress, ProcessProgress, Reflection
+from .services import GoalRollupService
+
+class GoalSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Goal
+        fields = ('id', 'goal_type', 'title', 'category', 'is_completed')
+        read_only_fields = fields
+
+class GoalSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    ROLLUP_FIELDS = ('children_count', 'completion_percentage')
 
-class GoalSerializer(serializers.ModelSerializer):
     children_count = serializers.SerializerMethodField()
     completion_percentage = serializers.SerializerMethodField()
 
@@ -17,29 +27,32 @@ class GoalSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at', 'children_count',
                           'completion_percentage')
 
+    expandable_fields = {
+        'parent': (GoalSummarySerializer, {'read_only': True}),
+        'children': (GoalSummarySerializer, {'many': True, 'read_only': True}),
+    }
+
+    def _get_rollup(self, obj):
+        # List views precompute rollups for the whole page (see GoalRollupMixin)
+        rollups = self.context.get('rollups')
+        if rollups is not None and obj.id in rollups:
+            return rollups[obj.id]
+        rollup = getattr(obj, 'rollup', None)
+        if rollup is not None:
+            return {
+                'children_count': rollup.children_count,
+                'completion_percentage': rollup.completion_percentage,
+            }
+        cache = self.__dict__.setdefault('_rollup_cache', {})
+        if obj.id not in cache:
+            cache[obj.id] = GoalRollupService([obj]).get(obj)
+        return cache[obj.id]
+
     def get_children_count(self, obj):
-        return obj.children.count()
+        return self._get_rollup(obj)['children_count']
 
     def get_completion_percentage(self, obj):
-        if obj.goal_type == 'DP':
-            # For DPs, calculate based on process progress
-            total_days = (obj.target_date - obj.start_date).days + 1
-            completed_days = obj.progress.filter(is_completed=True).count()
-            return (completed_days / total_days * 100) if total_days > 0 else 0
-        elif obj.goal_type == 'MTG':
-            # For MTGs, calculate based on DP completion
-            dps = obj.children.all()
-            if not dps.exists():
-                return 0
-            completed_dps = dps.filter(is_completed=True).count()
-            return (completed_dps / dps.count() * 100)
-        else:  # BIG
-            # For BIGs, calculate based on MTG completion
-            mtgs = obj.children.all()
-            if not mtgs.exists():
-                return 0
-            mtg_percentages = [self.get_completion_percentage(mtg) for mtg in mtgs]
-            return sum(mtg_percentages) / len(mtg_percentages)
+        return self._get_rollup(obj)['completion_percentage']
 
     def validate(self, data):
         # Validate goal hierarchy
@@ -94,7 +107,7 @@ class DailyProgressSerializer(serializers.ModelSerializer):
     def get_process_progress(self, obj):
         return ProcessProgressSerializer(obj.process_progress.all(), many=True).data
 
-class ProcessProgressSerializer(serializers.ModelSerializer):
+class ProcessProgressSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     process_title = serializers.CharField(source='process.title', read_only=True)
     category = serializers.CharField(source='process.category', read_only=True)
     parent_goal = serializers.CharField(source='process.parent.title', read_only=True)
@@ -107,6 +120,10 @@ class ProcessProgressSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'process_title', 'category', 'parent_goal', 'daily_progress', 'process')
 
+    expandable_fields = {
+        'process': (GoalSummarySerializer, {'read_only': True}),
+    }
+
     def validate(self, data):
         # Only validate process field if it's being updated
         if 'process' in data:
@@ -175,3 +192,47 @@ class ReflectionSerializer(serializers.ModelSerializer):
             })
         
         return data
+
+class ReflectionSearchSerializer(ReflectionSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta(ReflectionSerializer.Meta):
+        fields = ReflectionSerializer.Meta.fields + ('rank', 'headline')
+
+class BulkProgressItemSerializer(serializers.Serializer):
+    TYPE_CHOICES = [
+        ('process', 'Process Progress'),
+        ('standard', 'Standard Progress'),
+    ]
+    type = serializers.ChoiceField(choices=TYPE_CHOICES)
+    id = serializers.UUIDField()
+    is_completed = serializers.BooleanField(required=False)
+    time_spent_minutes = serializers.IntegerField(required=False, min_value=0)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    # Only needed to persist virtual entries on first touch
+    process = serializers.UUIDField(required=False)
+    standard = serializers.UUIDField(required=False)
+    date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data['type'] == 'standard' and 'time_spent_minutes' in data:
+            raise serializers.ValidationError({
+                'time_spent_minutes': 'Time spent can only be tracked for processes.'
+            })
+        return data
+
+class BulkProgressUpdateSerializer(serializers.Serializer):
+    MAX_UPDATES = 200
+
+    updates = BulkProgressItemSerializer(many=True, allow_empty=False)
+
+    def validate_updates(self, value):
+        if len(value) > self.MAX_UPDATES:
+            raise serializers.ValidationError(
+                f'At most {self.MAX_UPDATES} updates can be applied at once.'
+            )
+        ids = [update['id'] for update in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Each progress entry can only be updated once.')
+        return value
@@ -0,0 +1,1134 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Aggregate, Avg, Case, Count, Exists, ExpressionWrapper, F, FloatField, Func,
+    IntegerField, OuterRef, Q, Subquery, Sum, TextField, Value, When
+)
+from django.db.models.functions import Coalesce, Concat, ExtractIsoWeekDay
+from django.utils import timezone
+from backend.cache import tiered_cache
+from backend.versioning import DataVersion
+from gamification.models import UserCounters
+from gamification.services import UserCounterService
+from standards.models import StandardProgress
+from .models import DailyProgress, DailySummary, Goal, GoalRollup, ProcessProgress, Reflection
+
+class GoalRollupService:
+    """Computes children_count and completion_percentage for a set of goals
+    with a fixed number of grouped aggregate queries, independent of the
+    size of the goal tree.
+
+    Pass complete=True when `goals` already holds every goal of the user's
+    tree; child statistics are then derived in memory and only the DP day
+    counts hit the database."""
+
+    def __init__(self, goals, complete=False):
+        self.goals = list(goals)
+        self.rollups = self._compute_in_memory() if complete else self._compute()
+
+    def get(self, goal):
+        return self.rollups.get(goal.id, {'children_count': 0, 'completion_percentage': 0})
+
+    @staticmethod
+    def dp_percentage(goal, completed_days):
+        total_days = (goal.target_date - goal.start_date).days + 1
+        return (completed_days / total_days * 100) if total_days > 0 else 0
+
+    @staticmethod
+    def ratio_percentage(completed, total):
+        return (completed / total * 100) if total else 0
+
+    def _completed_days(self, dp_ids):
+        if not dp_ids:
+            return {}
+        return dict(ProcessProgress.objects.filter(
+            process_id__in=dp_ids,
+            is_completed=True
+        ).values('process_id').annotate(
+            days=Count('id')
+        ).values_list('process_id', 'days'))
+
+    def _compute_in_memory(self):
+        children = defaultdict(list)
+        for goal in self.goals:
+            if goal.parent_id:
+                children[goal.parent_id].append(goal)
+
+        completed_days = self._completed_days(
+            [goal.id for goal in self.goals if goal.goal_type == 'DP']
+        )
+
+        def mtg_percentage(mtg):
+            dps = children[mtg.id]
+            return self.ratio_percentage(sum(dp.is_completed for dp in dps), len(dps))
+
+        rollups = {}
+        for goal in self.goals:
+            kids = children[goal.id]
+            if goal.goal_type == 'DP':
+                percentage = self.dp_percentage(goal, completed_days.get(goal.id, 0))
+            elif goal.goal_type == 'MTG':
+                percentage = mtg_percentage(goal)
+            else:  # BIG
+                percentage = (sum(mtg_percentage(mtg) for mtg in kids) / len(kids)) if kids else 0
+            rollups[goal.id] = {
+                'children_count': len(kids),
+                'completed_children_count': sum(kid.is_completed for kid in kids),
+                'completed_days': completed_days.get(goal.id, 0),
+                'completion_percentage': percentage,
+            }
+        return rollups
+
+    def _compute(self):
+        if not self.goals:
+            return {}
+
+        goal_ids = [goal.id for goal in self.goals]
+        dp_ids = [goal.id for goal in self.goals if goal.goal_type == 'DP']
+        big_ids = [goal.id for goal in self.goals if goal.goal_type == 'BIG']
+
+        # Direct children (totals and completed) for every goal in the set
+        child_stats = {
+            row['parent_id']: row
+            for row in Goal.objects.filter(
+                parent_id__in=goal_ids
+            ).values('parent_id').annotate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(is_completed=True))
+            )
+        }
+
+        # Completed days for DPs
+        completed_days = self._completed_days(dp_ids)
+
+        # Sum of MTG completion ratios under each BIG goal
+        big_sums = {}
+        if big_ids:
+            for row in Goal.objects.filter(
+                parent__parent_id__in=big_ids
+            ).values('parent__parent_id', 'parent_id').annotate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(is_completed=True))
+            ):
+                big_id = row['parent__parent_id']
+                big_sums[big_id] = big_sums.get(big_id, 0) + self.ratio_percentage(
+                    row['completed'], row['total']
+                )
+
+        rollups = {}
+        for goal in self.goals:
+            stats = child_stats.get(goal.id, {'total': 0, 'completed': 0})
+            if goal.goal_type == 'DP':
+                percentage = self.dp_percentage(goal, completed_days.get(goal.id, 0))
+            elif goal.goal_type == 'MTG':
+                percentage = self.ratio_percentage(stats['completed'], stats['total'])
+            else:  # BIG
+                percentage = (big_sums.get(goal.id, 0) / stats['total']) if stats['total'] else 0
+            rollups[goal.id] = {
+                'children_count': stats['total'],
+                'completed_children_count': stats['completed'],
+                'completed_days': completed_days.get(goal.id, 0),
+                'completion_percentage': percentage,
+            }
+        return rollups
+
+def get_goal_rollups(goals):
+    """Rollups for `goals`, read from the GoalRollup table (select_related
+    'rollup') and computed on the fly for goals that have no row yet."""
+    rollups = {}
+    missing = []
+    for goal in goals:
+        rollup = getattr(goal, 'rollup', None)
+        if rollup is None:
+            missing.append(goal)
+        else:
+            rollups[goal.id] = {
+                'children_count': rollup.children_count,
+                'completion_percentage': rollup.completion_percentage,
+            }
+    if missing:
+        rollups.update(GoalRollupService(missing).rollups)
+    return rollups
+
+class GoalRollupMaintainer:
+    """Keeps GoalRollup rows in sync with F-expression deltas.
+
+    DP rows track completed days, MTG rows the share of completed DPs and
+    BIG rows the average of their MTG percentages, so a change only touches
+    the goal itself and at most two ancestors."""
+
+    @staticmethod
+    def total_days(goal):
+        if goal.goal_type != 'DP':
+            return 0
+        return max((goal.target_date - goal.start_date).days + 1, 0)
+
+    @staticmethod
+    def _percentage(expression):
+        return ExpressionWrapper(expression, output_field=FloatField())
+
+    REBUILD_FIELDS = (
+        'completed_days', 'total_days', 'children_count',
+        'completed_children_count', 'children_percentage_sum',
+        'completion_percentage',
+    )
+
+    @classmethod
+    def expected_rollup(cls, goal, computed):
+        percentage = computed['completion_percentage']
+        return GoalRollup(
+            goal_id=goal.id,
+            completed_days=computed['completed_days'],
+            total_days=cls.total_days(goal),
+            children_count=computed['children_count'],
+            completed_children_count=computed['completed_children_count'],
+            children_percentage_sum=(
+                percentage * computed['children_count'] if goal.goal_type == 'BIG' else 0
+            ),
+            completion_percentage=percentage,
+        )
+
+    @classmethod
+    def drifted(cls, stored, expected):
+        for field in cls.REBUILD_FIELDS:
+            old, new = getattr(stored, field), getattr(expected, field)
+            if isinstance(new, float) and abs(old - new) < 1e-6:
+                continue
+            if old != new:
+                return True
+        return False
+
+    @classmethod
+    def rebuild(cls, user_id, dry_run=False):
+        """Recompute every rollup of a user from the source tables, creating
+        missing rows and fixing drifted ones. Returns (created, updated)."""
+        goals = list(Goal.objects.filter(user_id=user_id).select_related('rollup'))
+        computed = GoalRollupService(goals, complete=True).rollups
+
+        to_create, to_update = [], []
+        for goal in goals:
+            expected = cls.expected_rollup(goal, computed[goal.id])
+            stored = getattr(goal, 'rollup', None)
+            if stored is None:
+                to_create.append(expected)
+            elif cls.drifted(stored, expected):
+                to_update.append(expected)
+
+        if not dry_run and (to_create or to_update):
+            with transaction.atomic():
+                GoalRollup.objects.bulk_create(to_create, ignore_conflicts=True)
+                GoalRollup.objects.bulk_update(to_update, cls.REBUILD_FIELDS, batch_size=500)
+                DataVersion.bump(user_id, 'goals')
+        return len(to_create), len(to_update)
+
+    @classmethod
+    def recompute(cls, goal_ids):
+        """Recompute the rollups of `goal_ids` and their ancestors from the
+        source tables, for changes that can't be applied as deltas. Goals
+        that no longer exist are skipped."""
+        with transaction.atomic():
+            goals = {}
+            level = {goal_id for goal_id in goal_ids if goal_id}
+            while level:
+                found = list(Goal.objects.filter(id__in=level))
+                goals.update((goal.id, goal) for goal in found)
+                level = {goal.parent_id for goal in found if goal.parent_id} - goals.keys()
+            if not goals:
+                return 0
+
+            # Lock the rows the delta updates lock, so none lands in between
+            list(GoalRollup.objects.select_for_update().filter(
+                goal_id__in=goals.keys()
+            ).values_list('goal_id', flat=True))
+            computed = GoalRollupService(goals.values()).rollups
+            GoalRollup.objects.bulk_create(
+                [cls.expected_rollup(goal, computed[goal.id]) for goal in goals.values()],
+                update_conflicts=True,
+                unique_fields=['goal'],
+                update_fields=cls.REBUILD_FIELDS
+            )
+            for user_id in {goal.user_id for goal in goals.values()}:
+                DataVersion.bump(user_id, 'goals')
+        return len(goals)
+
+    @classmethod
+    def goal_created(cls, goal):
+        with transaction.atomic():
+            GoalRollup.objects.get_or_create(
+                goal=goal,
+                defaults={'total_days': cls.total_days(goal)}
+            )
+            if goal.parent_id:
+                cls._child_changed(goal.parent_id, goal.goal_type, 1, int(goal.is_completed), 0)
+
+    @classmethod
+    def goal_removed(cls, goal, parent_id, is_completed):
+        """Detach `goal` from its (previous) parent"""
+        if not parent_id:
+            return
+        percentage = 0
+        if goal.goal_type == 'MTG':
+            percentage = GoalRollup.objects.filter(goal_id=goal.id).values_list(
+                'completion_percentage', flat=True
+            ).first() or 0
+        with transaction.atomic():
+            cls._child_changed(parent_id, goal.goal_type, -1, -int(is_completed), -percentage)
+
+    @classmethod
+    def goal_changed(cls, goal, old_parent_id, was_completed, dates_changed):
+        with transaction.atomic():
+            if old_parent_id != goal.parent_id:
+                cls.goal_removed(goal, old_parent_id, was_completed)
+                if goal.parent_id:
+                    percentage = 0
+                    if goal.goal_type == 'MTG':
+                        percentage = GoalRollup.objects.filter(goal_id=goal.id).values_list(
+                            'completion_percentage', flat=True
+                        ).first() or 0
+                    cls._child_changed(
+                        goal.parent_id, goal.goal_type, 1, int(goal.is_completed), percentage
+                    )
+            elif was_completed != goal.is_completed and goal.parent_id:
+                cls._child_changed(
+                    goal.parent_id, goal.goal_type, 0, 1 if goal.is_completed else -1, 0
+                )
+
+            if dates_changed and goal.goal_type == 'DP':
+                total_days = cls.total_days(goal)
+                GoalRollup.objects.filter(goal_id=goal.id).update(
+                    total_days=total_days,
+                    completion_percentage=cls._percentage(
+                        F('completed_days') * 100.0 / total_days
+                    ) if total_days > 0 else Value(0.0)
+                )
+
+    @classmethod
+    def completed_days_changed(cls, deltas):
+        """Apply {dp_id: delta} changes in completed process progress"""
+        by_delta = defaultdict(list)
+        for dp_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(dp_id)
+
+        # One UPDATE per distinct delta (almost always just +1 and -1)
+        for delta, dp_ids in by_delta.items():
+            GoalRollup.objects.filter(goal_id__in=dp_ids).update(
+                completed_days=F('completed_days') + delta,
+                completion_percentage=Case(
+                    When(total_days__gt=0, then=cls._percentage(
+                        (F('completed_days') + delta) * 100.0 / F('total_days')
+                    )),
+                    default=Value(0.0),
+                    output_field=FloatField()
+                )
+            )
+
+    @classmethod
+    def _child_changed(cls, parent_id, child_type, count_delta, completed_delta, percentage_delta):
+        # Must run inside a transaction (MTG rows are locked)
+        if child_type == 'DP':
+            # MTG percentage feeds into the BIG average, so lock the row to
+            # know both the old and the new value
+            rollup = GoalRollup.objects.select_for_update().filter(
+                goal_id=parent_id
+            ).values(
+                'children_count', 'completed_children_count',
+                'completion_percentage', 'goal__parent_id'
+            ).first()
+            if rollup is None:
+                return
+            children = rollup['children_count'] + count_delta
+            completed = rollup['completed_children_count'] + completed_delta
+            percentage = GoalRollupService.ratio_percentage(completed, children)
+            GoalRollup.objects.filter(goal_id=parent_id).update(
+                children_count=F('children_count') + count_delta,
+                completed_children_count=F('completed_children_count') + completed_delta,
+                completion_percentage=percentage
+            )
+            big_id = rollup['goal__parent_id']
+            delta = percentage - rollup['completion_percentage']
+            if big_id and delta:
+                cls._child_changed(big_id, 'MTG', 0, 0, delta)
+        else:
+            GoalRollup.objects.filter(goal_id=parent_id).update(
+                children_count=F('children_count') + count_delta,
+                completed_children_count=F('completed_children_count') + completed_delta,
+                children_percentage_sum=F('children_percentage_sum') + percentage_delta,
+                completion_percentage=Case(
+                    When(children_count__gt=-count_delta, then=cls._percentage(
+                        (F('children_percentage_sum') + percentage_delta)
+                        / (F('children_count') + count_delta)
+                    )),
+                    default=Value(0.0),
+                    output_field=FloatField()
+                )
+            )
+
+class GoalTreeBuilder:
+    """Builds a user's BIG -> MTG -> DP hierarchy from a single goal query."""
+    GOAL_DEPTHS = {'BIG': 1, 'MTG': 2, 'DP': 3}
+
+    def __init__(self, user, max_depth=3, active_only=False):
+        self.user = user
+        self.max_depth = max_depth
+        self.active_only = active_only
+
+    def build(self):
+        """Return (roots, children, rollups) for the user's goal tree"""
+        goals = list(Goal.objects.filter(
+            user=self.user
+        ).select_related('rollup').order_by('start_date', 'title'))
+
+        # Rollups are computed over the full tree so percentages don't
+        # change with the filters applied below
+        if all(getattr(goal, 'rollup', None) is not None for goal in goals):
+            rollups = get_goal_rollups(goals)
+        else:
+            rollups = GoalRollupService(goals, complete=True).rollups
+
+        included = {
+            goal.id: goal for goal in goals
+            if self.GOAL_DEPTHS.get(goal.goal_type, 1) <= self.max_depth
+            and not (self.active_only and goal.is_completed)
+        }
+
+        roots = []
+        children = defaultdict(list)
+        for goal in included.values():
+            if goal.parent_id is None:
+                roots.append(goal)
+            elif goal.parent_id in included:
+                children[goal.parent_id].append(goal)
+
+        return roots, children, rollups
+
+class GoalChainHealthService:
+    """Per-BIG goal chain health, computed in a single grouped query and
+    cached per user until the user's goals or progress change."""
+
+    def __init__(self, user):
+        self.user = user
+        self.stale_days = settings.GOAL_HEALTH_STALE_DAYS
+
+    def get_snapshot(self):
+        key = tiered_cache.user_key(
+            self.user.id, 'goal_chain_health', ('goals', 'progress'), self.stale_days
+        )
+        return tiered_cache.get_or_set(key, self.compute, settings.GOAL_HEALTH_CACHE_TIMEOUT)
+
+    @staticmethod
+    def health_score(mtg_count, active_dp_count):
+        # Simple health score calculation
+        if mtg_count == 0:
+            return 0
+
+        mtg_score = min(mtg_count / 2, 1) * 0.4  # 40% weight for having proper MTGs
+        dp_score = min(active_dp_count / 2, 1) * 0.6  # 60% weight for active DPs
+
+        return (mtg_score + dp_score) * 100
+
+    def compute(self):
+        stale_since = timezone.now().date() - timedelta(days=self.stale_days)
+
+        # Active DPs under each BIG goal without a completed day in the window
+        recent_progress = ProcessProgress.objects.filter(
+            process=OuterRef('pk'),
+            is_completed=True,
+            daily_progress__date__gte=stale_since
+        )
+        stale_dps = Goal.objects.filter(
+            parent__parent=OuterRef('pk'),
+            goal_type='DP',
+            is_completed=False
+        ).filter(~Exists(recent_progress)).order_by().values(
+            'parent__parent'
+        ).annotate(count=Count('id')).values('count')
+
+        dp = Q(children__children__goal_type='DP', children__children__pending_deletion=False)
+        big_goals = Goal.objects.filter(
+            user=self.user,
+            goal_type='BIG',
+            is_completed=False
+        ).annotate(
+            mtg_count=Count('children', filter=Q(children__pending_deletion=False), distinct=True),
+            completed_mtg_count=Count(
+                'children',
+                filter=Q(children__is_completed=True, children__pending_deletion=False),
+                distinct=True
+            ),
+            dp_count=Count('children__children', filter=dp, distinct=True),
+            active_dp_count=Count(
+                'children__children',
+                filter=dp & Q(children__children__is_completed=False),
+                distinct=True
+            ),
+            stale_dp_count=Coalesce(
+                Subquery(stale_dps, output_field=IntegerField()), 0
+            ),
+        ).order_by('start_date', 'title').values(
+            'id', 'title', 'mtg_count', 'completed_mtg_count', 'dp_count',
+            'active_dp_count', 'stale_dp_count'
+        )
+
+        return [
+            {
+                'big_goal_id': str(big['id']),
+                'big_goal': big['title'],
+                'mtg_count': big['mtg_count'],
+                'completed_mtg_count': big['completed_mtg_count'],
+                'dp_count': big['dp_count'],
+                'active_dp_count': big['active_dp_count'],
+                'stale_dp_count': big['stale_dp_count'],
+                'health_score': self.health_score(big['mtg_count'], big['active_dp_count']),
+            }
+            for big in big_goals
+        ]
+
+class DailySummaryService:
+    """Maintains DailySummary rows, either with F-expression deltas from
+    individual progress writes or by recomputing days from source tables."""
+    FIELDS = (
+        'standards_completed', 'standards_total',
+        'processes_completed', 'processes_total', 'minutes',
+    )
+
+    @staticmethod
+    def day_of(daily_progress_id):
+        """(user_id, date) for a DailyProgress id, or None if it's gone"""
+        return DailyProgress.objects.filter(
+            pk=daily_progress_id
+        ).values_list('user_id', 'date').first()
+
+    @staticmethod
+    def is_active(completed):
+        return completed > 0
+
+    @classmethod
+    def apply(cls, user_id, date, create=True, **deltas):
+        """Add `deltas` to the user's summary for `date`.
+
+        With create=False a missing row is left alone, which is what
+        deletes want (a cascading user delete may already have removed it)."""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        completed_delta = deltas.get('processes_completed', 0) + deltas.get('standards_completed', 0)
+        # Atomic so the row stays locked until its new completed count is read
+        with transaction.atomic():
+            if cls._update(user_id, date, deltas, completed_delta) or not create:
+                return
+            try:
+                with transaction.atomic():
+                    DailySummary.objects.create(user_id=user_id, date=date, **deltas)
+                cls._count_active_day(user_id, 0, completed_delta)
+            except IntegrityError:
+                # Created concurrently, apply as an update instead
+                cls._update(user_id, date, deltas, completed_delta)
+
+    @classmethod
+    def _update(cls, user_id, date, deltas, completed_delta):
+        summaries = DailySummary.objects.filter(user_id=user_id, date=date)
+        updated = summaries.update(**{field: F(field) + delta for field, delta in deltas.items()})
+        if updated and completed_delta:
+            completed = summaries.values_list(
+                F('processes_completed') + F('standards_completed'), flat=True
+            ).get()
+            cls._count_active_day(user_id, completed - completed_delta, completed)
+        return updated
+
+    @classmethod
+    def _count_active_day(cls, user_id, before, after):
+        delta = int(cls.is_active(after)) - int(cls.is_active(before))
+        UserCounterService.increment(user_id, active_days=delta)
+
+    @classmethod
+    def refresh(cls, user_ids, dates=None):
+        """Recompute summaries of `user_ids` for `dates` (all dates when
+        None) from the progress tables. Returns the number of rows written."""
+        processes = ProcessProgress.objects.visible().filter(daily_progress__user_id__in=user_ids)
+        standards = StandardProgress.objects.filter(daily_progress__user_id__in=user_ids)
+        summaries = DailySummary.objects.filter(user_id__in=user_ids)
+        if dates is not None:
+            dates = set(dates)
+            processes = processes.filter(daily_progress__date__in=dates)
+            standards = standards.filter(daily_progress__date__in=dates)
+            summaries = summaries.filter(date__in=dates)
+
+        totals = defaultdict(lambda: dict.fromkeys(cls.FIELDS, 0))
+        for row in processes.values('daily_progress__user_id', 'daily_progress__date').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(is_completed=True)),
+            minutes=Sum('time_spent_minutes')
+        ):
+            day = totals[row['daily_progress__user_id'], row['daily_progress__date']]
+            day['processes_total'] = row['total']
+            day['processes_completed'] = row['completed']
+            day['minutes'] = row['minutes'] or 0
+        for row in standards.values('daily_progress__user_id', 'daily_progress__date').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(is_completed=True))
+        ):
+            day = totals[row['daily_progress__user_id'], row['daily_progress__date']]
+            day['standards_total'] = row['total']
+            day['standards_completed'] = row['completed']
+
+        existing = {(summary.user_id, summary.date): summary for summary in summaries}
+        to_create, to_update = [], []
+        active_days = defaultdict(int)
+        for key in set(totals) | set(existing):
+            values = totals.get(key, dict.fromkeys(cls.FIELDS, 0))
+            summary = existing.get(key)
+            before = 0 if summary is None else summary.processes_completed + summary.standards_completed
+            after = values['processes_completed'] + values['standards_completed']
+            active_days[key[0]] += int(cls.is_active(after)) - int(cls.is_active(before))
+            if summary is None:
+                user_id, date = key
+                to_create.append(DailySummary(user_id=user_id, date=date, **values))
+            elif any(getattr(summary, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(summary, field, value)
+                to_update.append(summary)
+
+        with transaction.atomic():
+            DailySummary.objects.bulk_create(to_create, ignore_conflicts=True)
+            DailySummary.objects.bulk_update(to_update, cls.FIELDS, batch_size=500)
+            for user_id, delta in active_days.items():
+                UserCounterService.increment(user_id, active_days=delta)
+        return len(to_create) + len(to_update)
+
+# Progress rows get deterministic ids so an entry keeps the same id whether
+# it's served virtually or materialized later (see VIRTUAL_DAILY_PROGRESS)
+PROGRESS_NAMESPACE = uuid.UUID('5b0f6c2e-8f3a-4d0b-9a51-3c1e2f7d9b64')
+
+def daily_progress_id(user_id, date):
+    return uuid.uuid5(PROGRESS_NAMESPACE, f'day:{user_id}:{date.isoformat()}')
+
+def process_progress_id(user_id, date, process_id):
+    return uuid.uuid5(PROGRESS_NAMESPACE, f'process:{user_id}:{date.isoformat()}:{process_id}')
+
+def standard_progress_id(user_id, date, standard_id):
+    return uuid.uuid5(PROGRESS_NAMESPACE, f'standard:{user_id}:{date.isoformat()}:{standard_id}')
+
+class DailyProgressMaterializer:
+    """Works out a date's DailyProgress rows and their process/standard
+    entries for many users at once.
+
+    materialize() reads everything first and only inserts what is missing,
+    with INSERT ... ON CONFLICT DO NOTHING so concurrent materializers for
+    the same day don't fail on unique_together. virtual_day() returns the
+    same entries without writing anything."""
+
+    def __init__(self, date):
+        self.date = date
+
+    def ensure_days(self, user_ids):
+        """{user_id: DailyProgress id} for every user, creating missing days"""
+        user_ids = [uuid.UUID(str(user_id)) for user_id in user_ids]
+        days = dict(DailyProgress.objects.filter(
+            user_id__in=user_ids,
+            date=self.date
+        ).values_list('user_id', 'id'))
+        missing = [user_id for user_id in user_ids if user_id not in days]
+        if missing:
+            DailyProgress.objects.bulk_create(
+                [
+                    DailyProgress(
+                        id=daily_progress_id(user_id, self.date),
+                        user_id=user_id,
+                        date=self.date
+                    )
+                    for user_id in missing
+                ],
+                ignore_conflicts=True
+            )
+            days.update(DailyProgress.objects.filter(
+                user_id__in=missing,
+                date=self.date
+            ).values_list('user_id', 'id'))
+        return days
+
+    def materialize(self, user_ids, processes=True, standards=True):
+        """Materialize the date for `user_ids`; returns {user_id: DailyProgress id}"""
+        days = self.ensure_days(user_ids)
+        created = 0
+        if processes:
+            created += self._insert(ProcessProgress, self.plan_processes(days))
+        if standards:
+            created += self._insert(StandardProgress, self.plan_standards(days))
+        if created:
+            DailySummaryService.refresh(list(days), dates=[self.date])
+        return days
+
+    def virtual_day(self, user):
+        """Existing or unsaved DailyProgress for `user`, with its stored
+        entries plus unsaved entries for everything not materialized yet.
+        Entries come back with their process/standard objects attached."""
+        day = DailyProgress.objects.filter(user=user, date=self.date).first()
+        if day is None:
+            day = DailyProgress(id=daily_progress_id(user.id, self.date), user=user, date=self.date)
+            processes, standards = [], []
+        else:
+            processes = list(ProcessProgress.objects.visible().filter(
+                daily_progress=day
+            ).select_related('process__parent'))
+            standards = list(StandardProgress.objects.filter(
+                daily_progress=day
+            ).select_related('standard__category'))
+
+        days = {user.id: day.id}
+        processes += self.plan_processes(days, related=True, existing_days={day.id: day})
+        standards += self.plan_standards(days, related=True, existing_days={day.id: day})
+        return day, processes, standards
+
+    def _insert(self, model, rows):
+        if rows:
+            model.objects.bulk_create(rows, ignore_conflicts=True)
+        return len(rows)
+
+    def _existing(self, model, field, days):
+        return set(model.objects.filter(
+            daily_progress_id__in=days.values()
+        ).values_list('daily_progress_id', field))
+
+    def plan_processes(self, days, related=False, existing_days=None):
+        """Unsaved ProcessProgress rows for active DPs that have no entry yet"""
+        existing = self._existing(ProcessProgress, 'process_id', days)
+
+        # All active DPs for the users
+        active_dps = Goal.objects.filter(
+            user_id__in=days.keys(),
+            goal_type='DP',
+            start_date__lte=self.date,
+            target_date__gte=self.date,
+            is_completed=False
+        )
+        if related:
+            active_dps = active_dps.select_related('parent')
+        else:
+            active_dps = active_dps.only('id', 'user_id')
+
+        progress = []
+        for dp in active_dps:
+            day_id = days[dp.user_id]
+            if (day_id, dp.id) in existing:
+                continue
+            entry = ProcessProgress(
+                id=process_progress_id(dp.user_id, self.date, dp.id),
+                daily_progress_id=day_id,
+                process_id=dp.id
+            )
+            if related:
+                entry.process = dp
+                entry.daily_progress = existing_days[day_id]
+            progress.append(entry)
+        return progress
+
+    def plan_standards(self, days, related=False, existing_days=None):
+        """Unsaved StandardProgress rows for active standards that need an entry"""
+        from standards.models import Standard
+
+        existing = self._existing(StandardProgress, 'standard_id', days)
+        active_standards = Standard.objects.filter(
+            user_id__in=days.keys(),
+            is_active=True,
+            frequency__in=('daily', 'weekly')
+        )
+        if related:
+            active_standards = list(active_standards.select_related('category'))
+        else:
+            active_standards = list(active_standards.only('id', 'user_id', 'frequency'))
+
+        # Weekly standards only need an entry if they're not already
+        # completed this week (Monday to Sunday)
+        week_start = self.date - timedelta(days=self.date.weekday())
+        completed_this_week = set(StandardProgress.objects.filter(
+            standard_id__in=[
+                standard.id for standard in active_standards
+                if standard.frequency == 'weekly'
+            ],
+            daily_progress__date__range=(week_start, week_start + timedelta(days=6)),
+            is_completed=True
+        ).values_list('standard_id', flat=True))
+
+        progress = []
+        for standard in active_standards:
+            day_id = days[standard.user_id]
+            if (day_id, standard.id) in existing or standard.id in completed_this_week:
+                continue
+            entry = StandardProgress(
+                id=standard_progress_id(standard.user_id, self.date, standard.id),
+                daily_progress_id=day_id,
+                standard_id=standard.id
+            )
+            if related:
+                entry.standard = standard
+                entry.daily_progress = existing_days[day_id]
+            progress.append(entry)
+        return progress
+
+    @classmethod
+    def touch_process(cls, user, progress_id, process_id, date, refresh=True):
+        """Persist a virtual ProcessProgress entry on first write; pass
+        refresh=False when the caller refreshes the day's summary itself.
+        Returns False if the id doesn't match the process and date."""
+        if process_progress_id(user.id, date, process_id) != progress_id:
+            return False
+        if not Goal.objects.filter(id=process_id, user=user, goal_type='DP').exists():
+            return False
+        materializer = cls(date)
+        days = materializer.ensure_days([user.id])
+        materializer._insert(ProcessProgress, [ProcessProgress(
+            id=progress_id, daily_progress_id=days[user.id], process_id=process_id
+        )])
+        if refresh:
+            DailySummaryService.refresh([user.id], dates=[date])
+        return True
+
+    @classmethod
+    def touch_standard(cls, user, progress_id, standard_id, date, refresh=True):
+        """Persist a virtual StandardProgress entry on first write (see
+        touch_process). Returns False if the id doesn't match the standard
+        and date."""
+        from standards.models import Standard
+
+        if standard_progress_id(user.id, date, standard_id) != progress_id:
+            return False
+        if not Standard.objects.filter(id=standard_id, user=user).exists():
+            return False
+        materializer = cls(date)
+        days = materializer.ensure_days([user.id])
+        materializer._insert(StandardProgress, [StandardProgress(
+            id=progress_id, daily_progress_id=days[user.id], standard_id=standard_id
+        )])
+        if refresh:
+            DailySummaryService.refresh([user.id], dates=[date])
+        return True
+
+class BulkProgressUpdater:
+    """Applies many process/standard progress updates in one transaction,
+    queueing everything completed in the gamification outbox with the same
+    per-day key as the single-entry views."""
+    PROCESS_FIELDS = ('is_completed', 'completion_time', 'time_spent_minutes', 'notes')
+    STANDARD_FIELDS = ('is_completed', 'completion_time', 'notes')
+
+    def __init__(self, user):
+        self.user = user
+
+    def apply(self, updates):
+        """Returns (processes, standards, events, missing_ids), `events`
+        being the newly queued GamificationEvents. Nothing is written when
+        any id can't be found."""
+        process_updates = {update['id']: update for update in updates if update['type'] == 'process'}
+        standard_updates = {update['id']: update for update in updates if update['type'] == 'standard'}
+
+        with transaction.atomic():
+            self._touch_virtual_entries(ProcessProgress, process_updates, 'process',
+                                        DailyProgressMaterializer.touch_process)
+            self._touch_virtual_entries(StandardProgress, standard_updates, 'standard',
+                                        DailyProgressMaterializer.touch_standard)
+
+            processes = list(ProcessProgress.objects.select_for_update(of=('self',)).filter(
+                id__in=process_updates.keys(),
+                daily_progress__user=self.user
+            ).select_related('process__parent', 'daily_progress'))
+            standards = list(StandardProgress.objects.select_for_update(of=('self',)).filter(
+                id__in=standard_updates.keys(),
+                daily_progress__user=self.user
+            ).select_related('standard__category', 'daily_progress'))
+
+            found = {progress.id for progress in processes + standards}
+            missing = [update_id for update_id in process_updates.keys() | standard_updates.keys()
+                       if update_id not in found]
+            if missing:
+                transaction.set_rollback(True)
+                return [], [], [], missing
+
+            from gamification.services import GamificationOutbox, GamificationService
+            now = timezone.now()
+            awards = []
+            rollup_deltas = defaultdict(int)
+            dates = set()
+
+            for progress in processes:
+                was_completed = self._apply(progress, process_updates[progress.id], now)
+                if was_completed != progress.is_completed:
+                    rollup_deltas[progress.process_id] += 1 if progress.is_completed else -1
+                    if progress.is_completed:
+                        awards.append((GamificationService.process_award(progress.process),
+                                       progress.daily_progress.date))
+                dates.add(progress.daily_progress.date)
+
+            standards_completed = 0
+            for progress in standards:
+                was_completed = self._apply(progress, standard_updates[progress.id], now)
+                standards_completed += int(progress.is_completed) - int(was_completed)
+                if not was_completed and progress.is_completed:
+                    awards.append((GamificationService.standard_award(progress.standard),
+                                   progress.daily_progress.date))
+                dates.add(progress.daily_progress.date)
+
+            # bulk_update skips signals, so rollups and summaries are
+            # updated here in one pass
+            ProcessProgress.objects.bulk_update(processes, self.PROCESS_FIELDS)
+            StandardProgress.objects.bulk_update(standards, self.STANDARD_FIELDS)
+            GoalRollupMaintainer.completed_days_changed(rollup_deltas)
+            DailySummaryService.refresh([self.user.id], dates=dates)
+            UserCounterService.increment(self.user.id, standards_completed=standards_completed)
+            DataVersion.bump(self.user.id, 'progress')
+
+            events = GamificationOutbox.record_many(self.user.id, awards)
+
+        return processes, standards, events, []
+
+    @staticmethod
+    def _apply(progress, update, now):
+        was_completed = progress.is_completed
+        if 'is_completed' in update:
+            progress.is_completed = update['is_completed']
+            if progress.is_completed and not was_completed:
+                progress.completion_time = now
+        for field in ('time_spent_minutes', 'notes'):
+            if field in update:
+                setattr(progress, field, update[field])
+        return was_completed
+
+    def _touch_virtual_entries(self, model, updates, reference_field, touch):
+        """Persist virtual entries (see VIRTUAL_DAILY_PROGRESS) that carry a reference and date"""
+        candidates = {
+            update_id: update for update_id, update in updates.items()
+            if update.get(reference_field) and update.get('date')
+        }
+        if not candidates:
+            return
+        existing = set(model.objects.filter(id__in=candidates.keys()).values_list('id', flat=True))
+        for update_id, update in candidates.items():
+            if update_id not in existing and update['date'] <= timezone.now().date():
+                # apply() refreshes the summaries of every date it touches once
+                touch(self.user, update_id, update[reference_field], update['date'], refresh=False)
+
+
+class PercentileCont(Aggregate):
+    """Postgres percentile_cont(fraction) WITHIN GROUP (ORDER BY expression)"""
+    function = 'PERCENTILE_CONT'
+    name = 'PercentileCont'
+    output_field = FloatField()
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, fraction, **extra):
+        fraction = float(fraction)
+        if not 0 <= fraction <= 1:
+            raise ValueError('fraction must be between 0 and 1.')
+        super().__init__(expression, fraction=fraction, **extra)
+
+class TimeAllocationService:
+    """Time spent on daily processes, broken down by one or more dimensions
+    over several date windows.
+
+    Each dimension is a single grouped query; every window is a FILTERed
+    aggregate in that query, so the cost doesn't grow with the number of
+    windows. Only entries with time logged count towards the statistics."""
+
+    DIMENSIONS = {
+        'category': {'key': F('process__category'), 'label': F('process__category')},
+        'mtg': {'key': F('process__parent_id'), 'label': F('process__parent__title')},
+        'big': {'key': F('process__parent__parent_id'), 'label': F('process__parent__parent__title')},
+        'weekday': {'key': ExtractIsoWeekDay('daily_progress__date'), 'label': ExtractIsoWeekDay('daily_progress__date')},
+    }
+
+    def __init__(self, user, windows):
+        """`windows` is a list of (start_date, end_date) tuples, both inclusive"""
+        self.user = user
+        self.windows = list(windows)
+
+    def _queryset(self):
+        return ProcessProgress.objects.visible().filter(
+            daily_progress__user=self.user,
+            daily_progress__date__range=(
+                min(start for start, _ in self.windows),
+                max(end for _, end in self.windows)
+            ),
+            time_spent_minutes__gt=0
+        )
+
+    def _aggregates(self):
+        aggregates = {}
+        for index, (start, end) in enumerate(self.windows):
+            in_window = Q(daily_progress__date__range=(start, end))
+            aggregates.update({
+                f'sum_{index}': Sum('time_spent_minutes', filter=in_window),
+                f'mean_{index}': Avg('time_spent_minutes', filter=in_window),
+                f'p50_{index}': PercentileCont('time_spent_minutes', 0.5, filter=in_window),
+                f'p90_{index}': PercentileCont('time_spent_minutes', 0.9, filter=in_window),
+                f'active_days_{index}': Count('daily_progress__date', distinct=True, filter=in_window),
+            })
+        return aggregates
+
+    def breakdown(self, dimension):
+        """One entry per group with the statistics of every window, in window order"""
+        expressions = self.DIMENSIONS[dimension]
+        rows = self._queryset().values(
+            key=expressions['key'], label=expressions['label']
+        ).annotate(**self._aggregates()).order_by('key')
+
+        groups = []
+        for row in rows:
+            groups.append({
+                'key': row['key'],
+                'label': row['label'],
+                'windows': [
+                    {
+                        'total_minutes': row[f'sum_{index}'] or 0,
+                        'mean_minutes': row[f'mean_{index}'],
+                        'p50_minutes': row[f'p50_{index}'],
+                        'p90_minutes': row[f'p90_{index}'],
+                        'active_days': row[f'active_days_{index}'],
+                    }
+                    for index in range(len(self.windows))
+                ]
+            })
+        return groups
+
+class ReflectionSearchService:
+    """Full-text search over a user's reflections using the stored,
+    GIN-indexed `search_vector` column."""
+
+    CONFIG = 'english'
+    # Field weights: content ranks above highlights/challenges, then action items
+    WEIGHTS = (
+        ('content', 'A'),
+        ('highlights', 'B'),
+        ('challenges', 'B'),
+        ('action_items', 'C'),
+    )
+    TEXT_FIELDS = tuple(field for field, _ in WEIGHTS)
+
+    @staticmethod
+    def _text(field):
+        if field == 'content':
+            return F(field)
+        return Func(F(field), Value(' '), function='array_to_string', output_field=TextField())
+
+    @classmethod
+    def document(cls):
+        vector = None
+        for field, weight in cls.WEIGHTS:
+            part = SearchVector(cls._text(field), weight=weight, config=cls.CONFIG)
+            vector = part if vector is None else vector + part
+        return vector
+
+    @classmethod
+    def refresh(cls, queryset):
+        """Recompute the stored vectors of `queryset` in a single UPDATE"""
+        return queryset.update(search_vector=cls.document())
+
+    @classmethod
+    def search(cls, user, text, reflection_type=None, start_date=None, end_date=None):
+        """Matching reflections ordered by rank, annotated with `rank` and a
+        `headline` excerpt with the matched terms highlighted"""
+        query = SearchQuery(text, search_type='websearch', config=cls.CONFIG)
+        reflections = Reflection.objects.filter(user=user, search_vector=query)
+        if reflection_type:
+            reflections = reflections.filter(reflection_type=reflection_type)
+        # Reflections overlapping the requested period
+        if start_date:
+            reflections = reflections.filter(end_date__gte=start_date)
+        if end_date:
+            reflections = reflections.filter(start_date__lte=end_date)
+
+        document = Concat(
+            *[part for field in cls.TEXT_FIELDS for part in (cls._text(field), Value(' '))][:-1],
+            output_field=TextField()
+        )
+        return reflections.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                document, query, config=cls.CONFIG,
+                start_sel='<mark>', stop_sel='</mark>', max_fragments=3
+            )
+        ).order_by('-rank', '-start_date', '-id')
+
+def delete_in_chunks(table, condition, params=(), pk='id', chunk_size=None):
+    """DELETE rows of `table` matching the SQL `condition` in chunks of
+    `chunk_size`, each in its own short transaction, so locks are held
+    briefly whatever the total. Returns the number of deleted rows."""
+    chunk_size = chunk_size or settings.DELETE_CHUNK_SIZE
+    sql = (
+        f'DELETE FROM {table} WHERE {pk} IN '
+        f'(SELECT {pk} FROM {table} WHERE {condition} LIMIT %s)'
+    )
+    total = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [*params, chunk_size])
+            deleted = cursor.rowcount
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+class GoalDeletionService:
+    """Deletes goal subtrees. Small subtrees go through the ORM as before;
+    large ones are hidden immediately (pending_deletion) and removed by a
+    Celery task with set-based DELETEs."""
+
+    @staticmethod
+    def subtree_ids(goal):
+        ids, level = [goal.id], [goal.id]
+        while level:
+            level = list(Goal.all_objects.filter(parent_id__in=level).values_list('id', flat=True))
+            ids.extend(level)
+        return ids
+
+    @classmethod
+    def delete(cls, goal):
+        """Delete `goal` and its descendants; returns True when deferred to the background"""
+        from .tasks import purge_goals
+
+        ids = cls.subtree_ids(goal)
+        threshold = settings.ASYNC_DELETE_THRESHOLD
+        if ProcessProgress.objects.filter(process_id__in=ids)[:threshold].count() < threshold:
+            goal.delete()
+            return False
+
+        with transaction.atomic():
+            counts = Goal.objects.filter(id__in=ids).values('goal_type').annotate(
+                total=Count('id'),
+                completed=Count('id', filter=Q(is_completed=True))
+            )
+            deltas = {}
+            for row in counts:
+                total_field, completed_field = UserCounters.goal_fields(row['goal_type'])
+                deltas[total_field], deltas[completed_field] = -row['total'], -row['completed']
+            UserCounterService.increment(goal.user_id, **deltas)
+            Goal.all_objects.filter(id__in=ids).update(pending_deletion=True)
+            # Their progress is hidden from now on, so the days it counted
+            # in are summed again without it
+            dates = ProcessProgress.objects.filter(process_id__in=ids).values_list(
+                'daily_progress__date', flat=True
+            ).distinct()
+            DailySummaryService.refresh([goal.user_id], dates=list(dates))
+            # The pre_delete signal won't run for the raw deletes
+            GoalRollupMaintainer.goal_removed(goal, goal.parent_id, goal.is_completed)
+            transaction.on_commit(
+                lambda: purge_goals.delay([str(goal_id) for goal_id in ids], str(goal.user_id))
+            )
+            DataVersion.bump(goal.user_id, 'goals', 'progress')
+        return True
+
+    @classmethod
+    def purge(cls, goal_ids, user_id):
+        """Remove goals marked pending and everything that references them"""
+        goal_ids = [uuid.UUID(str(goal_id)) for goal_id in goal_ids]
+        delete_in_chunks('process_progress', 'process_id = ANY(%s)', [goal_ids])
+        # Goals reference each other, so they go in one transaction; a
+        # subtree holds few goals compared to its progress rows
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DELETE FROM goal_rollups WHERE goal_id = ANY(%s)', [goal_ids])
+            cursor.execute(
+                'DELETE FROM goals WHERE id = ANY(%s) AND pending_deletion', [goal_ids]
+            )
+        DailySummaryService.refresh([user_id])
+        DataVersion.bump(user_id, 'goals', 'progress')
@@ -0,0 +1,164 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from backend.versioning import DataVersion
+from gamification.services import UserCounterService
+from .models import DailyProgress, Goal, ProcessProgress, Reflection
+from .services import (
+    DailySummaryService, GoalRollupMaintainer, ReflectionSearchService
+)
+
+ROLLUP_FIELDS = ('parent_id', 'is_completed', 'start_date', 'target_date')
+
+@receiver(post_init, sender=Goal)
+def remember_goal_state(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields aren't loaded; a state with
+    # any of them deferred is unknown (None)
+    values = instance.__dict__
+    if instance.get_deferred_fields() & set(ROLLUP_FIELDS):
+        instance._rollup_state = None
+    else:
+        instance._rollup_state = tuple(values.get(field) for field in ROLLUP_FIELDS)
+    instance._counter_state = (values.get('goal_type'), values.get('is_completed'))
+
+@receiver(post_save, sender=Goal)
+def update_goal_rollups(sender, instance, created, **kwargs):
+    if created:
+        GoalRollupMaintainer.goal_created(instance)
+    elif instance._rollup_state is None:
+        # The previous parent isn't known, so rebuild the user's tree
+        transaction.on_commit(lambda: GoalRollupMaintainer.rebuild(instance.user_id))
+    else:
+        parent_id, was_completed, start_date, target_date = instance._rollup_state
+        GoalRollupMaintainer.goal_changed(
+            instance,
+            old_parent_id=parent_id,
+            was_completed=was_completed,
+            dates_changed=(start_date, target_date) != (instance.start_date, instance.target_date)
+        )
+        # Drop a cached rollup so the response reflects the new values
+        instance._state.fields_cache.pop('rollup', None)
+
+    # A state read with deferred fields is unknown; the nightly
+    # reconciliation picks up whatever such a save changed
+    old_state = None if created else instance._counter_state
+    new_state = (instance.goal_type, instance.is_completed)
+    if old_state != new_state and None not in (old_state or ()):
+        UserCounterService.goal_changed(instance.user_id, old_state, new_state)
+    remember_goal_state(sender, instance)
+
+@receiver(pre_delete, sender=Goal)
+def detach_goal_rollup(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        # Deltas of goals deleted together interfere (a DP pushing into an
+        # MTG that goes too), so the surviving parents are recomputed once
+        parent_ids = getattr(origin, '_rollup_parent_ids', None)
+        if parent_ids is None:
+            parent_ids = origin._rollup_parent_ids = set()
+            transaction.on_commit(lambda: GoalRollupMaintainer.recompute(parent_ids))
+        parent_ids.add(instance.parent_id)
+    elif origin is None or (isinstance(origin, Goal) and origin.pk == instance.pk):
+        if instance._rollup_state is None:
+            parent_id, was_completed = Goal.all_objects.filter(
+                pk=instance.pk
+            ).values_list('parent_id', 'is_completed').get()
+        else:
+            parent_id, was_completed, _, _ = instance._rollup_state
+        GoalRollupMaintainer.goal_removed(instance, parent_id, was_completed)
+    # Otherwise the goal goes with an ancestor (or its user), whose own
+    # removal detaches the whole subtree
+
+@receiver(post_delete, sender=Goal)
+def uncount_goal(sender, instance, **kwargs):
+    # Goals pending deletion were uncounted when they were marked
+    if not instance.pending_deletion and None not in instance._counter_state:
+        UserCounterService.goal_changed(instance.user_id, old=instance._counter_state)
+
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+def bump_goal_version(sender, instance, **kwargs):
+    DataVersion.bump(instance.user_id, 'goals')
+
+@receiver(post_save, sender=DailyProgress)
+@receiver(post_delete, sender=DailyProgress)
+@receiver(post_save, sender=Reflection)
+@receiver(post_delete, sender=Reflection)
+def bump_progress_version(sender, instance, **kwargs):
+    DataVersion.bump(instance.user_id, 'progress')
+
+@receiver(post_init, sender=ProcessProgress)
+def remember_progress_state(sender, instance, **kwargs):
+    # Deferred fields are unknown (None), not "not completed"
+    deferred = instance.get_deferred_fields()
+    values = instance.__dict__
+    instance._rollup_completed = (
+        None if 'is_completed' in deferred else bool(values.get('is_completed'))
+    )
+    instance._summary_minutes = (
+        None if 'time_spent_minutes' in deferred else int(values.get('time_spent_minutes') or 0)
+    )
+
+def recompute_progress_totals(instance, day):
+    """Fallback for an entry whose previous values weren't loaded"""
+    GoalRollupMaintainer.recompute([instance.process_id])
+    if day:
+        DailySummaryService.refresh([day[0]], dates=[day[1]])
+
+@receiver(post_save, sender=ProcessProgress)
+def track_progress_save(sender, instance, created, **kwargs):
+    if not created and None in (instance._rollup_completed, instance._summary_minutes):
+        day = DailySummaryService.day_of(instance.daily_progress_id)
+        DataVersion.bump(day[0], 'progress')
+        recompute_progress_totals(instance, day)
+        remember_progress_state(sender, instance)
+        return
+
+    was_completed = False if created else instance._rollup_completed
+    if was_completed != instance.is_completed:
+        GoalRollupMaintainer.completed_days_changed({
+            instance.process_id: 1 if instance.is_completed else -1
+        })
+
+    completed_delta = int(bool(instance.is_completed)) - int(was_completed)
+    minutes = int(instance.time_spent_minutes or 0)
+    minutes_delta = minutes - (0 if created else instance._summary_minutes)
+    day = DailySummaryService.day_of(instance.daily_progress_id)
+    DataVersion.bump(day[0], 'progress')
+    if created or completed_delta or minutes_delta:
+        DailySummaryService.apply(
+            *day,
+            processes_total=int(created),
+            processes_completed=completed_delta,
+            minutes=minutes_delta
+        )
+
+    instance._rollup_completed = bool(instance.is_completed)
+    instance._summary_minutes = minutes
+
+@receiver(post_delete, sender=ProcessProgress)
+def track_progress_delete(sender, instance, **kwargs):
+    # The day may already be gone when a DailyProgress or user delete cascades
+    day = DailySummaryService.day_of(instance.daily_progress_id)
+    if None in (instance._rollup_completed, instance._summary_minutes):
+        if day:
+            DataVersion.bump(day[0], 'progress')
+        recompute_progress_totals(instance, day)
+        return
+
+    if instance._rollup_completed:
+        GoalRollupMaintainer.completed_days_changed({instance.process_id: -1})
+    if day:
+        DataVersion.bump(day[0], 'progress')
+        DailySummaryService.apply(
+            *day, create=False,
+            processes_total=-1,
+            processes_completed=-int(instance._rollup_completed),
+            minutes=-instance._summary_minutes
+        )
+
+@receiver(post_save, sender=Reflection)
+def update_reflection_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(ReflectionSearchService.TEXT_FIELDS):
+        return
+    ReflectionSearchService.refresh(Reflection.objects.filter(pk=instance.pk))
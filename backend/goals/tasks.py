@@ -0,0 +1,46 @@
+from datetime import date as date_cls, timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from users.models import User
+from .services import DailyProgressMaterializer, GoalDeletionService
+
+@shared_task
+def materialize_daily_progress(date=None):
+    """Fan out materialization of `date` (default: tomorrow) in user batches.
+    Does nothing with VIRTUAL_DAILY_PROGRESS, where rows are written on
+    first update instead."""
+    if settings.VIRTUAL_DAILY_PROGRESS:
+        return 0
+    if date is None:
+        date = (timezone.now().date() + timedelta(days=1)).isoformat()
+
+    batch_size = settings.DAILY_PROGRESS_MATERIALIZE_BATCH_SIZE
+    user_ids = User.objects.filter(
+        is_active=True
+    ).order_by('pk').values_list('pk', flat=True)
+
+    batch = []
+    batches = 0
+    for user_id in user_ids.iterator(chunk_size=batch_size):
+        batch.append(str(user_id))
+        if len(batch) == batch_size:
+            materialize_daily_progress_batch.delay(batch, date)
+            batch = []
+            batches += 1
+    if batch:
+        materialize_daily_progress_batch.delay(batch, date)
+        batches += 1
+    return batches
+
+@shared_task
+def materialize_daily_progress_batch(user_ids, date):
+    """Create DailyProgress, ProcessProgress and StandardProgress rows for one batch of users"""
+    DailyProgressMaterializer(date_cls.fromisoformat(date)).materialize(user_ids)
+    return len(user_ids)
+
+@shared_task
+def purge_goals(goal_ids, user_id):
+    """Delete a goal subtree marked pending by GoalDeletionService"""
+    GoalDeletionService.purge(goal_ids, user_id)
+    return len(goal_ids)
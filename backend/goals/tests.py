@@ -1,3 +1,995 @@
-from django.test import TestCase
+import random
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from backend.cache import LocalLRUCache, TieredCache
+from backend.pagination import KeysetPagination
+from backend.versioning import check_shared_cache
+from gamification.leaderboard import leaderboard, period_start, window_leaderboard
+from gamification.models import PointBucket, PointTransaction, UserCounters, UserProfile
+from gamification.services import GamificationOutbox, PointBucketService, PointCalculator, UserCounterService
+from standards.models import Standard, StandardCategory, StandardProgress
+from users.models import User
+from .models import DailyProgress, DailySummary, Goal, ProcessProgress, Reflection
+from .services import (
+    DailyProgressMaterializer, DailySummaryService, GoalChainHealthService, GoalDeletionService,
+    GoalRollupMaintainer, GoalRollupService, TimeAllocationService, process_progress_id
+)
+from .tasks import materialize_daily_progress
 
-# Create your tests here.
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are checked against Postgres')
+@override_settings(LEADERBOARD_STORE='memory')
+class QueryPlanTests(TestCase):
+    """Runs EXPLAIN on every query issued by the hot read endpoints against a
+    seeded, analyzed database and fails when a large table is read with a
+    sequential scan, i.e. when a query stops matching its index.
+
+    Leaderboards are ranked from a sorted set, as in production with Redis;
+    the database fallback counts the ranked rows."""
+
+    USERS = 500
+    # Users with only a profile, so the leaderboard reads a realistically
+    # sized table by key
+    RANKED_USERS = 20000
+    DAYS = 14
+    LARGE_TABLES = (
+        'goals', 'daily_progress', 'process_progress', 'daily_summaries',
+        'standard_progress', 'point_transactions', 'user_game_profiles',
+        'point_buckets', 'leaderboard_snapshots',
+    )
+    ENDPOINTS = (
+        '/api/goals/',
+        '/api/goals/?fields=id,title,parent&expand=parent',
+        '/api/goals/tree/',
+        '/api/goals/type/DP/',
+        '/api/goals/analytics/goal-chain-health/',
+        '/api/goals/analytics/time-allocation/',
+        '/api/goals/progress/history/?start={start}&end={today}',
+        '/api/goals/daily-progress/date/{today}/',
+        '/api/standards/progress/date/{today}/',
+        '/api/gamification/stats/',
+        '/api/gamification/points/history/?type=process',
+        '/api/gamification/points/history/?days=7',
+        '/api/gamification/points/history/?cursor=',
+        '/api/gamification/leaderboard/',
+        '/api/gamification/leaderboard/?offset=5000&limit=50&around=10',
+        '/api/gamification/leaderboard/week/?around=10',
+        '/api/gamification/leaderboard/week/?date={last_week}&offset=5000&around=10',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        rnd = random.Random(0)
+        today = timezone.now().date()
+        start = today - timedelta(days=cls.DAYS - 1)
+        users = User.objects.bulk_create([
+            User(username=f'plan{index}', email=f'plan{index}@example.com')
+            for index in range(cls.USERS)
+        ])
+
+        goals, processes, days, summaries, transactions = [], [], [], [], []
+        categories, standards = [], []
+        for user in users:
+            for b in range(2):
+                big = Goal(user=user, goal_type='BIG', title='BIG', description='', category='c',
+                           start_date=start, target_date=today + timedelta(days=90))
+                goals.append(big)
+                for m in range(3):
+                    mtg = Goal(user=user, parent=big, goal_type='MTG', title='MTG', description='',
+                               category='c', start_date=start, target_date=today + timedelta(days=60))
+                    goals.append(mtg)
+                    for d in range(3):
+                        process = Goal(user=user, parent=mtg, goal_type='DP', title='DP', description='',
+                                       category=rnd.choice(['a', 'b']), start_date=start,
+                                       target_date=today + timedelta(days=30),
+                                       is_completed=rnd.random() < 0.2)
+                        goals.append(process)
+                        processes.append(process)
+            category = StandardCategory(user=user, name='Health')
+            categories.append(category)
+            standards.append(Standard(user=user, category=category, title='S', description='',
+                                      minimum_requirement='', frequency='daily'))
+            for offset in range(cls.DAYS):
+                date = start + timedelta(days=offset)
+                days.append(DailyProgress(user=user, date=date))
+                summaries.append(DailySummary(user=user, date=date))
+            for offset in range(40):
+                transactions.append(PointTransaction(
+                    user=user, points=10, description='', activity_date=today,
+                    transaction_type=rnd.choice(['process', 'standard', 'achievement'])
+                ))
+
+        Goal.objects.bulk_create(goals)
+        StandardCategory.objects.bulk_create(categories)
+        Standard.objects.bulk_create(standards)
+        DailyProgress.objects.bulk_create(days)
+        DailySummary.objects.bulk_create(summaries)
+        PointTransaction.objects.bulk_create(transactions)
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, total_points=rnd.randint(0, 5000)) for user in users
+        ])
+
+        processes_by_user = {}
+        for process in processes:
+            processes_by_user.setdefault(process.user_id, []).append(process)
+        standards_by_user = {standard.user_id: standard for standard in standards}
+        ProcessProgress.objects.bulk_create([
+            ProcessProgress(daily_progress=day, process=process, is_completed=rnd.random() < 0.5,
+                            time_spent_minutes=rnd.randint(0, 60))
+            for day in days for process in processes_by_user[day.user_id]
+        ])
+        StandardProgress.objects.bulk_create([
+            StandardProgress(daily_progress=day, standard=standards_by_user[day.user_id],
+                             is_completed=rnd.random() < 0.5)
+            for day in days
+        ])
+
+        ranked = User.objects.bulk_create([
+            User(username=f'ranked{index}', email=f'ranked{index}@example.com')
+            for index in range(cls.RANKED_USERS)
+        ], batch_size=5000)
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, total_points=rnd.randint(0, 5000)) for user in ranked
+        ], batch_size=5000)
+
+        this_week = period_start('week', today)
+        last_week = this_week - timedelta(days=7)
+        PointBucket.objects.bulk_create([
+            PointBucket(user=user, period='week', period_start=week, points=rnd.randint(1, 500))
+            for user in ranked for week in (last_week, this_week)
+        ], batch_size=5000)
+
+        cls.user = users[0]
+        UserProfile.objects.filter(user=cls.user).update(total_points=10000)
+        # As after `rebuild_leaderboard` on deploy and the nightly snapshot
+        leaderboard.rebuild()
+        window_leaderboard('week', this_week).rebuild()
+        PointBucketService.snapshot('week', last_week)
+
+        with connection.cursor() as cursor:
+            for table in cls.LARGE_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assert_indexed(self, endpoints, exempt=lambda sql: False):
+        today = timezone.now().date()
+        start = today - timedelta(days=self.DAYS - 1)
+        for endpoint in endpoints:
+            url = endpoint.format(
+                today=today, start=start, last_week=period_start('week', today) - timedelta(days=7)
+            )
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+                for query in queries.captured_queries:
+                    if not query['sql'].lstrip().upper().startswith('SELECT') or exempt(query['sql']):
+                        continue
+                    plan = self.explain(query['sql'])
+                    for table in self.LARGE_TABLES:
+                        self.assertNotIn(
+                            f'Seq Scan on {table}', plan,
+                            f'{url} scans {table} sequentially:\n{query["sql"]}\n{plan}'
+                        )
+
+    def test_hot_queries_use_indexes(self):
+        self.assert_indexed(self.ENDPOINTS)
+
+    @override_settings(LEADERBOARD_STORE='database')
+    def test_database_leaderboard_queries_use_indexes(self):
+        # Without Redis the board size is a plain COUNT over every ranked
+        # row; that linear cost is documented at LEADERBOARD_STORE. Scores,
+        # ranks and pages must still come from the ranking indexes
+        def board_size(sql):
+            return 'COUNT(*)' in sql and '>' not in sql
+
+        self.assert_indexed(
+            [endpoint for endpoint in self.ENDPOINTS if 'leaderboard' in endpoint], exempt=board_size
+        )
+
+def create_goal(user, goal_type, parent=None, days=10, **fields):
+    today = timezone.now().date()
+    return Goal.objects.create(
+        user=user, parent=parent, goal_type=goal_type, title=goal_type, description='',
+        category='c', start_date=today - timedelta(days=days - 1), target_date=today, **fields
+    )
+
+def create_tree(user, mtgs=2, dps=2, days=4):
+    """A BIG with `mtgs` MTGs of `dps` DPs each, some completed, and a
+    DailyProgress per day with a ProcessProgress per DP"""
+    today = timezone.now().date()
+    big = create_goal(user, 'BIG', days=days)
+    processes = []
+    for m in range(mtgs):
+        mtg = create_goal(user, 'MTG', parent=big, days=days)
+        for d in range(dps):
+            processes.append(create_goal(
+                user, 'DP', parent=mtg, days=days, is_completed=(m + d) % 2 == 0
+            ))
+    for offset in range(days):
+        day, _ = DailyProgress.objects.get_or_create(user=user, date=today - timedelta(days=offset))
+        for index, process in enumerate(processes):
+            ProcessProgress.objects.create(
+                daily_progress=day, process=process,
+                is_completed=(index + offset) % 3 == 0, time_spent_minutes=10
+            )
+    return big
+
+def source_rollup(goal):
+    """Rollup of one goal computed the way the serializer used to, goal by goal"""
+    children = list(goal.children.all())
+    if goal.goal_type == 'DP':
+        total_days = (goal.target_date - goal.start_date).days + 1
+        completed = goal.progress.filter(is_completed=True).count()
+        percentage = completed / total_days * 100 if total_days > 0 else 0
+    elif goal.goal_type == 'MTG':
+        percentage = sum(child.is_completed for child in children) / len(children) * 100 if children else 0
+    else:
+        percentage = sum(source_rollup(child)['completion_percentage'] for child in children) / len(children) \
+            if children else 0
+    return {'children_count': len(children), 'completion_percentage': percentage}
+
+class GoalRollupServiceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('rollup-list', 'rollup-list@example.com', 'pw')
+        create_tree(self.user, mtgs=3, dps=2)
+        create_goal(self.user, 'BIG')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_grouped_and_in_memory_match_each_goal(self):
+        goals = list(Goal.objects.filter(user=self.user))
+        grouped = GoalRollupService(goals).rollups
+        in_memory = GoalRollupService(goals, complete=True).rollups
+        for goal in goals:
+            expected = source_rollup(goal)
+            for rollups in (grouped, in_memory):
+                self.assertEqual(rollups[goal.id]['children_count'], expected['children_count'])
+                self.assertAlmostEqual(
+                    rollups[goal.id]['completion_percentage'], expected['completion_percentage']
+                )
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/goals/?page_size=2')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/goals/?page_size=100')
+        self.assertEqual(len(small), len(large))
+        for data in response.data['results']:
+            expected = source_rollup(Goal.objects.get(pk=data['id']))
+            self.assertEqual(data['children_count'], expected['children_count'])
+            self.assertAlmostEqual(data['completion_percentage'], expected['completion_percentage'])
+
+class GoalTreeViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tree', 'tree@example.com', 'pw')
+        self.big = create_tree(self.user, mtgs=2, dps=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tree_nests_every_goal_with_its_rollup(self):
+        response = self.client.get('/api/goals/tree/')
+        self.assertEqual(response.status_code, 200)
+
+        seen = []
+
+        def walk(nodes, parent_id):
+            for node in nodes:
+                goal = Goal.objects.get(pk=node['id'])
+                self.assertEqual(goal.parent_id, parent_id)
+                self.assertEqual(len(node['children']), node['children_count'])
+                self.assertAlmostEqual(
+                    node['completion_percentage'], source_rollup(goal)['completion_percentage']
+                )
+                seen.append(goal.id)
+                walk(node['children'], goal.id)
+
+        walk(response.data, None)
+        self.assertCountEqual(seen, Goal.objects.filter(user=self.user).values_list('id', flat=True))
+
+    def test_depth_and_active_filters(self):
+        response = self.client.get('/api/goals/tree/?depth=1')
+        self.assertEqual([node['children'] for node in response.data], [[]])
+        self.assertEqual(self.client.get('/api/goals/tree/?depth=4').status_code, 400)
+
+        Goal.objects.filter(parent=self.big).update(is_completed=True)
+        response = self.client.get('/api/goals/tree/?active=true')
+        self.assertEqual(response.data[0]['children'], [])
+
+    def test_query_count_is_independent_of_tree_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/goals/tree/')
+        create_tree(self.user, mtgs=3, dps=3)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get('/api/goals/tree/')
+        self.assertEqual(len(small), len(large))
+
+class RollupMaintenanceTests(TestCase):
+    """Stored GoalRollups must match a recompute from the source tables
+    after every kind of change"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rollups', 'rollups@example.com', 'pw')
+        self.big = create_tree(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRollupsMatchSource(self):
+        self.assertEqual(GoalRollupMaintainer.rebuild(self.user.id, dry_run=True), (0, 0))
+
+    def mtg(self):
+        return Goal.objects.filter(parent=self.big).order_by('id').first()
+
+    def test_incremental_changes(self):
+        self.assertRollupsMatchSource()
+        process = Goal.objects.filter(user=self.user, goal_type='DP').first()
+        process.is_completed = not process.is_completed
+        process.target_date += timedelta(days=3)
+        process.save()
+        self.assertRollupsMatchSource()
+
+        entry = ProcessProgress.objects.filter(process=process).first()
+        entry.is_completed = not entry.is_completed
+        entry.save()
+        self.assertRollupsMatchSource()
+
+        other_mtg = Goal.objects.filter(parent=self.big).exclude(pk=process.parent_id).first()
+        process.parent = other_mtg
+        process.save()
+        self.assertRollupsMatchSource()
+
+    def test_cascade_delete_through_the_api(self):
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f'/api/goals/{self.mtg().id}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertRollupsMatchSource()
+            create_goal(self.user, 'MTG', parent=self.big)
+
+    def test_queryset_delete_recomputes_surviving_parents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Goal.objects.filter(parent=self.mtg()).delete()
+        self.assertRollupsMatchSource()
+
+        # An MTG together with a DP of another MTG
+        create_goal(self.user, 'DP', parent=self.mtg(), is_completed=True)
+        mtg = Goal.objects.filter(parent=self.big).order_by('-id').first()
+        process = Goal.objects.filter(goal_type='DP', user=self.user).exclude(parent=mtg).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Goal.objects.filter(pk__in=[mtg.pk, process.pk]).delete()
+        self.assertRollupsMatchSource()
+
+    def test_saves_from_deferred_instances(self):
+        entry = ProcessProgress.objects.filter(
+            process__user=self.user, is_completed=True
+        ).only('id', 'notes').first()
+        entry.notes = 'deferred'
+        entry.save()
+        self.assertRollupsMatchSource()
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+
+        entry = ProcessProgress.objects.filter(process__user=self.user).defer('is_completed').first()
+        entry.delete()
+        self.assertRollupsMatchSource()
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+
+        process = Goal.objects.filter(user=self.user, goal_type='DP').only('id', 'user_id').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            process.is_completed = True
+            process.save()
+        self.assertRollupsMatchSource()
+
+class GoalChainHealthTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('health', 'health@example.com', 'pw')
+        self.big = create_tree(self.user, mtgs=3, dps=2, days=2)
+        self.service = GoalChainHealthService(self.user)
+
+    def test_counts_match_the_tree(self):
+        [health] = self.service.compute()
+        mtgs = Goal.objects.filter(parent=self.big)
+        dps = Goal.objects.filter(parent__parent=self.big)
+        stale_since = timezone.now().date() - timedelta(days=self.service.stale_days)
+        recent = ProcessProgress.objects.filter(
+            is_completed=True, daily_progress__date__gte=stale_since
+        ).values('process_id')
+        stale = dps.filter(is_completed=False).exclude(id__in=recent)
+        self.assertEqual(health['big_goal_id'], str(self.big.id))
+        self.assertEqual(health['mtg_count'], mtgs.count())
+        self.assertEqual(health['completed_mtg_count'], mtgs.filter(is_completed=True).count())
+        self.assertEqual(health['dp_count'], dps.count())
+        self.assertEqual(health['active_dp_count'], dps.filter(is_completed=False).count())
+        self.assertEqual(health['stale_dp_count'], stale.count())
+        self.assertEqual(
+            health['health_score'], self.service.health_score(mtgs.count(), health['active_dp_count'])
+        )
+
+    def test_snapshot_is_cached_until_goals_change(self):
+        first = self.service.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.service.get_snapshot(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_goal(self.user, 'MTG', parent=self.big)
+        self.assertEqual(self.service.get_snapshot()[0]['mtg_count'], first[0]['mtg_count'] + 1)
+
+class DailySummaryTests(TestCase):
+    """DailySummary rows kept by deltas must equal a recompute from the
+    progress tables"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('summary', 'summary@example.com', 'pw')
+        create_tree(self.user, mtgs=1, dps=3, days=3)
+        category = StandardCategory.objects.create(user=self.user, name='Health')
+        self.standard = Standard.objects.create(
+            user=self.user, category=category, title='S', description='',
+            minimum_requirement='', frequency='daily'
+        )
+        for day in DailyProgress.objects.filter(user=self.user):
+            StandardProgress.objects.create(daily_progress=day, standard=self.standard)
+
+    def assertSummariesMatchSource(self):
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+
+    def test_progress_writes(self):
+        self.assertSummariesMatchSource()
+        entry = ProcessProgress.objects.filter(daily_progress__user=self.user).first()
+        entry.is_completed = not entry.is_completed
+        entry.time_spent_minutes = 45
+        entry.save()
+        self.assertSummariesMatchSource()
+
+        standard_entry = StandardProgress.objects.filter(daily_progress__user=self.user).first()
+        standard_entry.is_completed = True
+        standard_entry.save()
+        self.assertSummariesMatchSource()
+
+        entry.delete()
+        standard_entry.delete()
+        self.assertSummariesMatchSource()
+
+        DailyProgress.objects.filter(user=self.user).first().delete()
+        self.assertSummariesMatchSource()
+
+    def test_writes_from_deferred_instances(self):
+        entry = StandardProgress.objects.filter(daily_progress__user=self.user).only('id', 'notes').first()
+        StandardProgress.objects.filter(pk=entry.pk).update(is_completed=True)
+        DailySummaryService.refresh([self.user.id])
+        entry.notes = 'deferred'
+        entry.save()
+        self.assertSummariesMatchSource()
+
+        StandardProgress.objects.filter(daily_progress__user=self.user).defer('is_completed').first().delete()
+        self.assertSummariesMatchSource()
+
+    def test_history_is_read_from_the_summaries(self):
+        today = timezone.now().date()
+        start = today - timedelta(days=4)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/goals/progress/history/?start={start}&end={today}')
+        self.assertEqual(len(response.data), 5)
+        for summary in DailySummary.objects.filter(user=self.user):
+            day = response.data[summary.date.isoformat()]
+            self.assertEqual(day['processes_completed'], ProcessProgress.objects.filter(
+                daily_progress__user=self.user, daily_progress__date=summary.date, is_completed=True
+            ).count())
+            self.assertEqual(day['standards_total'], 1)
+        self.assertEqual(response.data[start.isoformat()]['processes_total'], 0)
+
+class MaterializeDailyProgressTests(TestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(f'materialize{index}', f'materialize{index}@example.com', 'pw')
+            for index in range(2)
+        ]
+        self.tomorrow = timezone.now().date() + timedelta(days=1)
+        for user in self.users:
+            big = create_goal(user, 'BIG', days=1)
+            mtg = create_goal(user, 'MTG', parent=big, days=1)
+            for completed in (False, False, True):
+                Goal.objects.filter(pk=create_goal(user, 'DP', parent=mtg, days=1).pk).update(
+                    target_date=self.tomorrow, is_completed=completed
+                )
+            category = StandardCategory.objects.create(user=user, name='Health')
+            Standard.objects.create(user=user, category=category, title='S', description='',
+                                    minimum_requirement='', frequency='daily')
+
+    def test_materializes_active_processes_and_standards_once(self):
+        materializer = DailyProgressMaterializer(self.tomorrow)
+        days = materializer.materialize([user.id for user in self.users])
+        self.assertEqual(len(days), 2)
+        for user in self.users:
+            self.assertEqual(ProcessProgress.objects.filter(
+                daily_progress__user=user, daily_progress__date=self.tomorrow
+            ).count(), 2)
+            self.assertEqual(StandardProgress.objects.filter(
+                daily_progress__user=user, daily_progress__date=self.tomorrow
+            ).count(), 1)
+        self.assertEqual(DailySummaryService.refresh([user.id for user in self.users]), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            materializer.materialize([user.id for user in self.users])
+        self.assertFalse([query for query in queries if query['sql'].startswith('INSERT')])
+
+    @override_settings(VIRTUAL_DAILY_PROGRESS=False, DAILY_PROGRESS_MATERIALIZE_BATCH_SIZE=1)
+    def test_task_fans_out_in_batches(self):
+        with mock.patch('goals.tasks.materialize_daily_progress_batch.delay') as delay:
+            batches = materialize_daily_progress()
+        self.assertEqual(batches, User.objects.filter(is_active=True).count())
+        self.assertEqual(delay.call_args.args[1], self.tomorrow.isoformat())
+
+@override_settings(VIRTUAL_DAILY_PROGRESS=True)
+class VirtualDailyProgressTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('virtual', 'virtual@example.com', 'pw')
+        self.today = timezone.now().date()
+        big = create_goal(self.user, 'BIG')
+        mtg = create_goal(self.user, 'MTG', parent=big)
+        self.processes = [create_goal(self.user, 'DP', parent=mtg) for _ in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_by_date_view_writes_nothing(self):
+        response = self.client.get(f'/api/goals/daily-progress/date/{self.today}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {entry['id'] for entry in response.data['process_progress']},
+            {str(process_progress_id(self.user.id, self.today, process.id)) for process in self.processes}
+        )
+        self.assertFalse(DailyProgress.objects.filter(user=self.user).exists())
+        self.assertFalse(DailySummary.objects.filter(user=self.user).exists())
+
+    def test_first_update_persists_the_entry(self):
+        process = self.processes[0]
+        progress_id = process_progress_id(self.user.id, self.today, process.id)
+        response = self.client.patch(f'/api/goals/process-progress/{progress_id}/', {
+            'process': str(process.id), 'date': str(self.today), 'is_completed': True
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(ProcessProgress.objects.get(pk=progress_id).is_completed)
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+
+        # The id must match the process and date
+        response = self.client.patch(f'/api/goals/process-progress/{uuid.uuid4()}/', {
+            'process': str(process.id), 'date': str(self.today), 'is_completed': True
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_update_refreshes_each_day_once(self):
+        updates = [
+            {'type': 'process', 'id': str(process_progress_id(self.user.id, self.today, process.id)),
+             'process': str(process.id), 'date': str(self.today), 'is_completed': True}
+            for process in self.processes
+        ]
+        with mock.patch.object(
+            DailySummaryService, 'refresh', wraps=DailySummaryService.refresh
+        ) as refresh:
+            response = self.client.post('/api/progress/bulk/', {'updates': updates}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(ProcessProgress.objects.filter(
+            daily_progress__user=self.user, is_completed=True
+        ).count(), 3)
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+
+    def test_nightly_materialization_is_skipped(self):
+        with mock.patch('goals.tasks.materialize_daily_progress_batch.delay') as delay:
+            self.assertEqual(materialize_daily_progress(), 0)
+        delay.assert_not_called()
+
+class BulkProgressUpdateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bulk', 'bulk@example.com', 'pw')
+        self.today = timezone.now().date()
+        create_tree(self.user, mtgs=2, dps=5, days=1)
+        ProcessProgress.objects.filter(daily_progress__user=self.user).update(is_completed=False)
+        DailySummaryService.refresh([self.user.id])
+        GoalRollupMaintainer.rebuild(self.user.id)
+        self.entries = list(ProcessProgress.objects.filter(daily_progress__user=self.user))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, entries, **fields):
+        return self.client.post('/api/progress/bulk/', {'updates': [
+            {'type': 'process', 'id': str(entry.id), **fields} for entry in entries
+        ]}, format='json')
+
+    def process_awards(self):
+        GamificationOutbox.drain(self.user.id)
+        return PointTransaction.objects.filter(user=self.user, transaction_type='process').count()
+
+    def test_query_count_does_not_grow_with_the_updates(self):
+        # The first request also creates per-user rows
+        self.post(self.entries[:1], notes='first')
+        with CaptureQueriesContext(connection) as few:
+            self.post(self.entries[:2], time_spent_minutes=30, notes='few')
+        with CaptureQueriesContext(connection) as many:
+            self.post(self.entries[2:], time_spent_minutes=30, notes='many')
+        self.assertEqual(len(few), len(many))
+
+    def test_completions_update_every_derived_store(self):
+        response = self.post(self.entries[:6], is_completed=True, time_spent_minutes=20)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['process_progress']), 6)
+        self.assertEqual(self.process_awards(), 6)
+
+        self.assertEqual(GoalRollupMaintainer.rebuild(self.user.id, dry_run=True), (0, 0))
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_points, PointTransaction.objects.filter(
+            user=self.user
+        ).aggregate(total=Sum('points'))['total'])
+
+    def test_unchecking_and_rechecking_awards_once(self):
+        first = self.post(self.entries[:2], is_completed=True)
+        self.post(self.entries[:2], is_completed=False)
+        again = self.post(self.entries[:2], is_completed=True)
+        self.assertEqual(first.data['points_queued'], 2 * PointCalculator.PROCESS_POINTS)
+        self.assertEqual(again.data['points_queued'], 0)
+        self.assertEqual(self.process_awards(), 2)
+
+    def test_bulk_and_single_updates_share_the_outbox_key(self):
+        entry = self.entries[0]
+        self.client.patch(f'/api/goals/process-progress/{entry.id}/', {'is_completed': True}, format='json')
+        self.post([entry], is_completed=False)
+        response = self.post([entry], is_completed=True)
+        self.assertEqual(response.data['points_queued'], 0)
+        self.assertEqual(GamificationOutbox.drain(self.user.id), 1)
+        self.assertEqual(self.process_awards(), 1)
+
+    def test_unknown_ids_write_nothing(self):
+        response = self.client.post('/api/progress/bulk/', {'updates': [
+            {'type': 'process', 'id': str(self.entries[0].id), 'is_completed': True},
+            {'type': 'process', 'id': str(uuid.uuid4()), 'is_completed': True},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ProcessProgress.objects.filter(pk=self.entries[0].pk, is_completed=True).exists())
+        self.assertEqual(self.process_awards(), 0)
+
+def percentile(values, fraction):
+    """Linear interpolation between closest ranks, as percentile_cont"""
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class TimeAllocationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('allocation', 'allocation@example.com', 'pw')
+        self.today = timezone.now().date()
+        create_tree(self.user, mtgs=2, dps=2, days=10)
+        for index, entry in enumerate(ProcessProgress.objects.filter(daily_progress__user=self.user)):
+            entry.time_spent_minutes = (index * 7) % 50
+            entry.save()
+        self.windows = [(self.today - timedelta(days=2), self.today), (self.today - timedelta(days=9), self.today)]
+
+    def test_category_statistics_per_window(self):
+        groups = TimeAllocationService(self.user, self.windows).breakdown('category')
+        self.assertEqual([group['key'] for group in groups], ['c'])
+        for (start, end), stats in zip(self.windows, groups[0]['windows']):
+            entries = ProcessProgress.objects.filter(
+                daily_progress__user=self.user, daily_progress__date__range=(start, end),
+                time_spent_minutes__gt=0
+            )
+            minutes = [entry.time_spent_minutes for entry in entries]
+            self.assertEqual(stats['total_minutes'], sum(minutes))
+            self.assertAlmostEqual(float(stats['mean_minutes']), sum(minutes) / len(minutes))
+            self.assertAlmostEqual(stats['p50_minutes'], percentile(minutes, 0.5))
+            self.assertAlmostEqual(stats['p90_minutes'], percentile(minutes, 0.9))
+            self.assertEqual(
+                stats['active_days'], entries.values('daily_progress__date').distinct().count()
+            )
+
+    def test_one_query_per_dimension_whatever_the_windows(self):
+        windows = [(self.today - timedelta(days=days - 1), self.today) for days in range(1, 13)]
+        service = TimeAllocationService(self.user, windows)
+        for dimension in TimeAllocationService.DIMENSIONS:
+            with self.assertNumQueries(1):
+                groups = service.breakdown(dimension)
+            self.assertTrue(all(len(group['windows']) == 12 for group in groups))
+
+    def test_view_rejects_bad_parameters(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/goals/analytics/time-allocation/'
+        self.assertEqual(client.get(f'{url}?windows=7,30&group_by=category,mtg').status_code, 200)
+        self.assertEqual(client.get(f'{url}?group_by=colour').status_code, 400)
+        self.assertEqual(client.get(f'{url}?windows=abc').status_code, 400)
+
+@mock.patch.object(KeysetPagination, 'page_size', 3)
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('keyset', 'keyset@example.com', 'pw')
+        for _ in range(4):
+            create_goal(self.user, 'BIG')
+        # Ties on created_at are broken by id
+        Goal.objects.filter(user=self.user).update(created_at=timezone.now())
+        for _ in range(4):
+            create_goal(self.user, 'BIG')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_goal_once_in_order(self):
+        ids, pages = self.walk('/api/goals/?cursor=')
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [
+            str(goal_id) for goal_id in Goal.objects.filter(
+                user=self.user
+            ).order_by('-created_at', '-id').values_list('id', flat=True)
+        ])
+
+    def test_deep_pages_skip_offset_and_count(self):
+        response = self.client.get('/api/goals/?cursor=')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+        sql = ' '.join(query['sql'] for query in queries).upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_pages_without_a_cursor_and_bad_cursors(self):
+        self.assertEqual(self.client.get('/api/goals/').data['count'], 8)
+        self.assertEqual(self.client.get('/api/goals/?cursor=not-a-cursor').status_code, 404)
+
+    def test_unordered_querysets_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            KeysetPagination.get_ordering(Goal.objects.order_by())
+
+class ReflectionSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('search', 'search@example.com', 'pw')
+        today = timezone.now().date()
+        self.running = Reflection.objects.create(
+            user=self.user, reflection_type='weekly', start_date=today - timedelta(days=6),
+            end_date=today, content='Kept running every morning before work',
+            highlights=['finished the ten kilometre run'], challenges=['sleep']
+        )
+        self.reading = Reflection.objects.create(
+            user=self.user, reflection_type='monthly', start_date=today - timedelta(days=60),
+            end_date=today - timedelta(days=31), content='Read two books',
+            action_items=['go running on weekends']
+        )
+        other = User.objects.create_user('search-other', 'search-other@example.com', 'pw')
+        Reflection.objects.create(user=other, reflection_type='weekly', start_date=today,
+                                  end_date=today, content='running')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get(f'/api/goals/reflections/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_matches_are_ranked_by_field_weight(self):
+        results = self.search('q=run')
+        self.assertEqual([item['id'] for item in results], [str(self.running.id), str(self.reading.id)])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertIn('<mark>', results[0]['headline'])
+
+    def test_filters_and_updates(self):
+        self.assertEqual(len(self.search('q=run&type=monthly')), 1)
+        self.assertEqual(len(self.search(f'q=run&start={timezone.now().date()}')), 1)
+        self.assertEqual([item['id'] for item in self.search('q=books')], [str(self.reading.id)])
+
+        self.reading.content = 'Swam in the lake'
+        self.reading.save()
+        self.assertEqual(self.search('q=books'), [])
+        self.assertEqual(self.client.get('/api/goals/reflections/search/').status_code, 400)
+
+@override_settings(ASYNC_DELETE_THRESHOLD=5)
+class GoalDeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('deletion', 'deletion@example.com', 'pw')
+        self.big = create_tree(self.user, mtgs=2, dps=2, days=3)
+        UserCounterService.rebuild(self.user.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertDerivedDataMatchesSource(self):
+        self.assertEqual(GoalRollupMaintainer.rebuild(self.user.id, dry_run=True), (0, 0))
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+        counters = UserCounters.objects.get(user=self.user)
+        for field, value in UserCounterService.source_counts([self.user.id])[self.user.id].items():
+            self.assertEqual(getattr(counters, field), value, field)
+
+    def test_small_subtrees_are_deleted_in_the_request(self):
+        process = Goal.objects.filter(user=self.user, goal_type='DP').first()
+        response = self.client.delete(f'/api/goals/{process.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Goal.all_objects.filter(pk=process.pk).exists())
+        self.assertDerivedDataMatchesSource()
+
+    def test_large_subtrees_are_hidden_then_purged(self):
+        mtg = Goal.objects.filter(parent=self.big).first()
+        ids = GoalDeletionService.subtree_ids(mtg)
+        with mock.patch('goals.tasks.purge_goals.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(f'/api/goals/{mtg.id}/')
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once()
+        self.assertEqual(len(self.client.get('/api/goals/').data['results']), 4)
+        self.assertDerivedDataMatchesSource()
+
+        # Until the purge runs, only the two remaining processes are counted
+        today = timezone.now().date()
+        history = self.client.get(
+            f'/api/goals/progress/history/?start={today - timedelta(days=2)}&end={today}'
+        ).data
+        self.assertEqual({day['processes_total'] for day in history.values()}, {2})
+        self.assertEqual(sum(day['minutes'] for day in history.values()), 3 * 2 * 10)
+        [group] = TimeAllocationService(self.user, [(today - timedelta(days=2), today)]).breakdown('category')
+        self.assertEqual(group['windows'][0]['total_minutes'], 3 * 2 * 10)
+        day = self.client.get(f'/api/goals/daily-progress/date/{today}/').data
+        self.assertEqual(len(day['process_progress']), 2)
+        self.assertTrue(ProcessProgress.objects.filter(process_id__in=ids).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GoalDeletionService.purge(*delay.call_args.args)
+        self.assertFalse(Goal.all_objects.filter(id__in=ids).exists())
+        self.assertFalse(ProcessProgress.objects.filter(process_id__in=ids).exists())
+        self.assertDerivedDataMatchesSource()
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('fieldsets', 'fieldsets@example.com', 'pw')
+        self.big = create_tree(self.user, mtgs=2, dps=2, days=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields_trim_the_response_and_its_queries(self):
+        full = self.client.get('/api/goals/').data['results']
+        with CaptureQueriesContext(connection) as trimmed_queries:
+            trimmed = self.client.get('/api/goals/?fields=id,title').data['results']
+        self.assertIn('completion_percentage', full[0])
+        self.assertEqual([set(goal) for goal in trimmed], [{'id', 'title'}] * len(full))
+        self.assertNotIn('goal_rollups', ' '.join(query['sql'] for query in trimmed_queries))
+
+    def test_expansions_nest_summaries_without_extra_queries_per_goal(self):
+        with CaptureQueriesContext(connection) as queries:
+            goals = self.client.get('/api/goals/?fields=id,parent,children&expand=parent,children').data['results']
+        by_id = {goal['id']: goal for goal in goals}
+        for goal in Goal.objects.filter(user=self.user):
+            data = by_id[str(goal.id)]
+            self.assertEqual(data['parent'] and data['parent']['id'], goal.parent_id and str(goal.parent_id))
+            self.assertCountEqual(
+                [child['id'] for child in data['children']],
+                [str(child_id) for child_id in goal.children.values_list('id', flat=True)]
+            )
+        create_tree(self.user, mtgs=2, dps=2, days=2)
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get('/api/goals/?fields=id,parent,children&expand=parent,children')
+        self.assertEqual(len(queries), len(more_queries))
+
+    def test_process_progress_fields_and_expansion(self):
+        entry = ProcessProgress.objects.filter(daily_progress__user=self.user).first()
+        data = self.client.get(
+            f'/api/goals/process-progress/{entry.id}/?fields=id,is_completed,process&expand=process'
+        ).data
+        self.assertEqual(set(data), {'id', 'is_completed', 'process'})
+        self.assertEqual(data['process']['id'], str(entry.process_id))
+        self.assertEqual(data['process']['title'], 'DP')
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('etags', 'etags@example.com', 'pw')
+        self.big = create_tree(self.user, mtgs=1, dps=2, days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_data_is_answered_with_304_before_any_query(self):
+        etag = self.client.get('/api/goals/tree/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/goals/tree/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(self.client.get('/api/goals/tree/?depth=1')['ETag'], etag)
+
+    def test_committed_writes_change_the_etag(self):
+        etag = self.client.get('/api/goals/tree/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = ProcessProgress.objects.filter(daily_progress__user=self.user).first()
+            entry.is_completed = not entry.is_completed
+            entry.save()
+        response = self.client.get('/api/goals/tree/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Another user's writes don't
+        other = User.objects.create_user('etags-other', 'etags-other@example.com', 'pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_goal(other, 'BIG')
+        self.assertEqual(
+            self.client.get('/api/goals/tree/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+
+    def test_deployments_need_a_shared_cache(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['backend.W001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tiered', 'tiered@example.com', 'pw')
+        create_tree(self.user, mtgs=1, dps=2, days=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_local_lru_evicts_and_expires(self):
+        lru = LocalLRUCache(max_entries=2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        lru.set('d', 4, -1)
+        self.assertIsNone(lru.get('d'))
+
+    def test_shared_cache_fills_the_local_tier(self):
+        tiered = TieredCache(max_entries=10)
+        other_process = TieredCache(max_entries=10)
+        tiered.set('key', {'value': 1})
+        self.assertIsNone(other_process.local.get('key'))
+        self.assertEqual(other_process.get('key'), {'value': 1})
+        self.assertEqual(other_process.local.get('key'), {'value': 1})
+
+    def test_responses_are_served_from_cache_until_a_write(self):
+        url = '/api/goals/analytics/time-allocation/?windows=7,30'
+        first = self.client.get(url).data
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).data, first)
+        self.assertEqual(queries.captured_queries, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = ProcessProgress.objects.filter(daily_progress__user=self.user).first()
+            entry.time_spent_minutes += 100
+            entry.save()
+        second = self.client.get(url).data
+        self.assertEqual(
+            second['breakdown']['category'][0]['windows'][0]['total_minutes'],
+            first['breakdown']['category'][0]['windows'][0]['total_minutes'] + 100
+        )
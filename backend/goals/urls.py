@@ -6,6 +6,7 @@ app_name = 'goals'
 urlpatterns = [
     # Goals
     path('', views.GoalListCreateView.as_view(), name='goal-list'),
+    path('tree/', views.GoalTreeView.as_view(), name='goal-tree'),
     path('<uuid:pk>/', views.GoalDetailView.as_view(), name='goal-detail'),
     path('type/<str:goal_type>/', views.GoalsByTypeView.as_view(), name='goals-by-type'),
     path('<uuid:pk>/children/', views.GoalChildrenView.as_view(), name='goal-children'),
@@ -21,6 +22,7 @@ urlpatterns = [
     
     # Reflections
     path('reflections/', views.ReflectionListCreateView.as_view(), name='reflection-list'),
+    path('reflections/search/', views.ReflectionSearchView.as_view(), name='reflection-search'),
     path('reflections/<uuid:pk>/', views.ReflectionDetailView.as_view(), name='reflection-detail'),
     path('reflections/type/<str:reflection_type>/', views.ReflectionsByTypeView.as_view(), name='reflections-by-type'),
     
@@ -1,97 +1,202 @@
-from rest_framework import generics, permissions, status
+from rest_framework import generics, permissions, status, serializers
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, Q
+from django.db import transaction
+from django.db.models import Count, Q, Prefetch
+from django.conf import settings
+from django.http import Http404
 from django.utils import timezone
 from datetime import timedelta, datetime
-from .models import Goal, DailyProgress, ProcessProgress, Reflection
+import uuid
+from backend.cache import CachedResponseMixin
+from backend.fieldsets import SparseFieldsetViewMixin
+from backend.pagination import KeysetPagination, OptionalKeysetPagination
+from backend.versioning import ConditionalGetMixin
+from .models import Goal, DailyProgress, DailySummary, ProcessProgress, Reflection
 from .serializers import (
     GoalSerializer,
     DailyProgressSerializer,
     ProcessProgressSerializer,
-    ReflectionSerializer
+    ReflectionSerializer,
+    ReflectionSearchSerializer,
+    BulkProgressUpdateSerializer
 )
+from .services import (
+    BulkProgressUpdater,
+    DailyProgressMaterializer,
+    DailySummaryService,
+    GoalChainHealthService,
+    GoalDeletionService,
+    GoalTreeBuilder,
+    ReflectionSearchService,
+    TimeAllocationService,
+    get_goal_rollups
+)
+
+class GoalFieldsetMixin(SparseFieldsetViewMixin):
+    """Joins the rollup table only when a rollup field is requested"""
+    select_related_fields = {name: ('rollup',) for name in GoalSerializer.ROLLUP_FIELDS}
+    expand_select_related = {'parent': ('parent',)}
+    expand_prefetch_related = {'children': ('children',)}
+
+    def rollups_wanted(self):
+        return any(self.field_wanted(name) for name in GoalSerializer.ROLLUP_FIELDS)
+
+class GoalRollupMixin(GoalFieldsetMixin):
+    """Resolves goal rollups for every goal being serialized in a list
+    response, so the query count doesn't grow with the goal tree."""
 
-class GoalListCreateView(generics.ListCreateAPIView):
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and args and self.rollups_wanted():
+            goals = list(args[0])
+            args = (goals,) + args[1:]
+            context = kwargs.setdefault('context', self.get_serializer_context())
+            context['rollups'] = get_goal_rollups(goals)
+        return super().get_serializer(*args, **kwargs)
+
+class GoalListCreateView(ConditionalGetMixin, GoalRollupMixin, generics.ListCreateAPIView):
     serializer_class = GoalSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Goal.objects.filter(user=self.request.user)
+        return self.apply_fieldsets(
+            Goal.objects.filter(user=self.request.user)
+        ).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class GoalDetailView(generics.RetrieveUpdateDestroyAPIView):
+class GoalDetailView(ConditionalGetMixin, GoalFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = GoalSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
 
     def get_queryset(self):
-        return Goal.objects.filter(user=self.request.user)
+        return self.apply_fieldsets(Goal.objects.filter(user=self.request.user))
+
+    def destroy(self, request, *args, **kwargs):
+        # Large subtrees are removed in the background
+        deferred = GoalDeletionService.delete(self.get_object())
+        return Response(status=status.HTTP_202_ACCEPTED if deferred else status.HTTP_204_NO_CONTENT)
 
     def perform_update(self, serializer):
-        # Get the original instance before update
-        instance = self.get_object()
-        was_completed = instance.is_completed
-        
-        # Save the update
-        updated_instance = serializer.save()
-        
-        # If goal was just completed, award points
-        if not was_completed and updated_instance.is_completed:
-            from gamification.services import GamificationService
-            gamification = GamificationService(self.request.user)
-            
-            if updated_instance.goal_type == 'BIG':
-                gamification.complete_big(updated_instance)
-            elif updated_instance.goal_type == 'MTG':
-                gamification.complete_mtg(updated_instance)
-        
+        was_completed = serializer.instance.is_completed
+
+        with transaction.atomic():
+            updated_instance = serializer.save()
+
+            # If goal was just completed, queue its points
+            if not was_completed and updated_instance.is_completed:
+                from gamification.services import GamificationOutbox, GamificationService
+                award = {
+                    'BIG': GamificationService.big_award,
+                    'MTG': GamificationService.mtg_award,
+                }.get(updated_instance.goal_type)
+                if award is not None:
+                    # Counted for the day the goal was completed on
+                    today = timezone.now().date()
+                    GamificationOutbox.record(
+                        self.request.user.id, award(updated_instance),
+                        min(updated_instance.completion_date or today, today)
+                    )
+
         return updated_instance
 
-class GoalsByTypeView(generics.ListAPIView):
+class GoalsByTypeView(ConditionalGetMixin, GoalRollupMixin, generics.ListAPIView):
     serializer_class = GoalSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
     pagination_class = None  # Disable pagination for goals by type
 
     def get_queryset(self):
         goal_type = self.kwargs['goal_type']
-        return Goal.objects.filter(
+        return self.apply_fieldsets(Goal.objects.filter(
             user=self.request.user,
             goal_type=goal_type
-        )
+        ))
 
-class GoalChildrenView(generics.ListAPIView):
+class GoalChildrenView(ConditionalGetMixin, GoalRollupMixin, generics.ListAPIView):
     serializer_class = GoalSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
 
     def get_queryset(self):
         parent_id = self.kwargs['pk']
-        return Goal.objects.filter(
+        return self.apply_fieldsets(Goal.objects.filter(
             user=self.request.user,
             parent_id=parent_id
-        )
+        ))
+
+class GoalTreeView(ConditionalGetMixin, APIView):
+    """Full BIG -> MTG -> DP hierarchy with rollups in a single response"""
+    permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
+
+    def get(self, request):
+        try:
+            depth = int(request.query_params.get('depth', 3))
+        except ValueError:
+            return Response(
+                {'error': 'depth must be an integer between 1 and 3.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if depth not in (1, 2, 3):
+            return Response(
+                {'error': 'depth must be an integer between 1 and 3.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        active_only = request.query_params.get('active', '').lower() in ('1', 'true')
+
+        roots, children, rollups = GoalTreeBuilder(
+            request.user, max_depth=depth, active_only=active_only
+        ).build()
+
+        context = {'request': request, 'rollups': rollups}
+
+        def serialize(goals):
+            data = GoalSerializer(goals, many=True, context=context).data
+            for goal, node in zip(goals, data):
+                node['children'] = serialize(children[goal.id])
+            return data
 
-class DailyProgressListCreateView(generics.ListCreateAPIView):
+        return Response(serialize(roots))
+
+class DailyProgressListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = DailyProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'goals', 'standards')
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return DailyProgress.objects.filter(user=self.request.user)
+        from standards.models import StandardProgress
+        return DailyProgress.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch(
+                'process_progress',
+                queryset=ProcessProgress.objects.visible().select_related('process__parent')
+            ),
+            Prefetch(
+                'standard_progress',
+                queryset=StandardProgress.objects.select_related('standard__category')
+            )
+        ).order_by('-date', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class DailyProgressDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DailyProgressDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DailyProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'goals', 'standards')
 
     def get_queryset(self):
         return DailyProgress.objects.filter(user=self.request.user)
 
-class DailyProgressByDateView(generics.RetrieveAPIView):
+class DailyProgressByDateView(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = DailyProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'goals', 'standards')
     pagination_class = None  # Disable pagination for daily progress
 
     def get_object(self):
@@ -108,66 +213,110 @@ class DailyProgressByDateView(generics.RetrieveAPIView):
                 'date': 'Cannot access progress for future dates.'
             })
             
-        # Get or create daily progress
-        daily_progress, created = DailyProgress.objects.get_or_create(
-            user=self.request.user,
-            date=date
-        )
+        if settings.VIRTUAL_DAILY_PROGRESS:
+            # Serve missing entries without writing them; the serializer
+            # reads them through the prefetch cache
+            daily_progress, processes, standards = DailyProgressMaterializer(
+                requested_date
+            ).virtual_day(self.request.user)
+            daily_progress._prefetched_objects_cache = {
+                'process_progress': processes,
+                'standard_progress': standards,
+            }
+            return daily_progress
 
-        # Get all active DPs for the user
-        active_dps = Goal.objects.filter(
-            user=self.request.user,
-            goal_type='DP',
-            start_date__lte=date,
-            target_date__gte=date,
-            is_completed=False
+        # Rows are normally pre-materialized by the nightly
+        # materialize_daily_progress task, in which case this only reads
+        days = DailyProgressMaterializer(requested_date).materialize(
+            [self.request.user.id], standards=False
         )
 
-        # Create process progress entries for any DPs that don't have them
-        existing_progress = set(ProcessProgress.objects.filter(
-            daily_progress=daily_progress
-        ).values_list('process_id', flat=True))
+        from standards.models import StandardProgress
+        return DailyProgress.objects.prefetch_related(
+            Prefetch(
+                'process_progress',
+                queryset=ProcessProgress.objects.visible().select_related('process__parent')
+            ),
+            Prefetch(
+                'standard_progress',
+                queryset=StandardProgress.objects.select_related('standard__category')
+            )
+        ).get(pk=days[self.request.user.id])
 
-        progress_to_create = []
-        for dp in active_dps:
-            if dp.id not in existing_progress:
-                progress_to_create.append(ProcessProgress(
-                    daily_progress=daily_progress,
-                    process=dp
-                ))
+class VirtualProgressMixin:
+    """Persists a virtual progress entry (see VIRTUAL_DAILY_PROGRESS) on the
+    first write to its id. The request must carry the entry's reference
+    field (process/standard) and its date."""
+    virtual_reference_field = None
 
-        if progress_to_create:
-            ProcessProgress.objects.bulk_create(progress_to_create)
+    def touch_virtual_entry(self, progress_id, reference_id, date):
+        raise NotImplementedError
 
-        return daily_progress
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method not in ('PUT', 'PATCH') or not self._touch_virtual_entry():
+                raise
+            return super().get_object()
 
-class ProcessProgressListCreateView(generics.ListCreateAPIView):
+    def _touch_virtual_entry(self):
+        try:
+            progress_id = uuid.UUID(str(self.kwargs['pk']))
+            reference_id = uuid.UUID(str(self.request.data.get(self.virtual_reference_field)))
+            date = datetime.strptime(str(self.request.data.get('date')), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return False
+        if date > timezone.now().date():
+            return False
+        return self.touch_virtual_entry(progress_id, reference_id, date)
+
+class ProcessProgressFieldsetMixin(SparseFieldsetViewMixin):
+    # daily_progress is read by the keyset cursor whatever the fieldset
+    always_select_related = ('daily_progress',)
+    select_related_fields = {
+        'process_title': ('process',),
+        'category': ('process',),
+        'parent_goal': ('process__parent',),
+    }
+    expand_select_related = {'process': ('process',)}
+
+class ProcessProgressListCreateView(ConditionalGetMixin, ProcessProgressFieldsetMixin,
+                                    generics.ListCreateAPIView):
     serializer_class = ProcessProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
-    pagination_class = None  # Disable pagination for process progress
+    version_domains = ('progress', 'goals')
+    pagination_class = OptionalKeysetPagination  # Unpaginated unless a cursor is requested
 
     def get_queryset(self):
-        return ProcessProgress.objects.filter(
+        return self.apply_fieldsets(ProcessProgress.objects.visible().filter(
             daily_progress__user=self.request.user
-        )
+        )).order_by('-daily_progress__date', '-id')
 
     def perform_create(self, serializer):
         serializer.save()
 
-class ProcessProgressDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ProcessProgressDetailView(ConditionalGetMixin, ProcessProgressFieldsetMixin, VirtualProgressMixin,
+                                generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProcessProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'goals')
+    virtual_reference_field = 'process'
+
+    def touch_virtual_entry(self, progress_id, reference_id, date):
+        return DailyProgressMaterializer.touch_process(
+            self.request.user, progress_id, reference_id, date
+        )
 
     def get_queryset(self):
-        return ProcessProgress.objects.filter(
+        return self.apply_fieldsets(ProcessProgress.objects.visible().filter(
             daily_progress__user=self.request.user
-        )
+        ))
 
     def perform_update(self, serializer):
-        # Get the original instance before update
-        instance = self.get_object()
+        instance = serializer.instance
         was_completed = instance.is_completed
-        
+
         # Update the instance
         if 'is_completed' in self.request.data:
             instance.is_completed = self.request.data['is_completed']
@@ -175,34 +324,68 @@ class ProcessProgressDetailView(generics.RetrieveUpdateDestroyAPIView):
                 instance.completion_time = timezone.now()
         if 'time_spent_minutes' in self.request.data:
             instance.time_spent_minutes = self.request.data['time_spent_minutes']
-        instance.save()
-        
-        # If process was just completed, award points
-        if not was_completed and instance.is_completed:
-            from gamification.services import GamificationService
-            gamification = GamificationService(instance.daily_progress.user)
-            gamification.complete_process(instance)
 
-class ReflectionListCreateView(generics.ListCreateAPIView):
+        with transaction.atomic():
+            instance.save()
+
+            # If process was just completed, queue its points
+            if not was_completed and instance.is_completed:
+                from gamification.services import GamificationOutbox, GamificationService
+                GamificationOutbox.record(
+                    instance.daily_progress.user_id,
+                    GamificationService.process_award(instance.process),
+                    instance.daily_progress.date
+                )
+
+class BulkProgressUpdateView(APIView):
+    """Apply process and standard progress updates for a day in one request"""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        serializer = BulkProgressUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        processes, standards, events, missing = BulkProgressUpdater(
+            request.user
+        ).apply(serializer.validated_data['updates'])
+        if missing:
+            return Response(
+                {'error': 'Progress entries not found.', 'ids': missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        from standards.serializers import StandardProgressSerializer
+        return Response({
+            'process_progress': ProcessProgressSerializer(processes, many=True).data,
+            'standard_progress': StandardProgressSerializer(standards, many=True).data,
+            # Awarded by the outbox worker, before the streak multiplier
+            'points_queued': sum(event.points for event in events),
+        })
+
+class ReflectionListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = ReflectionSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress',)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Reflection.objects.filter(user=self.request.user)
+        return Reflection.objects.filter(user=self.request.user).order_by('-created_at', '-id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ReflectionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ReflectionDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ReflectionSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress',)
 
     def get_queryset(self):
         return Reflection.objects.filter(user=self.request.user)
 
-class ReflectionsByTypeView(generics.ListAPIView):
+class ReflectionsByTypeView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ReflectionSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress',)
 
     def get_queryset(self):
         reflection_type = self.kwargs['reflection_type']
@@ -211,13 +394,44 @@ class ReflectionsByTypeView(generics.ListAPIView):
             reflection_type=reflection_type
         )
 
-class GoalCompletionRateView(APIView):
+class ReflectionSearchView(ConditionalGetMixin, generics.ListAPIView):
+    """Full-text search over reflections, best matches first.
+
+    Query params: `q` (web search syntax), optional `type` and a
+    `start`/`end` period the reflections must overlap."""
+    serializer_class = ReflectionSearchSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress',)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            raise serializers.ValidationError({'q': 'A search query is required.'})
+        try:
+            start_date, end_date = (
+                datetime.strptime(params[name], '%Y-%m-%d').date() if params.get(name) else None
+                for name in ('start', 'end')
+            )
+        except ValueError:
+            raise serializers.ValidationError({'error': 'Invalid date format. Use YYYY-MM-DD.'})
+
+        return ReflectionSearchService.search(
+            self.request.user, text,
+            reflection_type=params.get('type'),
+            start_date=start_date,
+            end_date=end_date
+        )
+
+class GoalCompletionRateView(CachedResponseMixin, APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals',)
 
     def get(self, request):
-        goals = Goal.objects.filter(user=request.user)
-        total_goals = goals.count()
-        completed_goals = goals.filter(is_completed=True).count()
+        from gamification.services import UserCounterService
+        counters = UserCounterService.get(request.user.id)
+        total_goals = counters.total_goals
+        completed_goals = counters.completed_goals
         
         completion_rate = 0
         if total_goals > 0:
@@ -229,73 +443,88 @@ class GoalCompletionRateView(APIView):
             'completed_goals': completed_goals
         })
 
-class GoalChainHealthView(APIView):
+class GoalChainHealthView(ConditionalGetMixin, APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
 
     def get(self, request):
         # Check if BIG goals have associated MTGs and DPs
-        big_goals = Goal.objects.filter(
-            user=request.user,
-            goal_type='BIG',
-            is_completed=False
-        )
-        
-        health_metrics = []
-        for big in big_goals:
-            mtgs = Goal.objects.filter(parent=big)
-            total_dps = Goal.objects.filter(parent__in=mtgs, goal_type='DP')
-            active_dps = total_dps.filter(is_completed=False)
-            
-            health_metrics.append({
-                'big_goal': big.title,
-                'mtg_count': mtgs.count(),
-                'dp_count': total_dps.count(),
-                'active_dp_count': active_dps.count(),
-                'health_score': self._calculate_health_score(big, mtgs, active_dps)
-            })
-            
-        return Response(health_metrics)
-    
-    def _calculate_health_score(self, big, mtgs, active_dps):
-        # Simple health score calculation
-        if mtgs.count() == 0:
-            return 0
-        
-        mtg_score = min(mtgs.count() / 2, 1) * 0.4  # 40% weight for having proper MTGs
-        dp_score = min(active_dps.count() / 2, 1) * 0.6  # 60% weight for active DPs
-        
-        return (mtg_score + dp_score) * 100
+        return Response(GoalChainHealthService(request.user).get_snapshot())
+
+class TimeAllocationView(CachedResponseMixin, APIView):
+    """Time spent per category, MTG, BIG or weekday over one or more windows.
 
-class TimeAllocationView(APIView):
+    Query params: `windows` (comma separated day counts ending at `end`,
+    default 30) or an explicit `start`/`end` range, and `group_by` (comma
+    separated dimensions, default category)."""
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('goals', 'progress')
+    MAX_WINDOWS = 12
+    MAX_WINDOW_DAYS = 3660
 
     def get(self, request):
-        # Get time allocation for the last 30 days
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=30)
-        
-        process_progress = ProcessProgress.objects.filter(
-            daily_progress__user=request.user,
-            daily_progress__date__range=(start_date, end_date)
-        )
-        
-        time_by_category = process_progress.values(
-            'process__category'
-        ).annotate(
-            total_minutes=Avg('time_spent_minutes')
-        )
-        
-        return Response({
-            'time_allocation': time_by_category,
+        try:
+            windows = self._parse_windows(request.query_params)
+            group_by = self._parse_group_by(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        service = TimeAllocationService(request.user, windows)
+        breakdown = {dimension: service.breakdown(dimension) for dimension in group_by}
+
+        response = {
+            'windows': [{'start': start, 'end': end} for start, end in windows],
             'date_range': {
-                'start': start_date,
-                'end': end_date
-            }
-        })
+                'start': windows[0][0],
+                'end': windows[0][1]
+            },
+            'breakdown': breakdown
+        }
+        if 'category' in breakdown:
+            # Shape of the original single-window endpoint
+            response['time_allocation'] = [
+                {
+                    'process__category': group['key'],
+                    'total_minutes': group['windows'][0]['total_minutes']
+                }
+                for group in breakdown['category']
+                if group['windows'][0]['active_days']
+            ]
+        return Response(response)
+
+    def _parse_windows(self, params):
+        try:
+            end_date = (
+                datetime.strptime(params['end'], '%Y-%m-%d').date()
+                if params.get('end') else timezone.now().date()
+            )
+            if params.get('start'):
+                start_date = datetime.strptime(params['start'], '%Y-%m-%d').date()
+                days = [(end_date - start_date).days]
+            else:
+                days = [int(value) for value in params.get('windows', '30').split(',')]
+        except ValueError:
+            raise ValueError('Invalid window. Use YYYY-MM-DD dates or comma separated day counts.')
+
+        if not days or len(days) > self.MAX_WINDOWS:
+            raise ValueError(f'Between 1 and {self.MAX_WINDOWS} windows are allowed.')
+        if any(not 0 <= count <= self.MAX_WINDOW_DAYS for count in days):
+            raise ValueError(f'Windows must span between 0 and {self.MAX_WINDOW_DAYS} days.')
+        return [(end_date - timedelta(days=count), end_date) for count in days]
+
+    def _parse_group_by(self, params):
+        group_by = [value for value in params.get('group_by', 'category').split(',') if value]
+        unknown = set(group_by) - set(TimeAllocationService.DIMENSIONS)
+        if not group_by or unknown:
+            raise ValueError(
+                f'group_by must be one or more of: {", ".join(TimeAllocationService.DIMENSIONS)}.'
+            )
+        return list(dict.fromkeys(group_by))
 
-class ProgressHistoryView(APIView):
+class ProgressHistoryView(ConditionalGetMixin, APIView):
     """Get daily progress history for a date range"""
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress',)
 
     def get(self, request):
         # Get date range from query params
@@ -308,34 +537,21 @@ class ProgressHistoryView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Get all progress within date range
-        daily_progress = DailyProgress.objects.filter(
-            user=request.user,
-            date__range=(start_date, end_date)
-        ).prefetch_related('standard_progress', 'process_progress')
-
-        # Build response data
-        history = {}
-        for progress in daily_progress:
-            date_str = progress.date.isoformat()
-            history[date_str] = {
-                'standards_completed': progress.standard_progress.filter(is_completed=True).count(),
-                'processes_completed': progress.process_progress.filter(is_completed=True).count(),
-                'standards_total': progress.standard_progress.count(),
-                'processes_total': progress.process_progress.count()
-            }
+        # Single range scan over the per-day summaries
+        summaries = {
+            summary['date']: summary
+            for summary in DailySummary.objects.filter(
+                user=request.user,
+                date__range=(start_date, end_date)
+            ).values('date', *DailySummaryService.FIELDS)
+        }
 
         # Return empty data for dates without progress
-        current = start_date
-        while current <= end_date:
-            date_str = current.isoformat()
-            if date_str not in history:
-                history[date_str] = {
-                    'standards_completed': 0,
-                    'processes_completed': 0,
-                    'standards_total': 0,
-                    'processes_total': 0
-                }
-            current += timedelta(days=1)
+        empty = dict.fromkeys(DailySummaryService.FIELDS, 0)
+        history = {}
+        for offset in range((end_date - start_date).days + 1):
+            current = start_date + timedelta(days=offset)
+            summary = summaries.get(current, empty)
+            history[current.isoformat()] = {field: summary[field] for field in DailySummaryService.FIELDS}
 
         return Response(history)
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from backend.versioning import DataVersion
+from gamification.services import UserCounterService
+from goals.services import DailySummaryService
+from .models import Standard, StandardCategory, StandardProgress
+
+@receiver(post_init, sender=StandardProgress)
+def remember_progress_state(sender, instance, **kwargs):
+    # A deferred is_completed is unknown (None), not "not completed"
+    instance._summary_completed = (
+        None if 'is_completed' in instance.get_deferred_fields()
+        else bool(instance.__dict__.get('is_completed'))
+    )
+
+def recompute_progress_totals(day):
+    """Fallback for an entry whose previous state wasn't loaded"""
+    DailySummaryService.refresh([day[0]], dates=[day[1]])
+    UserCounterService.rebuild(day[0])
+
+@receiver(post_save, sender=StandardProgress)
+def track_progress_save(sender, instance, created, **kwargs):
+    day = DailySummaryService.day_of(instance.daily_progress_id)
+    DataVersion.bump(day[0], 'progress')
+    if not created and instance._summary_completed is None:
+        recompute_progress_totals(day)
+        remember_progress_state(sender, instance)
+        return
+
+    was_completed = False if created else instance._summary_completed
+    completed_delta = int(bool(instance.is_completed)) - int(was_completed)
+    UserCounterService.increment(day[0], standards_completed=completed_delta)
+    if created or completed_delta:
+        DailySummaryService.apply(
+            *day,
+            standards_total=int(created),
+            standards_completed=completed_delta
+        )
+    instance._summary_completed = bool(instance.is_completed)
+
+@receiver(post_delete, sender=StandardProgress)
+def track_progress_delete(sender, instance, **kwargs):
+    # The day may already be gone when a DailyProgress or user delete cascades
+    day = DailySummaryService.day_of(instance.daily_progress_id)
+    if day and instance._summary_completed is None:
+        DataVersion.bump(day[0], 'progress')
+        recompute_progress_totals(day)
+    elif day:
+        DataVersion.bump(day[0], 'progress')
+        UserCounterService.increment(day[0], standards_completed=-int(instance._summary_completed))
+        DailySummaryService.apply(
+            *day, create=False,
+            standards_total=-1,
+            standards_completed=-int(instance._summary_completed)
+        )
+
+@receiver(post_save, sender=StandardCategory)
+@receiver(post_delete, sender=StandardCategory)
+@receiver(post_save, sender=Standard)
+@receiver(post_delete, sender=Standard)
+def bump_standards_version(sender, instance, **kwargs):
+    DataVersion.bump(instance.user_id, 'standards')
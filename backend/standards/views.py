@@ -1,9 +1,17 @@
 from rest_framework import generics, permissions, status, serializers
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, Q
+from django.db import transaction
+from django.db.models import Count, Avg, Q, Sum
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+from backend.cache import CachedResponseMixin
+from backend.pagination import KeysetPagination
+from backend.versioning import ConditionalGetMixin
+from goals.models import DailySummary
+from goals.views import VirtualProgressMixin
 from .models import StandardCategory, Standard, StandardProgress
 from .serializers import (
     StandardCategorySerializer,
@@ -11,9 +19,10 @@ from .serializers import (
     StandardProgressSerializer
 )
 
-class StandardCategoryListCreateView(generics.ListCreateAPIView):
+class StandardCategoryListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = StandardCategorySerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('standards',)
     pagination_class = None  # Disable pagination for categories
 
     def get_queryset(self):
@@ -22,16 +31,18 @@ class StandardCategoryListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class StandardCategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StandardCategoryDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StandardCategorySerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('standards',)
 
     def get_queryset(self):
         return StandardCategory.objects.filter(user=self.request.user)
 
-class StandardListCreateView(generics.ListCreateAPIView):
+class StandardListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = StandardSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('standards',)
 
     def get_queryset(self):
         return Standard.objects.filter(user=self.request.user)
@@ -39,16 +50,18 @@ class StandardListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class StandardDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StandardDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StandardSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('standards',)
 
     def get_queryset(self):
         return Standard.objects.filter(user=self.request.user)
 
-class StandardsByCategoryView(generics.ListAPIView):
+class StandardsByCategoryView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = StandardSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('standards',)
 
     def get_queryset(self):
         category_id = self.kwargs['category_id']
@@ -57,46 +70,59 @@ class StandardsByCategoryView(generics.ListAPIView):
             category_id=category_id
         )
 
-class StandardProgressListCreateView(generics.ListCreateAPIView):
+class StandardProgressListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = StandardProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'standards')
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return StandardProgress.objects.filter(
             standard__user=self.request.user
-        )
+        ).select_related('standard__category').order_by('-daily_progress__date', '-id')
 
     def perform_create(self, serializer):
         serializer.save()
 
-class StandardProgressDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StandardProgressDetailView(ConditionalGetMixin, VirtualProgressMixin,
+                                 generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StandardProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'standards')
+    virtual_reference_field = 'standard'
+
+    def touch_virtual_entry(self, progress_id, reference_id, date):
+        from goals.services import DailyProgressMaterializer
+        return DailyProgressMaterializer.touch_standard(
+            self.request.user, progress_id, reference_id, date
+        )
 
     def get_queryset(self):
         return StandardProgress.objects.filter(
             standard__user=self.request.user
-        )
+        ).select_related('standard__category', 'daily_progress')
 
     def perform_update(self, serializer):
-        # Get the original instance before update
-        instance = self.get_object()
-        was_completed = instance.is_completed
-        
-        # Save the update
-        updated_instance = serializer.save()
-        
-        # If standard was just completed, award points
-        if not was_completed and updated_instance.is_completed:
-            from gamification.services import GamificationService
-            gamification = GamificationService(self.request.user)
-            gamification.complete_standard(updated_instance.standard)
-        
+        was_completed = serializer.instance.is_completed
+
+        with transaction.atomic():
+            updated_instance = serializer.save()
+
+            # If standard was just completed, queue its points
+            if not was_completed and updated_instance.is_completed:
+                from gamification.services import GamificationOutbox, GamificationService
+                GamificationOutbox.record(
+                    self.request.user.id,
+                    GamificationService.standard_award(updated_instance.standard),
+                    updated_instance.daily_progress.date
+                )
+
         return updated_instance
 
-class StandardProgressByDateView(generics.ListAPIView):
+class StandardProgressByDateView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = StandardProgressSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'standards')
     pagination_class = None  # Disable pagination for progress
 
     def get_queryset(self):
@@ -113,74 +139,39 @@ class StandardProgressByDateView(generics.ListAPIView):
                 'date': 'Cannot access progress for future dates.'
             })
 
-        # Get or create daily progress
-        from goals.models import DailyProgress
-        daily_progress, _ = DailyProgress.objects.get_or_create(
-            user=self.request.user,
-            date=requested_date
+        from goals.services import DailyProgressMaterializer
+        if settings.VIRTUAL_DAILY_PROGRESS:
+            # Serve missing entries without writing them
+            _, _, standards = DailyProgressMaterializer(
+                requested_date
+            ).virtual_day(self.request.user)
+            return standards
+
+        # Rows are normally pre-materialized by the nightly
+        # materialize_daily_progress task, in which case this only reads
+        days = DailyProgressMaterializer(requested_date).materialize(
+            [self.request.user.id], processes=False
         )
 
-        # Get all active standards
-        active_standards = Standard.objects.filter(
-            user=self.request.user,
-            is_active=True
-        )
-
-        # Get existing progress entries
-        existing_progress = set(StandardProgress.objects.filter(
-            daily_progress=daily_progress
-        ).values_list('standard_id', flat=True))
-
-        # Create progress entries for standards that need them
-        progress_to_create = []
-        for standard in active_standards:
-            if standard.id not in existing_progress:
-                # For daily standards, always create progress
-                if standard.frequency == 'daily':
-                    progress_to_create.append(StandardProgress(
-                        daily_progress=daily_progress,
-                        standard=standard
-                    ))
-                # For weekly standards, only create progress if it's not completed this week
-                elif standard.frequency == 'weekly':
-                    # Get the start of the week (Monday)
-                    week_start = requested_date - timedelta(days=requested_date.weekday())
-                    week_end = week_start + timedelta(days=6)
-                    
-                    # Check if standard is already completed this week
-                    week_progress = StandardProgress.objects.filter(
-                        standard=standard,
-                        daily_progress__date__range=(week_start, week_end),
-                        is_completed=True
-                    ).exists()
-                    
-                    if not week_progress:
-                        progress_to_create.append(StandardProgress(
-                            daily_progress=daily_progress,
-                            standard=standard
-                        ))
-
-        if progress_to_create:
-            StandardProgress.objects.bulk_create(progress_to_create)
-
         return StandardProgress.objects.filter(
-            daily_progress=daily_progress
+            daily_progress_id=days[self.request.user.id]
         ).select_related('standard', 'standard__category')
 
-class StandardCompletionRateView(APIView):
+class StandardCompletionRateView(CachedResponseMixin, APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'standards')
 
     def get(self, request):
         # Calculate completion rates for the last 30 days
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=30)
         
-        progress = StandardProgress.objects.filter(
-            standard__user=request.user,
-            daily_progress__date__range=(start_date, end_date)
+        progress = DailySummary.objects.filter(
+            user=request.user,
+            date__range=(start_date, end_date)
         ).aggregate(
-            total=Count('id'),
-            completed=Count('id', filter=Q(is_completed=True))
+            total=Coalesce(Sum('standards_total'), 0),
+            completed=Coalesce(Sum('standards_completed'), 0)
         )
         
         completion_rate = 0
@@ -193,8 +184,9 @@ class StandardCompletionRateView(APIView):
             'completed_standards': progress['completed']
         })
 
-class StandardStreakView(APIView):
+class StandardStreakView(CachedResponseMixin, APIView):
     permission_classes = (permissions.IsAuthenticated,)
+    version_domains = ('progress', 'standards')
 
     def get(self, request):
         # Calculate current streak of completed standards
@@ -0,0 +1,683 @@
+import csv
+import datetime
+import io
+import json
+import uuid
+from collections import Counter
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from backend.versioning import DataVersion
+from gamification.models import PointTransaction, UserAchievement, UserProfile
+from gamification.services import (
+    GamificationService, PointBucketService, PointCalculator, PointLedgerReconciler, UserCounterService
+)
+from goals.models import DailyProgress, Goal, ProcessProgress, Reflection
+from goals.services import (
+    DailySummaryService, GoalRollupMaintainer,
+    daily_progress_id, process_progress_id, standard_progress_id
+)
+from standards.models import Standard, StandardCategory, StandardProgress
+
+EXPORT_FORMAT_VERSION = 1
+
+class HistoryEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without the millisecond truncation of datetimes"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+class HistoryExporter:
+    """Streams a user's full history as NDJSON, one `{"type", "data"}`
+    record per line, preceded by an `export` header record.
+
+    Every section is a values() projection read through a server-side
+    cursor, so memory use doesn't depend on the size of the account.
+    Sections are ordered so that referenced rows come first."""
+
+    SECTIONS = (
+        ('goal', (
+            'id', 'parent_id', 'goal_type', 'title', 'description', 'category',
+            'start_date', 'target_date', 'metrics', 'is_completed', 'completion_date',
+            'created_at', 'updated_at',
+        )),
+        ('standard_category', (
+            'id', 'name', 'description', 'is_default', 'order', 'created_at', 'updated_at',
+        )),
+        ('standard', (
+            'id', 'category_id', 'title', 'description', 'minimum_requirement',
+            'success_criteria', 'frequency', 'specific_days', 'time_of_day',
+            'duration_minutes', 'is_active', 'created_at', 'updated_at',
+        )),
+        ('daily_progress', ('id', 'date')),
+        ('process_progress', (
+            'id', 'daily_progress_id', 'process_id', 'is_completed', 'time_spent_minutes',
+            'completion_time', 'notes',
+        )),
+        ('standard_progress', (
+            'id', 'daily_progress_id', 'standard_id', 'is_completed', 'completion_time', 'notes',
+        )),
+        ('reflection', (
+            'id', 'reflection_type', 'start_date', 'end_date', 'content', 'highlights',
+            'challenges', 'action_items', 'created_at', 'updated_at',
+        )),
+        ('point_transaction', (
+            'id', 'points', 'transaction_type', 'reference_id', 'reference_type',
+            'streak_multiplier', 'description', 'activity_date', 'created_at',
+        )),
+        ('achievement', ('achievement__name', 'unlocked_at')),
+    )
+
+    def __init__(self, user, chunk_size=2000, buffer_size=64 * 1024):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+
+    def querysets(self):
+        user = self.user
+        return {
+            # Parents before children
+            'goal': Goal.objects.filter(user=user).order_by(
+                Case(
+                    When(goal_type='BIG', then=Value(0)),
+                    When(goal_type='MTG', then=Value(1)),
+                    default=Value(2),
+                    output_field=IntegerField()
+                ),
+                'created_at', 'id'
+            ),
+            'standard_category': StandardCategory.objects.filter(user=user).order_by('created_at', 'id'),
+            'standard': Standard.objects.filter(user=user).order_by('created_at', 'id'),
+            'daily_progress': DailyProgress.objects.filter(user=user).order_by('date'),
+            'process_progress': ProcessProgress.objects.filter(
+                daily_progress__user=user
+            ).order_by('daily_progress__date', 'id'),
+            'standard_progress': StandardProgress.objects.filter(
+                daily_progress__user=user
+            ).order_by('daily_progress__date', 'id'),
+            'reflection': Reflection.objects.filter(user=user).order_by('start_date', 'id'),
+            'point_transaction': PointTransaction.objects.filter(user=user).order_by('created_at', 'id'),
+            'achievement': UserAchievement.objects.filter(user=user).order_by('unlocked_at', 'id'),
+        }
+
+    def header(self):
+        return {
+            'type': 'export',
+            'data': {
+                'version': EXPORT_FORMAT_VERSION,
+                'exported_at': timezone.now(),
+                'user': {
+                    'id': self.user.id,
+                    'username': self.user.username,
+                    'timezone': self.user.timezone,
+                },
+            },
+        }
+
+    def records(self):
+        yield self.header()
+        querysets = self.querysets()
+        for record_type, fields in self.SECTIONS:
+            rows = querysets[record_type].values(*fields).iterator(chunk_size=self.chunk_size)
+            for row in rows:
+                yield {'type': record_type, 'data': row}
+
+    def stream(self):
+        """NDJSON lines, grouped into chunks of roughly `buffer_size` bytes"""
+        buffer, size = [], 0
+        for record in self.records():
+            line = json.dumps(record, cls=HistoryEncoder).encode() + b'\n'
+            buffer.append(line)
+            size += len(line)
+            # Send the header right away so the download starts immediately
+            if size >= self.buffer_size or record['type'] == 'export':
+                yield b''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield b''.join(buffer)
+
+IMPORT_NAMESPACE = uuid.UUID('d3b1f0a4-6c2e-4f7a-9e58-0b7c1a2d4e96')
+
+class HistoryImportError(Exception):
+    """Raised with the list of per-line errors when an import is rejected"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid records')
+        self.errors = errors
+
+class HistoryImporter:
+    """Imports goals, standards and dated completions from NDJSON (the
+    export format, plus `date` on progress records) or CSV (a `type`
+    column and one column per data key).
+
+    Records are validated in memory, including the BIG -> MTG -> DP
+    hierarchy, then COPYed into temporary staging tables and merged with
+    set-based SQL in one transaction. Ids are derived from the user and the
+    source ids, so importing the same file twice updates instead of
+    duplicating. Rollups, daily summaries and points are recomputed once at
+    the end."""
+
+    FORMATS = ('ndjson', 'csv')
+    MAX_ERRORS = 100
+
+    # Record type -> (model, plain fields taken from the record)
+    RECORDS = {
+        'goal': (Goal, (
+            'goal_type', 'title', 'description', 'category', 'start_date', 'target_date',
+            'metrics', 'is_completed', 'completion_date',
+        )),
+        'standard_category': (StandardCategory, ('name', 'description', 'order')),
+        'standard': (Standard, (
+            'title', 'description', 'minimum_requirement', 'success_criteria', 'frequency',
+            'specific_days', 'time_of_day', 'duration_minutes', 'is_active',
+        )),
+        'process_progress': (ProcessProgress, (
+            'is_completed', 'time_spent_minutes', 'completion_time', 'notes',
+        )),
+        'standard_progress': (StandardProgress, ('is_completed', 'completion_time', 'notes')),
+    }
+    PARENT_TYPES = {'BIG': None, 'MTG': 'BIG', 'DP': 'MTG'}
+    BOOLEANS = {
+        'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+        'false': False, 'f': False, 'no': False, 'n': False, '0': False,
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self.errors = []
+        self.skipped = Counter()
+        self.goals = {}
+        self.categories = {}
+        self.standards = {}
+        self.days = {}
+        self.process_progress = {}
+        self.standard_progress = {}
+
+    # Parsing
+
+    def read(self, lines, format):
+        """Yield (line number, record type, data) from NDJSON or CSV lines"""
+        if format == 'csv':
+            for reader_line, row in enumerate(csv.DictReader(lines), start=2):
+                data = {key: value for key, value in row.items() if key and value not in (None, '')}
+                yield reader_line, data.pop('type', ''), data
+            return
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield number, record['type'], record['data']
+            except (ValueError, KeyError, TypeError):
+                self.error(number, 'Invalid NDJSON record.')
+
+    def error(self, line, message):
+        self.errors.append({'line': line, 'error': message})
+        if len(self.errors) >= self.MAX_ERRORS:
+            raise HistoryImportError(self.errors)
+
+    def clean(self, model, fields, data):
+        values = {}
+        for name in fields:
+            field = model._meta.get_field(name)
+            raw = data.get(name)
+            if raw in (None, '', [], {}):
+                if field.has_default():
+                    values[name] = field.get_default()
+                elif field.null:
+                    values[name] = None
+                elif isinstance(field, (models.CharField, models.TextField)):
+                    values[name] = ''
+                else:
+                    raise ValidationError(f'{name} is required.')
+                continue
+            if isinstance(field, models.BooleanField) and isinstance(raw, str):
+                raw = self.BOOLEANS.get(raw.strip().lower(), raw)
+            elif isinstance(field, models.JSONField) and isinstance(raw, str):
+                try:
+                    raw = json.loads(raw)
+                except ValueError:
+                    raise ValidationError(f'{name} must be JSON.')
+            try:
+                values[name] = field.clean(raw, None)
+            except ValidationError as e:
+                raise ValidationError(f'{name}: {" ".join(e.messages)}')
+        return values
+
+    def import_id(self, kind, ref):
+        return uuid.uuid5(IMPORT_NAMESPACE, f'{self.user.id}:{kind}:{ref}')
+
+    @staticmethod
+    def parse_date(value):
+        return models.DateField().to_python(value)
+
+    # Validation
+
+    def load(self, records):
+        """Validate every record in memory; raises HistoryImportError"""
+        references = []
+        for line, record_type, data in records:
+            if record_type not in self.RECORDS and record_type != 'daily_progress':
+                self.skipped[record_type or 'unknown'] += 1
+                continue
+            try:
+                if record_type == 'daily_progress':
+                    self.days[str(data['id'])] = self.parse_date(data['date'])
+                    continue
+                model, fields = self.RECORDS[record_type]
+                values = self.clean(model, fields, data)
+                references.append((line, record_type, data, values))
+            except KeyError as e:
+                self.error(line, f'{e.args[0]} is required.')
+            except ValidationError as e:
+                self.error(line, ' '.join(e.messages))
+
+        for line, record_type, data, values in references:
+            values['line'] = line
+            try:
+                getattr(self, f'load_{record_type}')(data, values)
+            except KeyError as e:
+                self.error(line, f'{e.args[0]} is required.')
+            except ValidationError as e:
+                self.error(line, ' '.join(e.messages))
+
+        if not self.errors:
+            self.resolve_references()
+        if self.errors:
+            raise HistoryImportError(sorted(self.errors, key=lambda error: error['line']))
+
+    def load_goal(self, data, values):
+        if values['start_date'] > values['target_date']:
+            raise ValidationError('start_date must not be after target_date.')
+        ref = str(data['id'])
+        values['id'] = self.import_id('goal', ref)
+        values['parent_ref'] = str(data.get('parent_id') or data.get('parent') or '') or None
+        self.goals[ref] = values
+
+    def load_standard_category(self, data, values):
+        ref = str(data['id'])
+        values['id'] = self.import_id('standard_category', ref)
+        self.categories[ref] = values
+
+    def load_standard(self, data, values):
+        ref = str(data['id'])
+        values['id'] = self.import_id('standard', ref)
+        values['category_ref'] = str(data.get('category_id') or data.get('category') or '')
+        if not values['category_ref']:
+            raise ValidationError('category_id is required.')
+        self.standards[ref] = values
+
+    def progress_date(self, data):
+        if data.get('date'):
+            return self.parse_date(data['date'])
+        day = self.days.get(str(data.get('daily_progress_id')))
+        if day is None:
+            raise ValidationError('date is required.')
+        return day
+
+    def load_process_progress(self, data, values):
+        values['date'] = self.progress_date(data)
+        values['ref'] = str(data.get('process_id') or data['process'])
+        # Later records for the same day win
+        self.process_progress[values['ref'], values['date']] = values
+
+    def load_standard_progress(self, data, values):
+        values['date'] = self.progress_date(data)
+        values['ref'] = str(data.get('standard_id') or data['standard'])
+        self.standard_progress[values['ref'], values['date']] = values
+
+    def existing(self, model, refs, fields):
+        """Rows of the user's existing data referenced by id instead of by a record in the file"""
+        ids = set()
+        for ref in refs:
+            try:
+                ids.add(uuid.UUID(ref))
+            except ValueError:
+                pass
+        if not ids:
+            return {}
+        return {
+            str(row['id']): row
+            for row in model.objects.filter(user=self.user, id__in=ids).values('id', *fields)
+        }
+
+    def resolve_references(self):
+        existing_goals = self.existing(
+            Goal,
+            [goal['parent_ref'] for goal in self.goals.values()
+             if goal['parent_ref'] and goal['parent_ref'] not in self.goals]
+            + [progress['ref'] for progress in self.process_progress.values() if progress['ref'] not in self.goals],
+            ('goal_type',)
+        )
+
+        def goal(ref):
+            return self.goals.get(ref) or existing_goals.get(ref)
+
+        for values in self.goals.values():
+            expected = self.PARENT_TYPES[values['goal_type']]
+            parent = goal(values['parent_ref']) if values['parent_ref'] else None
+            if values['parent_ref'] and parent is None:
+                self.error(values['line'], f'Unknown parent goal {values["parent_ref"]}.')
+            elif expected is None and parent is not None:
+                self.error(values['line'], 'BIG goals cannot have a parent goal.')
+            elif expected is not None and (parent is None or parent['goal_type'] != expected):
+                self.error(values['line'], f'{values["goal_type"]} goals must have a {expected} goal as parent.')
+            else:
+                values['parent_id'] = parent['id'] if parent else None
+
+        for values in self.process_progress.values():
+            process = goal(values['ref'])
+            if process is None or process['goal_type'] != 'DP':
+                self.error(values['line'], f'{values["ref"]} is not a Daily Process goal.')
+            else:
+                values['process_id'] = process['id']
+
+        existing_categories = self.existing(
+            StandardCategory,
+            [standard['category_ref'] for standard in self.standards.values()
+             if standard['category_ref'] not in self.categories],
+            ()
+        )
+        for values in self.standards.values():
+            category = self.categories.get(values['category_ref']) or existing_categories.get(values['category_ref'])
+            if category is None:
+                self.error(values['line'], f'Unknown standard category {values["category_ref"]}.')
+            else:
+                values['category_id'] = category['id']
+
+        existing_standards = self.existing(
+            Standard,
+            [progress['ref'] for progress in self.standard_progress.values() if progress['ref'] not in self.standards],
+            ()
+        )
+        for values in self.standard_progress.values():
+            standard = self.standards.get(values['ref']) or existing_standards.get(values['ref'])
+            if standard is None:
+                self.error(values['line'], f'Unknown standard {values["ref"]}.')
+            else:
+                values['standard_id'] = standard['id']
+
+    # Loading
+
+    STAGING = {
+        'import_goals': (
+            'id uuid, parent_id uuid, goal_type text, title text, description text, '
+            'category text, start_date date, target_date date, metrics jsonb, '
+            'is_completed boolean, completion_date date'
+        ),
+        'import_standard_categories': 'id uuid, name text, description text, "order" integer',
+        'import_standards': (
+            'id uuid, category_id uuid, title text, description text, minimum_requirement text, '
+            'success_criteria jsonb, frequency text, specific_days jsonb, time_of_day time, '
+            'duration_minutes integer, is_active boolean'
+        ),
+        'import_days': 'id uuid, date date',
+        'import_process_progress': (
+            'id uuid, date date, process_id uuid, is_completed boolean, '
+            'time_spent_minutes integer, completion_time timestamptz, notes text'
+        ),
+        'import_standard_progress': (
+            'id uuid, date date, standard_id uuid, is_completed boolean, '
+            'completion_time timestamptz, notes text'
+        ),
+    }
+
+    @staticmethod
+    def copy_value(value):
+        """Encode a value for COPY's text format"""
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return (
+            str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r')
+        )
+
+    def copy(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(self.copy_value(row[column]) for column in columns))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(connection.ops.quote_name(c) for c in columns)}) FROM STDIN',
+            buffer
+        )
+
+    def stage(self, cursor):
+        for table, columns in self.STAGING.items():
+            # An enclosing transaction may still hold the tables of an
+            # earlier import
+            cursor.execute(f'DROP TABLE IF EXISTS pg_temp.{table}')
+            cursor.execute(f'CREATE TEMPORARY TABLE {table} ({columns}) ON COMMIT DROP')
+
+        self.copy(cursor, 'import_goals', (
+            'id', 'parent_id', 'goal_type', 'title', 'description', 'category',
+            'start_date', 'target_date', 'metrics', 'is_completed', 'completion_date',
+        ), self.goals.values())
+        self.copy(cursor, 'import_standard_categories', ('id', 'name', 'description', 'order'),
+                  self.categories.values())
+        self.copy(cursor, 'import_standards', (
+            'id', 'category_id', 'title', 'description', 'minimum_requirement',
+            'success_criteria', 'frequency', 'specific_days', 'time_of_day',
+            'duration_minutes', 'is_active',
+        ), self.standards.values())
+
+        user_id = self.user.id
+        dates = {date for _, date in self.process_progress} | {date for _, date in self.standard_progress}
+        self.copy(cursor, 'import_days', ('id', 'date'), (
+            {'id': daily_progress_id(user_id, date), 'date': date} for date in dates
+        ))
+        self.copy(cursor, 'import_process_progress', (
+            'id', 'date', 'process_id', 'is_completed', 'time_spent_minutes', 'completion_time', 'notes',
+        ), (
+            dict(values, id=process_progress_id(user_id, values['date'], values['process_id']))
+            for values in self.process_progress.values()
+        ))
+        self.copy(cursor, 'import_standard_progress', (
+            'id', 'date', 'standard_id', 'is_completed', 'completion_time', 'notes',
+        ), (
+            dict(values, id=standard_progress_id(user_id, values['date'], values['standard_id']))
+            for values in self.standard_progress.values()
+        ))
+
+    MERGE_SQL = (
+        """
+        INSERT INTO goals (
+            id, user_id, parent_id, goal_type, title, description, category, start_date,
+            target_date, metrics, is_completed, completion_date, pending_deletion,
+            created_at, updated_at
+        )
+        SELECT id, %(user_id)s, parent_id, goal_type, title, description, category, start_date,
+               target_date, metrics, is_completed, completion_date, false, now(), now()
+        FROM import_goals
+        ON CONFLICT (id) DO UPDATE SET
+            parent_id = EXCLUDED.parent_id, goal_type = EXCLUDED.goal_type,
+            title = EXCLUDED.title, description = EXCLUDED.description,
+            category = EXCLUDED.category, start_date = EXCLUDED.start_date,
+            target_date = EXCLUDED.target_date, metrics = EXCLUDED.metrics,
+            is_completed = EXCLUDED.is_completed, completion_date = EXCLUDED.completion_date,
+            updated_at = now()
+        """,
+        """
+        INSERT INTO standard_categories (
+            id, user_id, name, description, is_default, "order", created_at, updated_at
+        )
+        SELECT id, %(user_id)s, name, description, false, "order", now(), now()
+        FROM import_standard_categories
+        ON CONFLICT (id) DO UPDATE SET
+            name = EXCLUDED.name, description = EXCLUDED.description,
+            "order" = EXCLUDED."order", updated_at = now()
+        """,
+        """
+        INSERT INTO standards (
+            id, user_id, category_id, title, description, minimum_requirement, success_criteria,
+            frequency, specific_days, time_of_day, duration_minutes, is_active, created_at, updated_at
+        )
+        SELECT id, %(user_id)s, category_id, title, description, minimum_requirement,
+               ARRAY(SELECT jsonb_array_elements_text(success_criteria)),
+               frequency,
+               CASE WHEN specific_days IS NULL THEN NULL
+                    ELSE ARRAY(SELECT jsonb_array_elements_text(specific_days)::integer) END,
+               time_of_day, duration_minutes, is_active, now(), now()
+        FROM import_standards
+        ON CONFLICT (id) DO UPDATE SET
+            category_id = EXCLUDED.category_id, title = EXCLUDED.title,
+            description = EXCLUDED.description, minimum_requirement = EXCLUDED.minimum_requirement,
+            success_criteria = EXCLUDED.success_criteria, frequency = EXCLUDED.frequency,
+            specific_days = EXCLUDED.specific_days, time_of_day = EXCLUDED.time_of_day,
+            duration_minutes = EXCLUDED.duration_minutes, is_active = EXCLUDED.is_active,
+            updated_at = now()
+        """,
+        """
+        INSERT INTO daily_progress (id, user_id, date)
+        SELECT id, %(user_id)s, date FROM import_days
+        ON CONFLICT (user_id, date) DO NOTHING
+        """,
+        # Points for completions that are new to the account, before the
+        # progress rows are merged. Each one takes its gamification outbox
+        # key first, already processed, so a completion the outbox has
+        # awarded isn't paid again and a later toggle on that day isn't
+        # queued again
+        """
+        WITH awarded AS (
+            INSERT INTO gamification_outbox (
+                id, user_id, transaction_type, points, reference_id, reference_type, date,
+                description, created_at, processed_at
+            )
+            SELECT gen_random_uuid(), %(user_id)s, 'process', %(process_points)s, s.process_id,
+                   'process', s.date, 'Imported process: ' || g.title, now(), now()
+            FROM import_process_progress s
+            JOIN goals g ON g.id = s.process_id
+            JOIN daily_progress d ON d.user_id = %(user_id)s AND d.date = s.date
+            LEFT JOIN process_progress p ON p.daily_progress_id = d.id AND p.process_id = s.process_id
+            WHERE s.is_completed AND (p.id IS NULL OR NOT p.is_completed)
+            ON CONFLICT (reference_type, reference_id, date) DO NOTHING
+            RETURNING reference_id, date, points, description
+        )
+        INSERT INTO point_transactions (
+            id, user_id, points, transaction_type, reference_id, reference_type,
+            streak_multiplier, description, activity_date, created_at
+        )
+        SELECT gen_random_uuid(), %(user_id)s, a.points, 'process', a.reference_id,
+               'process', 1.0, a.description, a.date, COALESCE(s.completion_time, s.date::timestamptz)
+        FROM awarded a
+        JOIN import_process_progress s ON s.process_id = a.reference_id AND s.date = a.date
+        """,
+        """
+        WITH awarded AS (
+            INSERT INTO gamification_outbox (
+                id, user_id, transaction_type, points, reference_id, reference_type, date,
+                description, created_at, processed_at
+            )
+            SELECT gen_random_uuid(), %(user_id)s, 'standard', %(standard_points)s, s.standard_id,
+                   'standard', s.date, 'Imported standard: ' || st.title, now(), now()
+            FROM import_standard_progress s
+            JOIN standards st ON st.id = s.standard_id
+            JOIN daily_progress d ON d.user_id = %(user_id)s AND d.date = s.date
+            LEFT JOIN standard_progress p ON p.daily_progress_id = d.id AND p.standard_id = s.standard_id
+            WHERE s.is_completed AND (p.id IS NULL OR NOT p.is_completed)
+            ON CONFLICT (reference_type, reference_id, date) DO NOTHING
+            RETURNING reference_id, date, points, description
+        )
+        INSERT INTO point_transactions (
+            id, user_id, points, transaction_type, reference_id, reference_type,
+            streak_multiplier, description, activity_date, created_at
+        )
+        SELECT gen_random_uuid(), %(user_id)s, a.points, 'standard', a.reference_id,
+               'standard', 1.0, a.description, a.date, COALESCE(s.completion_time, s.date::timestamptz)
+        FROM awarded a
+        JOIN import_standard_progress s ON s.standard_id = a.reference_id AND s.date = a.date
+        """,
+        """
+        INSERT INTO process_progress (
+            id, daily_progress_id, process_id, is_completed, time_spent_minutes, completion_time, notes
+        )
+        SELECT s.id, d.id, s.process_id, s.is_completed, s.time_spent_minutes,
+               CASE WHEN s.is_completed THEN COALESCE(s.completion_time, s.date::timestamptz) END,
+               s.notes
+        FROM import_process_progress s
+        JOIN daily_progress d ON d.user_id = %(user_id)s AND d.date = s.date
+        ON CONFLICT (daily_progress_id, process_id) DO UPDATE SET
+            is_completed = EXCLUDED.is_completed,
+            time_spent_minutes = EXCLUDED.time_spent_minutes,
+            completion_time = COALESCE(EXCLUDED.completion_time, process_progress.completion_time),
+            notes = EXCLUDED.notes
+        """,
+        """
+        INSERT INTO standard_progress (
+            id, daily_progress_id, standard_id, is_completed, completion_time, notes
+        )
+        SELECT s.id, d.id, s.standard_id, s.is_completed,
+               CASE WHEN s.is_completed THEN COALESCE(s.completion_time, s.date::timestamptz) END,
+               s.notes
+        FROM import_standard_progress s
+        JOIN daily_progress d ON d.user_id = %(user_id)s AND d.date = s.date
+        ON CONFLICT (daily_progress_id, standard_id) DO UPDATE SET
+            is_completed = EXCLUDED.is_completed,
+            completion_time = COALESCE(EXCLUDED.completion_time, standard_progress.completion_time),
+            notes = EXCLUDED.notes
+        """,
+    )
+
+    def merge(self, cursor):
+        params = {
+            'user_id': self.user.id,
+            'process_points': PointCalculator.PROCESS_POINTS,
+            'standard_points': PointCalculator.STANDARD_POINTS,
+        }
+        for sql in self.MERGE_SQL:
+            cursor.execute(sql, params)
+
+    def completion_dates(self):
+        """Days of the imported completions, which their transactions count for"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT date FROM import_process_progress WHERE is_completed UNION '
+                'SELECT date FROM import_standard_progress WHERE is_completed'
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def recompute(self):
+        """Derived data, once for the whole import"""
+        GoalRollupMaintainer.rebuild(self.user.id)
+        DailySummaryService.refresh([self.user.id])
+        DataVersion.bump_all(self.user.id)
+
+        # Locked and re-summed like a reconciliation, which also moves the
+        # user on the leaderboard after commit
+        profile, _ = UserProfile.objects.get_or_create(user=self.user)
+        PointLedgerReconciler().fix([profile])
+        PointBucketService.rebuild(self.user.id, self.completion_dates())
+        UserCounterService.rebuild(self.user.id)
+        GamificationService(self.user).check_achievements()
+
+    def run(self, lines, format='ndjson'):
+        """Import `lines` and return the number of records per type"""
+        if format not in self.FORMATS:
+            raise ValueError(f'Unsupported format: {format}')
+        self.load(self.read(lines, format))
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self.stage(cursor)
+                self.merge(cursor)
+            self.recompute()
+
+        return {
+            'goals': len(self.goals),
+            'standard_categories': len(self.categories),
+            'standards': len(self.standards),
+            'process_progress': len(self.process_progress),
+            'standard_progress': len(self.standard_progress),
+            'skipped': dict(self.skipped),
+        }
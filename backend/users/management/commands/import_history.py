@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.history import HistoryImporter, HistoryImportError
+from users.models import User
+
+class Command(BaseCommand):
+    help = 'Import goals, standards and dated completions for a user from NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=HistoryImporter.FORMATS,
+            help='Input format (default: from the file extension)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Unknown user: {options["username"]}')
+
+        format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as lines:
+                counts = HistoryImporter(user).run(lines, format)
+        except HistoryImportError as e:
+            for error in e.errors:
+                self.stderr.write(f'line {error["line"]}: {error["error"]}')
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {counts}'))
@@ -8,6 +8,8 @@ class User(AbstractUser):
     timezone = models.CharField(max_length=50, default='UTC')
     preferred_reminder_time = models.TimeField(null=True, blank=True)
     notification_preferences = models.JSONField(default=dict)
+    # Set when the account is deactivated and queued for background deletion
+    pending_deletion = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.utils import timezone
+from gamification.leaderboard import PERIODS, period_start, window_leaderboard
+from goals.services import delete_in_chunks
+from .models import User
+
+class AccountDeletionService:
+    """Deactivates an account right away and deletes its data in the
+    background, table by table in bounded chunks, instead of cascading
+    through the ORM collector inside the request."""
+
+    # (table, condition, primary key) in dependency order; goals go leaves first
+    # so every chunk only removes goals nothing references anymore
+    TABLES = (
+        ('process_progress', 'daily_progress_id IN (SELECT id FROM daily_progress WHERE user_id = %s)', 'id'),
+        ('standard_progress', 'daily_progress_id IN (SELECT id FROM daily_progress WHERE user_id = %s)', 'id'),
+        ('daily_summaries', 'user_id = %s', 'id'),
+        ('daily_progress', 'user_id = %s', 'id'),
+        ('goal_rollups', 'goal_id IN (SELECT id FROM goals WHERE user_id = %s)', 'goal_id'),
+        ('goals', "user_id = %s AND goal_type = 'DP'", 'id'),
+        ('goals', "user_id = %s AND goal_type = 'MTG'", 'id'),
+        ('goals', 'user_id = %s', 'id'),
+        ('standards', 'user_id = %s', 'id'),
+        ('standard_categories', 'user_id = %s', 'id'),
+        ('reflections', 'user_id = %s', 'id'),
+        ('point_transactions', 'user_id = %s', 'id'),
+        ('user_achievements', 'user_id = %s', 'id'),
+        ('user_counters', 'user_id = %s', 'user_id'),
+        ('gamification_outbox', 'user_id = %s', 'id'),
+        ('point_buckets', 'user_id = %s', 'id'),
+        ('leaderboard_snapshots', 'user_id = %s', 'id'),
+    )
+
+    @classmethod
+    def request(cls, user):
+        from .tasks import delete_account
+
+        with transaction.atomic():
+            user.is_active = False
+            user.pending_deletion = True
+            user.save(update_fields=['is_active', 'pending_deletion'])
+            transaction.on_commit(lambda: delete_account.delay(str(user.id)))
+
+    @classmethod
+    def purge(cls, user_id):
+        """Delete the account's rows; returns the number of deleted rows"""
+        deleted = sum(
+            delete_in_chunks(table, condition, [user_id], pk=pk)
+            for table, condition, pk in cls.TABLES
+        )
+        # What is left (profile, tokens, admin log) is small enough for the
+        # ORM; the profile's delete signal unranks the user on the all-time
+        # leaderboard
+        User.objects.filter(pk=user_id, pending_deletion=True).delete()
+        today = timezone.now().date()
+        for period in PERIODS:
+            window_leaderboard(period, period_start(period, today)).remove(user_id)
+        return deleted
@@ -0,0 +1,7 @@
+from celery import shared_task
+from .services import AccountDeletionService
+
+@shared_task
+def delete_account(user_id):
+    """Delete an account queued by AccountDeletionService.request"""
+    return AccountDeletionService.purge(user_id)
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import json
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from gamification.leaderboard import PERIODS, leaderboard, period_start, window_leaderboard
+from gamification.models import LeaderboardSnapshot, PointBucket, PointTransaction, UserCounters, UserProfile
+from gamification.services import GamificationOutbox, GamificationService, UserCounterService
+from goals.models import DailyProgress, Goal, ProcessProgress, Reflection
+from goals.services import DailySummaryService, GoalRollupMaintainer, delete_in_chunks
+from standards.models import Standard, StandardCategory, StandardProgress
+from .history import HistoryExporter
+from .models import User
+from .services import AccountDeletionService
 
-# Create your tests here.
+def create_history(user, days=3):
+    """A BIG -> MTG -> DP chain and a standard, with progress on `days` days"""
+    today = timezone.now().date()
+    start = today - timedelta(days=days - 1)
+    goal_fields = {'description': '', 'category': 'c', 'start_date': start, 'target_date': today}
+    big = Goal.objects.create(user=user, goal_type='BIG', title='Run a marathon', **goal_fields)
+    mtg = Goal.objects.create(user=user, parent=big, goal_type='MTG', title='Half', **goal_fields)
+    process = Goal.objects.create(user=user, parent=mtg, goal_type='DP', title='Run', **goal_fields)
+    category = StandardCategory.objects.create(user=user, name='Health')
+    standard = Standard.objects.create(user=user, category=category, title='Sleep', description='',
+                                       minimum_requirement='7h', frequency='daily')
+    for offset in range(days):
+        day = DailyProgress.objects.create(user=user, date=start + timedelta(days=offset))
+        ProcessProgress.objects.create(daily_progress=day, process=process, is_completed=offset % 2 == 0,
+                                       time_spent_minutes=30)
+        StandardProgress.objects.create(daily_progress=day, standard=standard, is_completed=True)
+    Reflection.objects.create(user=user, reflection_type='weekly', start_date=start, end_date=today,
+                              content='Good week', highlights=['ran'])
+    PointTransaction.objects.create(user=user, points=15, transaction_type='process', description='',
+                                    activity_date=today)
+    return process, standard
+
+def read_export(response):
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    return [json.loads(line) for line in lines]
+
+class HistoryExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', 'exporter@example.com', 'pw')
+        create_history(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_holds_every_row_once_parents_first(self):
+        response = self.client.get('/api/users/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = read_export(response)
+        self.assertEqual(records[0]['type'], 'export')
+        self.assertEqual(records[0]['data']['user']['id'], str(self.user.id))
+
+        counts = {}
+        for record in records[1:]:
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+        querysets = HistoryExporter(self.user).querysets()
+        self.assertEqual(counts, {
+            record_type: querysets[record_type].count()
+            for record_type, _ in HistoryExporter.SECTIONS if querysets[record_type].exists()
+        })
+
+        types = [record['type'] for record in records]
+        self.assertEqual(types, sorted(types, key=[
+            'export', *(record_type for record_type, _ in HistoryExporter.SECTIONS)
+        ].index))
+        goals = [record['data'] for record in records if record['type'] == 'goal']
+        self.assertEqual([goal['title'] for goal in goals], ['Run a marathon', 'Half', 'Run'])
+
+    def test_export_is_streamed_in_buffers(self):
+        chunks = list(HistoryExporter(self.user, buffer_size=200).stream())
+        self.assertGreater(len(chunks), 2)
+        self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks))
+
+class HistoryImportTests(TestCase):
+
+    def setUp(self):
+        source = User.objects.create_user('source', 'source@example.com', 'pw')
+        create_history(source)
+        self.export = b''.join(HistoryExporter(source).stream())
+        self.user = User.objects.create_user('importer', 'importer@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='history.ndjson'):
+        return self.client.post('/api/users/import/', {
+            'file': SimpleUploadedFile(name, content)
+        }, format='multipart')
+
+    def assertDerivedDataMatchesSource(self):
+        self.assertEqual(GoalRollupMaintainer.rebuild(self.user.id, dry_run=True), (0, 0))
+        self.assertEqual(DailySummaryService.refresh([self.user.id]), 0)
+        self.assertEqual(
+            UserProfile.objects.get(user=self.user).total_points,
+            PointTransaction.objects.filter(user=self.user).aggregate(total=Sum('points'))['total']
+        )
+        counters = UserCounters.objects.get(user=self.user)
+        for field, value in UserCounterService.source_counts([self.user.id])[self.user.id].items():
+            self.assertEqual(getattr(counters, field), value, field)
+
+    def test_import_of_an_export(self):
+        response = self.upload(self.export)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['imported']['goals'], 3)
+        self.assertEqual(response.data['imported']['process_progress'], 3)
+        self.assertEqual(response.data['imported']['skipped'], {
+            'export': 1, 'reflection': 1, 'point_transaction': 1
+        })
+        self.assertEqual(Goal.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(StandardProgress.objects.filter(daily_progress__user=self.user).count(), 3)
+        # Two completed process days and three standard days
+        self.assertEqual(PointTransaction.objects.filter(
+            user=self.user, transaction_type__in=['process', 'standard']
+        ).count(), 5)
+        self.assertDerivedDataMatchesSource()
+
+    def test_import_twice_updates_in_place(self):
+        self.upload(self.export)
+        self.assertEqual(self.upload(self.export).status_code, 200)
+        self.assertEqual(Goal.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(PointTransaction.objects.filter(
+            user=self.user, transaction_type__in=['process', 'standard']
+        ).count(), 5)
+        self.assertDerivedDataMatchesSource()
+
+    def test_toggling_an_imported_completion_does_not_award_it_again(self):
+        self.upload(self.export)
+        awarded = PointTransaction.objects.filter(user=self.user, transaction_type__in=['process', 'standard'])
+        self.assertEqual(awarded.count(), 5)
+        progress = StandardProgress.objects.get(
+            daily_progress__user=self.user, daily_progress__date=timezone.now().date()
+        )
+        for is_completed in (False, True):
+            self.client.patch(f'/api/standards/progress/{progress.id}/', {'is_completed': is_completed}, format='json')
+        GamificationOutbox.drain(self.user.id)
+        self.assertEqual(awarded.count(), 5)
+
+        # Unchecked again and re-imported: the outbox key still holds
+        self.client.patch(f'/api/standards/progress/{progress.id}/', {'is_completed': False}, format='json')
+        self.upload(self.export)
+        self.assertEqual(awarded.count(), 5)
+        self.assertDerivedDataMatchesSource()
+
+    @override_settings(LEADERBOARD_STORE='memory')
+    def test_import_moves_the_user_on_the_leaderboard(self):
+        leaderboard.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(self.export)
+        self.assertEqual(
+            leaderboard.points(self.user.id), UserProfile.objects.get(user=self.user).total_points
+        )
+
+    def test_import_recounts_the_point_buckets(self):
+        source = User.objects.create_user('veteran', 'veteran@example.com', 'pw')
+        create_history(source, days=40)
+        self.upload(b''.join(HistoryExporter(source).stream()))
+
+        expected = Counter()
+        for day, points in PointTransaction.objects.filter(user=self.user).values_list('activity_date', 'points'):
+            for period in PERIODS:
+                expected[period, period_start(period, day)] += points
+        self.assertEqual({
+            (bucket.period, bucket.period_start): bucket.points
+            for bucket in PointBucket.objects.filter(user=self.user)
+        }, dict(expected))
+
+    def test_csv_and_invalid_records(self):
+        today = timezone.now().date()
+        content = '\n'.join([
+            'type,id,parent_id,goal_type,title,start_date,target_date,process_id,date,is_completed',
+            f'goal,b,,BIG,Big,{today},{today},,,',
+            f'goal,m,b,MTG,Mid,{today},{today},,,',
+            f'goal,d,m,DP,Daily,{today},{today},,,',
+            f'process_progress,,,,,,,d,{today},yes',
+        ]).encode()
+        response = self.upload(content, 'history.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProcessProgress.objects.filter(
+            daily_progress__user=self.user, is_completed=True
+        ).count(), 1)
+        self.assertDerivedDataMatchesSource()
+
+        header = 'type,id,parent_id,goal_type,title,start_date,target_date'
+        for row in (f'goal,x,missing,MTG,Orphan,{today},{today}',
+                    f'goal,x,,BIG,Orphan,{today},{today - timedelta(days=1)}'):
+            response = self.upload(f'{header}\n{row}'.encode(), 'broken.csv')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual([error['line'] for error in response.data['errors']], [2])
+        self.assertFalse(Goal.objects.filter(user=self.user, title='Orphan').exists())
+
+class AccountDeletionTests(TestCase):
+    # Rows left to the ORM once the chunked deletes are done: one per user
+    ORM_TABLES = {
+        'user_game_profiles', 'token_blacklist_outstandingtoken', 'django_admin_log',
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user('leaving', 'leaving@example.com', 'pw')
+        process, standard = create_history(self.user)
+        service = GamificationService(self.user)
+        service.award_batch([service.process_award(process), service.standard_award(standard)])
+        GamificationOutbox.record(self.user.id, service.process_award(process), timezone.now().date())
+        LeaderboardSnapshot.objects.create(
+            user=self.user, period='week',
+            period_start=period_start('week', timezone.now().date()) - timedelta(days=7),
+            points=10, rank=1, position=1
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tables_with_rows(self):
+        tables = set()
+        for model in apps.get_models():
+            for field in model._meta.fields:
+                if field.related_model is User and model._base_manager.filter(
+                    **{field.name: self.user.id}
+                ).exists():
+                    tables.add(model._meta.db_table)
+        return tables
+
+    def test_request_deactivates_and_queues_the_purge(self):
+        with mock.patch('users.tasks.delete_account.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete('/api/users/account/')
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once_with(str(self.user.id))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(self.user.pending_deletion)
+
+    def test_chunked_deletes_leave_only_small_rows_to_the_orm(self):
+        for table, condition, pk in AccountDeletionService.TABLES:
+            delete_in_chunks(table, condition, [self.user.id], pk=pk, chunk_size=2)
+        self.assertLessEqual(self.tables_with_rows(), self.ORM_TABLES)
+
+    @override_settings(LEADERBOARD_STORE='memory')
+    def test_purge_removes_the_account(self):
+        week = window_leaderboard('week', period_start('week', timezone.now().date()))
+        for board in (leaderboard, week):
+            board.rebuild()
+            self.assertIsNotNone(board.rank(self.user.id))
+        AccountDeletionService.request(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            AccountDeletionService.purge(self.user.id)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(self.tables_with_rows(), set())
+        self.assertIsNone(leaderboard.rank(self.user.id))
+        self.assertIsNone(week.rank(self.user.id))
@@ -8,4 +8,7 @@ urlpatterns = [
     path('profile/', views.UserProfileView.as_view(), name='profile'),
     path('profile/update/', views.UserProfileUpdateView.as_view(), name='profile-update'),
     path('settings/', views.UserSettingsView.as_view(), name='settings'),
+    path('export/', views.UserExportView.as_view(), name='export'),
+    path('import/', views.UserImportView.as_view(), name='import'),
+    path('account/', views.UserAccountDeleteView.as_view(), name='account-delete'),
 ]
@@ -1,7 +1,14 @@
 from rest_framework import generics, permissions, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+import io
+from .history import HistoryExporter, HistoryImporter, HistoryImportError
 from .serializers import UserSerializer, UserProfileSerializer
+from .services import AccountDeletionService
 
 User = get_user_model()
 
@@ -30,3 +37,50 @@ class UserSettingsView(generics.RetrieveUpdateAPIView):
 
     def get_object(self):
         return self.request.user
+
+class UserExportView(APIView):
+    """Streams the user's full history as NDJSON"""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            HistoryExporter(request.user).stream(),
+            content_type='application/x-ndjson'
+        )
+        filename = f'goals-export-{timezone.now().date().isoformat()}.ndjson'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class UserImportView(APIView):
+    """Imports goals, standards and dated completions from an uploaded
+    NDJSON or CSV `file`"""
+    permission_classes = (permissions.IsAuthenticated,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.data.get('format') or ('csv' if upload.name.endswith('.csv') else 'ndjson')
+        if format not in HistoryImporter.FORMATS:
+            return Response(
+                {'error': f'format must be one of: {", ".join(HistoryImporter.FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            counts = HistoryImporter(request.user).run(lines, format)
+        except HistoryImportError as e:
+            return Response({'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({'error': 'The file must be UTF-8 encoded.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': counts})
+
+class UserAccountDeleteView(APIView):
+    """Deactivates the account immediately and deletes its data in the background"""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def delete(self, request):
+        AccountDeletionService.request(request.user)
+        return Response(status=status.HTTP_202_ACCEPTED)